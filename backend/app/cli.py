@@ -0,0 +1,79 @@
+"""Maintenance commands. Run from backend/: ``python -m app.cli <command>``."""
+
+import argparse
+
+from dotenv import load_dotenv
+
+
+def _rescore(args: argparse.Namespace) -> None:
+    from .database import SessionLocal
+    from .services import hotel_export, versions
+    from .services.rankings import invalidate_rankings
+    from .services.rollups import rebuild_rollups
+    from .services.scoring import rescore_snapshots
+
+    db = SessionLocal()
+    try:
+        count = rescore_snapshots(db, chunk_size=args.chunk_size)
+        rollups = rebuild_rollups(db)
+        versions.bump(db)
+        db.commit()
+        invalidate_rankings(db)
+        hotel_export.clear()
+    finally:
+        db.close()
+    print(f"Rescored {count} snapshots, rebuilt {rollups} daily rollups")
+
+
+def _backfill_rollups(args: argparse.Namespace) -> None:
+    from .database import SessionLocal
+    from .services.rollups import rebuild_rollups
+
+    db = SessionLocal()
+    try:
+        count = rebuild_rollups(db, hotels_per_batch=args.hotels_per_batch)
+    finally:
+        db.close()
+    print(f"Rebuilt {count} daily rollups")
+
+
+def _detect_anomalies(args: argparse.Namespace) -> None:
+    from .database import SessionLocal
+    from .services.anomalies import detect_anomalies
+
+    db = SessionLocal()
+    try:
+        count = detect_anomalies(db)
+    finally:
+        db.close()
+    print(f"Stored {count} alerts")
+
+
+def main(argv: list[str] | None = None) -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rescore = commands.add_parser(
+        "rescore", help="Recompute normalized scores and weighted averages"
+    )
+    rescore.add_argument("--chunk-size", type=int, default=5000)
+    rescore.set_defaults(func=_rescore)
+
+    backfill = commands.add_parser(
+        "backfill-rollups", help="Rebuild snapshot_daily_rollups from raw snapshots"
+    )
+    backfill.add_argument("--hotels-per-batch", type=int, default=100)
+    backfill.set_defaults(func=_backfill_rollups)
+
+    detect = commands.add_parser(
+        "detect-anomalies", help="Scan recent history and refresh the alerts table"
+    )
+    detect.set_defaults(func=_detect_anomalies)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,20 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
 
 from .database import Base, engine
-from .routers import admin, auth, export, groups, hotels, reviews
+from .routers import (
+    admin,
+    alerts,
+    auth,
+    export,
+    groups,
+    hotels,
+    leaderboard,
+    reviews,
+    snapshots,
+)
 
 load_dotenv()
 
@@ -22,17 +33,117 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create tables + migrate missing columns
-Base.metadata.create_all(bind=engine)
 
-with engine.connect() as conn:
-    inspector = inspect(engine)
-    user_columns = {c["name"] for c in inspector.get_columns("users")}
-    if "is_admin" not in user_columns:
-        conn.execute(
-            text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN NOT NULL DEFAULT FALSE")
-        )
-        conn.commit()
+def _missing_cascades(conn) -> list[tuple]:
+    """(table, inspected FK) for foreign keys the models declare ON DELETE
+    CASCADE but the database was created without, or that point at a table
+    that no longer exists (left by an earlier SQLite rebuild)."""
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        cascading = {
+            fk.parent.name for fk in table.foreign_keys if fk.ondelete == "CASCADE"
+        }
+        for fk in inspector.get_foreign_keys(table.name) if cascading else ():
+            ondelete = (fk.get("options") or {}).get("ondelete") or ""
+            if fk["constrained_columns"][0] in cascading and (
+                ondelete.upper() != "CASCADE" or fk["referred_table"] not in existing
+            ):
+                missing.append((table, fk))
+    return missing
+
+
+def _rebuild_sqlite_table(conn, table) -> None:
+    """SQLite can't alter constraints, so copy the rows into a fresh table.
+
+    Follows SQLite's documented order (build ``_new_<name>``, copy, drop the
+    original, rename): renaming the live table instead would make SQLite
+    repoint other tables' foreign keys at the copy that gets dropped.
+    """
+    new = f"_new_{table.name}"
+    columns = [c["name"] for c in inspect(conn).get_columns(table.name)]
+    create = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+    conn.execute(text(create.replace(table.name, new, 1)))
+    names = ", ".join(f'"{c}"' for c in columns if c in table.c)
+    conn.execute(
+        text(f'INSERT INTO "{new}" ({names}) SELECT {names} FROM "{table.name}"')
+    )
+    conn.execute(text(f'DROP TABLE "{table.name}"'))
+    conn.execute(text(f'ALTER TABLE "{new}" RENAME TO "{table.name}"'))
+    for index in table.indexes:
+        index.create(conn)
+
+
+def init_db(bind) -> None:
+    """Create tables and migrate databases made by older versions."""
+    Base.metadata.create_all(bind=bind)
+
+    with bind.connect() as conn:
+        inspector = inspect(conn)
+        user_columns = {c["name"] for c in inspector.get_columns("users")}
+        if "is_admin" not in user_columns:
+            conn.execute(
+                text(
+                    "ALTER TABLE users ADD COLUMN is_admin BOOLEAN NOT NULL DEFAULT FALSE"
+                )
+            )
+            conn.commit()
+        snapshot_columns = {
+            c["name"] for c in inspector.get_columns("review_snapshots")
+        }
+        if "confirmed_at" not in snapshot_columns:
+            conn.execute(
+                text("ALTER TABLE review_snapshots ADD COLUMN confirmed_at TIMESTAMP")
+            )
+            conn.commit()
+        if "inserted_at" not in snapshot_columns:
+            conn.execute(
+                text("ALTER TABLE review_snapshots ADD COLUMN inserted_at TIMESTAMP")
+            )
+            conn.commit()
+        group_columns = {c["name"] for c in inspector.get_columns("hotel_groups")}
+        if "membership_version" not in group_columns:
+            conn.execute(
+                text(
+                    "ALTER TABLE hotel_groups "
+                    "ADD COLUMN membership_version INTEGER NOT NULL DEFAULT 0"
+                )
+            )
+            conn.commit()
+        snapshot_indexes = {
+            i["name"] for i in inspector.get_indexes("review_snapshots")
+        }
+        if "ix_review_snapshots_hotel_collected" not in snapshot_indexes:
+            conn.execute(
+                text(
+                    "CREATE INDEX ix_review_snapshots_hotel_collected ON review_snapshots "
+                    "(hotel_id, collected_at DESC, id DESC)"
+                )
+            )
+            conn.commit()
+        missing_cascades = _missing_cascades(conn)
+        if missing_cascades and bind.dialect.name == "sqlite":
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            for table in {table for table, _ in missing_cascades}:
+                _rebuild_sqlite_table(conn, table)
+            conn.commit()
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+        elif missing_cascades:
+            for table, fk in missing_cascades:
+                conn.execute(
+                    text(
+                        f'ALTER TABLE {table.name} DROP CONSTRAINT "{fk["name"]}", '
+                        f'ADD CONSTRAINT "{fk["name"]}" '
+                        f"FOREIGN KEY ({fk['constrained_columns'][0]}) "
+                        f"REFERENCES {fk['referred_table']} "
+                        f"({fk['referred_columns'][0]}) ON DELETE CASCADE"
+                    )
+                )
+            conn.commit()
+
+
+init_db(engine)
 
 # Routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
@@ -41,6 +152,9 @@ app.include_router(groups.router, prefix="/api/groups", tags=["groups"])
 app.include_router(reviews.router, prefix="/api/reviews", tags=["reviews"])
 app.include_router(export.router, prefix="/api/export", tags=["export"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+app.include_router(alerts.router, prefix="/api/alerts", tags=["alerts"])
+app.include_router(leaderboard.router, prefix="/api/leaderboard", tags=["leaderboard"])
+app.include_router(snapshots.router, prefix="/api/snapshots", tags=["snapshots"])
 
 
 @app.get("/api/health")
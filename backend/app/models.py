@@ -1,13 +1,17 @@
 from datetime import datetime, timezone
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
+    Date,
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
+    Text,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
@@ -42,22 +46,47 @@ class Hotel(Base):
     expedia_name = Column(String)
     tripadvisor_name = Column(String)
 
+    # Full, unbounded history. Reads should go through
+    # services.snapshots.latest_snapshots / history_page instead.
+    # Child rows go with the hotel through ON DELETE CASCADE; passive_deletes
+    # keeps the ORM from loading them just to delete them itself.
     snapshots = relationship(
         "ReviewSnapshot",
         back_populates="hotel",
         order_by="ReviewSnapshot.collected_at.desc()",
         cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    daily_rollups = relationship(
+        "SnapshotDailyRollup",
+        back_populates="hotel",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    rankings = relationship(
+        "HotelRanking", cascade="all, delete-orphan", passive_deletes=True
+    )
+    alerts = relationship("Alert", cascade="all, delete-orphan", passive_deletes=True)
+    group_memberships = relationship(
+        "HotelGroupMembership", back_populates="hotel", passive_deletes=True
     )
-    group_memberships = relationship("HotelGroupMembership", back_populates="hotel")
 
 
 class ReviewSnapshot(Base):
     __tablename__ = "review_snapshots"
 
     id = Column(Integer, primary_key=True, index=True)
-    hotel_id = Column(Integer, ForeignKey("hotels.id"), nullable=False)
+    hotel_id = Column(
+        Integer, ForeignKey("hotels.id", ondelete="CASCADE"), nullable=False
+    )
     collected_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     source = Column(String, nullable=False)  # "csv_import" | "live"
+    # Last time a collection returned exactly these values again. Repeats
+    # bump this instead of inserting a duplicate row.
+    confirmed_at = Column(DateTime, nullable=True)
+    # When the row was written (collected_at can be backdated); the change
+    # feed holds back rows younger than CHANGES_LAG. NULL for older rows.
+    inserted_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     google_score = Column(Float, nullable=True)
     google_count = Column(Integer, nullable=True)
@@ -76,6 +105,127 @@ class ReviewSnapshot(Base):
 
     hotel = relationship("Hotel", back_populates="snapshots")
 
+    # Serves latest-per-hotel lookups and newest-first history pages.
+    __table_args__ = (
+        Index(
+            "ix_review_snapshots_hotel_collected",
+            "hotel_id",
+            collected_at.desc(),
+            id.desc(),
+        ),
+    )
+
+
+class SnapshotDailyRollup(Base):
+    """Per-hotel, per-day aggregate of snapshot scores.
+
+    Kept current by ``services.rollups`` as snapshots are inserted, so trend
+    queries read one row per hotel per day however often we collect. Days are
+    UTC calendar days of ``collected_at``; channel columns hold normalized
+    (0-10) scores.
+    """
+
+    __tablename__ = "snapshot_daily_rollups"
+
+    hotel_id = Column(
+        Integer, ForeignKey("hotels.id", ondelete="CASCADE"), primary_key=True
+    )
+    day = Column(Date, primary_key=True)
+    snapshot_count = Column(Integer, nullable=False, default=0)
+    last_snapshot_id = Column(Integer, nullable=True)
+    last_collected_at = Column(DateTime, nullable=True)
+
+    google_last = Column(Float, nullable=True)
+    google_min = Column(Float, nullable=True)
+    google_max = Column(Float, nullable=True)
+    booking_last = Column(Float, nullable=True)
+    booking_min = Column(Float, nullable=True)
+    booking_max = Column(Float, nullable=True)
+    expedia_last = Column(Float, nullable=True)
+    expedia_min = Column(Float, nullable=True)
+    expedia_max = Column(Float, nullable=True)
+    tripadvisor_last = Column(Float, nullable=True)
+    tripadvisor_min = Column(Float, nullable=True)
+    tripadvisor_max = Column(Float, nullable=True)
+    weighted_average_last = Column(Float, nullable=True)
+    weighted_average_min = Column(Float, nullable=True)
+    weighted_average_max = Column(Float, nullable=True)
+
+    hotel = relationship("Hotel", back_populates="daily_rollups")
+
+
+class DataVersion(Base):
+    """A named counter bumped by writes the newest snapshot id doesn't
+    reveal (hotels created, edited or deleted, scores recomputed). Cache
+    versions include it, so no two states of the data share a version."""
+
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class RankingsBuild(Base):
+    """The data version ``hotel_rankings`` was last built at: a single row,
+    kept apart from the rankings so an empty build still counts as current."""
+
+    __tablename__ = "rankings_builds"
+
+    id = Column(Integer, primary_key=True)
+    data_version = Column(String, nullable=False)
+
+
+class HotelRanking(Base):
+    """A hotel's precomputed rank for one metric within one scope.
+
+    Scope is "all", "state" or "brand"; ``scope_value`` is the state or brand
+    ("" for "all"). Rebuilt in bulk by ``services.rankings`` when the data
+    version (newest snapshot id and hotels counter) moves on past the one in
+    ``RankingsBuild``, so reads never sort the portfolio.
+    """
+
+    __tablename__ = "hotel_rankings"
+
+    metric = Column(String, primary_key=True)  # "weighted_average" | "<ch>_normalized"
+    scope = Column(String, primary_key=True)
+    scope_value = Column(String, primary_key=True)
+    hotel_id = Column(
+        Integer, ForeignKey("hotels.id", ondelete="CASCADE"), primary_key=True
+    )
+    value = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=False)  # 1 = best, ties share a rank
+    position = Column(Integer, nullable=False)  # 1..total, ties broken by name
+    percentile = Column(Float, nullable=False)  # share of the scope ranked below
+    total = Column(Integer, nullable=False)
+    data_version = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_hotel_rankings_position", "metric", "scope", "scope_value", "position"
+        ),
+    )
+
+
+class Alert(Base):
+    """A score anomaly found by the last ``services.anomalies`` run.
+
+    Each run replaces the previous run's alerts, so the table always holds
+    the current set.
+    """
+
+    __tablename__ = "alerts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    hotel_id = Column(
+        Integer, ForeignKey("hotels.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    kind = Column(String, nullable=False)  # "drop" | "zscore" | "divergence"
+    metric = Column(String, nullable=False)  # channel name or "weighted_average"
+    value = Column(Float, nullable=False)  # the latest value that tripped it
+    baseline = Column(Float, nullable=False)  # what it was compared against
+    score = Column(Float, nullable=False)  # delta or z-score
+    detected_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 
 class HotelGroup(Base):
     __tablename__ = "hotel_groups"
@@ -84,20 +234,86 @@ class HotelGroup(Base):
     name = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Bumped whenever members are added or removed; part of the group
+    # summary cache key.
+    membership_version = Column(Integer, nullable=False, default=0)
 
     owner = relationship("User", back_populates="groups")
     memberships = relationship(
-        "HotelGroupMembership", back_populates="group", cascade="all, delete-orphan"
+        "HotelGroupMembership",
+        back_populates="group",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
 
 class HotelGroupMembership(Base):
     __tablename__ = "hotel_group_memberships"
 
-    group_id = Column(Integer, ForeignKey("hotel_groups.id"), primary_key=True)
-    hotel_id = Column(Integer, ForeignKey("hotels.id"), primary_key=True)
+    group_id = Column(
+        Integer, ForeignKey("hotel_groups.id", ondelete="CASCADE"), primary_key=True
+    )
+    hotel_id = Column(
+        Integer, ForeignKey("hotels.id", ondelete="CASCADE"), primary_key=True
+    )
 
     group = relationship("HotelGroup", back_populates="memberships")
     hotel = relationship("Hotel", back_populates="group_memberships")
 
     __table_args__ = (UniqueConstraint("group_id", "hotel_id"),)
+
+
+class IdempotencyKey(Base):
+    """Stored outcome of a request made with an Idempotency-Key header."""
+
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    scope = Column(String, nullable=False)  # e.g. "collect-hotel:12"
+    fingerprint = Column(String, nullable=True)  # hash of the request body
+    status_code = Column(Integer, nullable=True)  # None while still running
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (UniqueConstraint("user_id", "key"),)
+
+
+class StrategyScore(Base):
+    """Cached aggregate score for one snapshot under one scoring strategy."""
+
+    __tablename__ = "strategy_scores"
+
+    strategy = Column(String, primary_key=True)
+    snapshot_id = Column(
+        Integer,
+        ForeignKey("review_snapshots.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    score = Column(Float, nullable=True)
+
+
+class ExportJob(Base):
+    """A large export generated in a worker process by ``services.export_jobs``.
+
+    The finished file lives under ``EXPORT_JOBS_DIR``; the row tracks its
+    parameters and progress so clients can poll and then download it.
+    """
+
+    __tablename__ = "export_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # "hotels" | "history"
+    group_id = Column(Integer, nullable=True)  # None = every hotel
+    format = Column(String, nullable=False)  # a history_export.FORMATS key
+    strategy = Column(String, nullable=True)  # hotels only
+    start = Column(DateTime, nullable=True)  # history only
+    end = Column(DateTime, nullable=True)
+    status = Column(String, nullable=False, default="queued")
+    # "queued" | "running" | "done" | "failed"
+    error = Column(Text, nullable=True)
+    size = Column(BigInteger, nullable=True)  # bytes, once done
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime, nullable=True)
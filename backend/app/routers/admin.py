@@ -1,12 +1,30 @@
 import os
+from dataclasses import asdict
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from ..auth import get_current_user
 from ..database import get_db
-from ..models import Hotel, HotelGroupMembership, ReviewSnapshot, User
+from ..models import (
+    Alert,
+    Hotel,
+    HotelGroupMembership,
+    HotelRanking,
+    ReviewSnapshot,
+    SnapshotDailyRollup,
+    User,
+)
+from ..services import hotel_export, versions
+from ..services.anomalies import detect_anomalies
+from ..services.collectors import all_collectors
+from ..services.collectors.registry import update_settings
 from ..services.csv_import import import_csv
+from ..services.rankings import invalidate_rankings
+from ..services.rollups import rebuild_rollups
+from ..services.scoring import rescore_snapshots
 
 router = APIRouter()
 
@@ -15,13 +33,25 @@ CLEAN_CSV_PATH = os.path.join(
 )
 
 
-@router.post("/reset")
-def admin_reset(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+def _require_admin(user: User) -> None:
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
+
+
+@router.post("/reset")
+def admin_reset(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    _require_admin(user)
     db.query(HotelGroupMembership).delete()
+    db.query(Alert).delete()
+    db.query(HotelRanking).delete()
+    db.query(SnapshotDailyRollup).delete()
     db.query(ReviewSnapshot).delete()
     deleted_hotels = db.query(Hotel).delete()
+    versions.bump(db)
     db.commit()
 
     imported = 0
@@ -29,5 +59,71 @@ def admin_reset(db: Session = Depends(get_db), user: User = Depends(get_current_
         with open(CLEAN_CSV_PATH, "r") as f:
             content = f.read()
         imported = import_csv(content, db)
+    background_tasks.add_task(hotel_export.refresh, db.get_bind())
 
     return {"deleted_hotels": deleted_hotels, "imported": imported}
+
+
+@router.post("/rescore")
+def admin_rescore(
+    chunk_size: int = Query(5000, ge=100, le=50000),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Recompute derived score columns for all snapshots in batches."""
+    _require_admin(user)
+    rescored = rescore_snapshots(db, chunk_size=chunk_size)
+    versions.bump(db)
+    db.commit()
+    invalidate_rankings(db)
+    hotel_export.clear()
+    return {"rescored": rescored, "rollups": rebuild_rollups(db)}
+
+
+@router.post("/detect-anomalies")
+def admin_detect_anomalies(
+    drop_threshold: Optional[float] = Query(None, gt=0),
+    zscore_threshold: Optional[float] = Query(None, gt=0),
+    divergence_threshold: Optional[float] = Query(None, gt=0),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Re-run the anomaly detectors and replace the stored alerts. Thresholds
+    left out keep their defaults from ``services.anomalies``."""
+    _require_admin(user)
+    thresholds = {
+        "drop_threshold": drop_threshold,
+        "zscore_threshold": zscore_threshold,
+        "divergence_threshold": divergence_threshold,
+    }
+    found = detect_anomalies(
+        db, **{k: v for k, v in thresholds.items() if v is not None}
+    )
+    return {"alerts": found}
+
+
+class CollectorSettingsUpdate(BaseModel):
+    timeout_secs: Optional[float] = Field(None, gt=0)
+    max_concurrency: Optional[int] = Field(None, ge=1)
+    enabled: Optional[bool] = None
+
+
+@router.get("/collectors")
+def list_collectors(user: User = Depends(get_current_user)):
+    _require_admin(user)
+    return [{"channel": c.channel, **asdict(c.settings)} for c in all_collectors()]
+
+
+@router.patch("/collectors/{channel}")
+def update_collector(
+    channel: str,
+    req: CollectorSettingsUpdate,
+    user: User = Depends(get_current_user),
+):
+    """Tune or disable a channel at runtime. Applies to this process only;
+    set COLLECTOR_<CHANNEL>_* env vars to make it stick across restarts."""
+    _require_admin(user)
+    if channel not in {c.channel for c in all_collectors()}:
+        raise HTTPException(status_code=404, detail="Unknown channel")
+    settings = update_settings(channel, **req.model_dump(exclude_none=True))
+    return {"channel": channel, **asdict(settings)}
@@ -0,0 +1,47 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..auth import get_current_user
+from ..database import get_db
+from ..models import Alert, Hotel, User
+
+router = APIRouter()
+
+
+@router.get("")
+def list_alerts(
+    kind: Optional[Literal["drop", "zscore", "divergence"]] = Query(None),
+    hotel_id: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Alerts from the last detection run by kind, largest moves (either
+    direction) first."""
+    query = db.query(Alert, Hotel.name).join(Hotel, Hotel.id == Alert.hotel_id)
+    if kind:
+        query = query.filter(Alert.kind == kind)
+    if hotel_id is not None:
+        query = query.filter(Alert.hotel_id == hotel_id)
+    rows = (
+        query.order_by(Alert.kind, func.abs(Alert.score).desc(), Alert.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "id": alert.id,
+            "hotel_id": alert.hotel_id,
+            "hotel_name": name,
+            "kind": alert.kind,
+            "metric": alert.metric,
+            "value": alert.value,
+            "baseline": alert.baseline,
+            "score": alert.score,
+            "detected_at": alert.detected_at.isoformat(),
+        }
+        for alert, name in rows
+    ]
@@ -1,93 +1,79 @@
-import csv
-import io
+import os
+from datetime import datetime
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from sqlalchemy.orm import Session
 
 from ..auth import get_current_user
 from ..database import get_db
-from ..models import Hotel, HotelGroup, User
+from ..models import ExportJob, HotelGroup, User
+from ..services import export_jobs
+from ..services.history_export import FORMATS, export_history, history_query
+from ..services.hotel_export import (
+    CachedExport,
+    csv_chunks,
+    data_version,
+    scope_criteria,
+)
+from ..services.rollups import naive_utc
+from ..services.strategies import Strategy, get_strategy
 
 router = APIRouter()
 
-CSV_HEADERS = [
-    "Name",
-    "City",
-    "State",
-    "Keys",
-    "Kind",
-    "Brand",
-    "Parent",
-    "Google Score",
-    "Google Count",
-    "Google Normalized",
-    "Booking Score",
-    "Booking Count",
-    "Booking Normalized",
-    "Expedia Score",
-    "Expedia Count",
-    "Expedia Normalized",
-    "TripAdvisor Score",
-    "TripAdvisor Count",
-    "TripAdvisor Normalized",
-    "Weighted Average",
-]
-
-
-def _hotel_to_row(hotel):
-    latest = hotel.snapshots[0] if hotel.snapshots else None
-    return [
-        hotel.name,
-        hotel.city,
-        hotel.state,
-        hotel.keys,
-        hotel.kind,
-        hotel.brand,
-        hotel.parent,
-        latest.google_score if latest else "",
-        latest.google_count if latest else "",
-        latest.google_normalized if latest else "",
-        latest.booking_score if latest else "",
-        latest.booking_count if latest else "",
-        latest.booking_normalized if latest else "",
-        latest.expedia_score if latest else "",
-        latest.expedia_count if latest else "",
-        latest.expedia_normalized if latest else "",
-        latest.tripadvisor_score if latest else "",
-        latest.tripadvisor_count if latest else "",
-        latest.tripadvisor_normalized if latest else "",
-        latest.weighted_average if latest else "",
-    ]
-
-
-def _make_csv(hotels):
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(CSV_HEADERS)
-    for hotel in hotels:
-        writer.writerow(_hotel_to_row(hotel))
-    output.seek(0)
-    return output
 
+def _cached_csv_response(
+    request: Request,
+    db: Session,
+    group: Optional[HotelGroup],
+    scoring: Optional[Strategy],
+    filename: str,
+) -> Response:
+    """Serve the export from the disk cache, generating it on a miss.
 
-@router.get("/hotels")
-def export_hotels(
-    db: Session = Depends(get_db), user: User = Depends(get_current_user)
-):
-    hotels = db.query(Hotel).order_by(Hotel.name).all()
-    output = _make_csv(hotels)
+    Hits are plain file responses with ``Content-Length``, or a bodyless 304
+    when ``If-None-Match`` already names the artifact's ETag. A miss streams the CSV as it is
+    generated and writes it through to the cache for the next request.
+    """
+    group_id = group.id if group else None
+    artifact = CachedExport(group_id, scoring, data_version(db, group))
+    headers = {"ETag": artifact.etag, "Cache-Control": "private, no-cache"}
+    if artifact.exists():
+        if artifact.etag in request.headers.get("if-none-match", "").split(", "):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(
+            artifact.path, media_type="text/csv", filename=filename, headers=headers
+        )
+    chunks = csv_chunks(db, scope_criteria(group_id), scoring)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        artifact.write_through(chunks),
         media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=hotels_export.csv"},
+        headers={**headers, "Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
+@router.get("/hotels")
+def export_hotels(
+    request: Request,
+    strategy: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    scoring = get_strategy(strategy)
+    return _cached_csv_response(request, db, None, scoring, "hotels_export.csv")
+
+
 @router.get("/groups/{group_id}")
 def export_group(
-    group_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    request: Request,
+    group_id: int,
+    strategy: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
 ):
+    scoring = get_strategy(strategy)
     group = (
         db.query(HotelGroup)
         .filter(HotelGroup.id == group_id, HotelGroup.user_id == user.id)
@@ -95,12 +81,170 @@ def export_group(
     )
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
-    hotels = [m.hotel for m in group.memberships]
-    output = _make_csv(hotels)
+    return _cached_csv_response(
+        request, db, group, scoring, f"group_{group_id}_export.csv"
+    )
+
+
+HistoryFormat = Literal["csv", "csv.gz", "ndjson", "parquet", "arrow"]
+
+
+def _history_response(db, format, query, name) -> StreamingResponse:
+    media_type, ext = FORMATS[format]
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename=group_{group_id}_export.csv"
-        },
+        export_history(db, format, query),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={name}.{ext}"},
+    )
+
+
+@router.get("/history")
+def export_history_all(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    format: HistoryFormat = Query("csv"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Every snapshot in [from, to), ordered by hotel then time."""
+    query = history_query(start, end)
+    return _history_response(db, format, query, "history_export")
+
+
+@router.get("/groups/{group_id}/history")
+def export_group_history(
+    group_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    format: HistoryFormat = Query("csv"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    group = (
+        db.query(HotelGroup)
+        .filter(HotelGroup.id == group_id, HotelGroup.user_id == user.id)
+        .first()
+    )
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    query = history_query(start, end, tuple(scope_criteria(group_id)))
+    return _history_response(db, format, query, f"group_{group_id}_history")
+
+
+class ExportJobCreate(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    kind: Literal["hotels", "history"] = "history"
+    group_id: Optional[int] = None
+    format: HistoryFormat = "csv"
+    strategy: Optional[str] = None  # hotels only
+    start: Optional[datetime] = Field(None, alias="from")  # history only
+    end: Optional[datetime] = Field(None, alias="to")
+
+    @field_validator("start", "end")
+    @classmethod
+    def _utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Stored naive, so resolve any UTC offset before it is dropped.
+        return naive_utc(value) if value is not None else None
+
+
+class ExportJobOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    kind: str
+    group_id: Optional[int]
+    format: str
+    status: str
+    error: Optional[str]
+    size: Optional[int]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+
+def _get_job(db: Session, user: User, job_id: int) -> ExportJob:
+    job = (
+        db.query(ExportJob)
+        .filter(ExportJob.id == job_id, ExportJob.user_id == user.id)
+        .first()
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+
+@router.post("/jobs", response_model=ExportJobOut, status_code=202)
+def create_export_job(
+    body: ExportJobCreate,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Queue an export to be generated in a worker process; poll the job,
+    then fetch ``/jobs/{id}/download``."""
+    if body.kind == "hotels":
+        get_strategy(body.strategy)
+        if body.format != "csv":
+            raise HTTPException(
+                status_code=400, detail="Hotel exports are only available as csv"
+            )
+    elif body.strategy is not None:
+        raise HTTPException(
+            status_code=400, detail="strategy only applies to hotel exports"
+        )
+    if body.group_id is not None:
+        group = (
+            db.query(HotelGroup)
+            .filter(HotelGroup.id == body.group_id, HotelGroup.user_id == user.id)
+            .first()
+        )
+        if not group:
+            raise HTTPException(status_code=404, detail="Group not found")
+
+    export_jobs.expire_jobs(db)
+    job = ExportJob(user_id=user.id, **body.model_dump())
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    export_jobs.submit(job.id)
+    return job
+
+
+@router.get("/jobs", response_model=list[ExportJobOut])
+def list_export_jobs(
+    db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    return (
+        db.query(ExportJob)
+        .filter(ExportJob.user_id == user.id)
+        .order_by(ExportJob.id.desc())
+        .all()
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=ExportJobOut)
+def get_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    return _get_job(db, user, job_id)
+
+
+@router.get("/jobs/{job_id}/download")
+def download_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """The finished file; supports ``Range`` requests for resumable downloads."""
+    job = _get_job(db, user, job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    path = export_jobs.job_path(job)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=410, detail="Export file has expired")
+    return FileResponse(
+        path,
+        media_type=export_jobs.media_type(job),
+        filename=f"export_{os.path.basename(path)}",
     )
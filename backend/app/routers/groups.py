@@ -1,12 +1,19 @@
-from typing import Optional
+from datetime import datetime
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import delete, func, insert, literal, select
 from sqlalchemy.orm import Session
 
 from ..auth import get_current_user
 from ..database import get_db
-from ..models import HotelGroup, HotelGroupMembership, User
+from ..models import Hotel, HotelGroup, HotelGroupMembership, User
+from ..services.diff import diff_response
+from ..services.group_scores import group_summary
+from ..services.snapshots import hotels_with_latest
+from ..services.strategies import get_strategy, strategy_scores
+from ..services.timeseries import Bucket, series_list
 
 router = APIRouter()
 
@@ -21,6 +28,11 @@ class GroupUpdate(BaseModel):
     hotel_ids: Optional[list[int]] = None
 
 
+class MembersPatch(BaseModel):
+    add: list[int] = []
+    remove: list[int] = []
+
+
 class GroupOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -29,40 +41,118 @@ class GroupOut(BaseModel):
     hotel_count: int
 
 
+class MembersPatchOut(GroupOut):
+    added: int
+    removed: int
+
+
 class GroupDetail(BaseModel):
     id: int
     name: str
     hotels: list[dict]
 
 
+def _members(group_id: int):
+    return select(HotelGroupMembership.hotel_id).where(
+        HotelGroupMembership.group_id == group_id
+    )
+
+
+def _hotel_count(db: Session, group_id: int) -> int:
+    return db.scalar(
+        select(func.count())
+        .select_from(HotelGroupMembership)
+        .where(HotelGroupMembership.group_id == group_id)
+    )
+
+
+def _check_hotels_exist(db: Session, hotel_ids: set[int]) -> None:
+    """400 listing any ids that aren't hotels, found with one IN query."""
+    if not hotel_ids:
+        return
+    found = set(db.scalars(select(Hotel.id).where(Hotel.id.in_(hotel_ids))))
+    missing = sorted(hotel_ids - found)
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown hotel ids: {', '.join(map(str, missing))}",
+        )
+
+
+def _change_members(
+    db: Session, group: HotelGroup, add: set[int], remove: set[int]
+) -> tuple[int, int]:
+    """Apply a membership delta with one INSERT and one DELETE, bumping the
+    group's membership_version if anything changed. Returns (added, removed).
+
+    ``add`` must already be validated; ids already in the group are skipped.
+    """
+    added = removed = 0
+    if add:
+        new = select(literal(group.id), Hotel.id).where(
+            Hotel.id.in_(add), Hotel.id.not_in(_members(group.id))
+        )
+        added = db.execute(
+            insert(HotelGroupMembership).from_select(["group_id", "hotel_id"], new)
+        ).rowcount
+    if remove:
+        removed = db.execute(
+            delete(HotelGroupMembership).where(
+                HotelGroupMembership.group_id == group.id,
+                HotelGroupMembership.hotel_id.in_(remove),
+            )
+        ).rowcount
+    if added or removed:
+        group.membership_version = HotelGroup.membership_version + 1
+    return added, removed
+
+
 @router.post("", response_model=GroupOut)
 def create_group(
     req: GroupCreate,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
+    hotel_ids = set(req.hotel_ids)
+    _check_hotels_exist(db, hotel_ids)
     group = HotelGroup(name=req.name, user_id=user.id)
     db.add(group)
     db.flush()
-    for hid in req.hotel_ids:
-        db.add(HotelGroupMembership(group_id=group.id, hotel_id=hid))
+    if hotel_ids:
+        db.execute(
+            insert(HotelGroupMembership),
+            [{"group_id": group.id, "hotel_id": hid} for hid in hotel_ids],
+        )
     db.commit()
-    db.refresh(group)
-    return GroupOut(id=group.id, name=group.name, hotel_count=len(group.memberships))
+    return GroupOut(
+        id=group.id, name=group.name, hotel_count=_hotel_count(db, group.id)
+    )
 
 
 @router.get("", response_model=list[GroupOut])
 def list_groups(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    groups = db.query(HotelGroup).filter(HotelGroup.user_id == user.id).all()
-    return [
-        GroupOut(id=g.id, name=g.name, hotel_count=len(g.memberships)) for g in groups
-    ]
+    rows = db.execute(
+        select(
+            HotelGroup.id,
+            HotelGroup.name,
+            func.count(HotelGroupMembership.hotel_id).label("hotel_count"),
+        )
+        .outerjoin(HotelGroupMembership, HotelGroupMembership.group_id == HotelGroup.id)
+        .where(HotelGroup.user_id == user.id)
+        .group_by(HotelGroup.id, HotelGroup.name)
+        .order_by(HotelGroup.id)
+    )
+    return [GroupOut.model_validate(row) for row in rows]
 
 
 @router.get("/{group_id}", response_model=GroupDetail)
 def get_group(
-    group_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    group_id: int,
+    strategy: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
 ):
+    scoring = get_strategy(strategy)
     group = (
         db.query(HotelGroup)
         .filter(HotelGroup.id == group_id, HotelGroup.user_id == user.id)
@@ -71,10 +161,18 @@ def get_group(
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
+    rows = db.execute(
+        hotels_with_latest(Hotel.id.in_(_members(group_id))).order_by(
+            Hotel.name, Hotel.id
+        )
+    ).all()
+    scores = (
+        strategy_scores(db, scoring, [snap for _, snap in rows if snap is not None])
+        if scoring
+        else {}
+    )
     hotels = []
-    for m in group.memberships:
-        hotel = m.hotel
-        latest = hotel.snapshots[0] if hotel.snapshots else None
+    for hotel, latest in rows:
         hotels.append(
             {
                 "id": hotel.id,
@@ -90,9 +188,83 @@ def get_group(
                 "weighted_average": latest.weighted_average if latest else None,
             }
         )
+        if scoring:
+            hotels[-1]["strategy_score"] = scores.get(latest.id) if latest else None
     return GroupDetail(id=group.id, name=group.name, hotels=hotels)
 
 
+@router.get("/{group_id}/history")
+def get_group_history(
+    group_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: Optional[Bucket] = Query(None),
+    max_points: Optional[int] = Query(None, ge=3, le=10000),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Every member's series in one response, as for /api/hotels/history."""
+    group = (
+        db.query(HotelGroup)
+        .filter(HotelGroup.id == group_id, HotelGroup.user_id == user.id)
+        .first()
+    )
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    members = (
+        db.query(Hotel)
+        .join(HotelGroupMembership, HotelGroupMembership.hotel_id == Hotel.id)
+        .filter(HotelGroupMembership.group_id == group_id)
+        .order_by(Hotel.name)
+        .all()
+    )
+    return {
+        "bucket": bucket,
+        "series": series_list(db, members, start, end, bucket, max_points),
+    }
+
+
+@router.get("/{group_id}/diff")
+def get_group_diff(
+    group_id: int,
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    format: Literal["json", "csv"] = Query("json"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """/api/hotels/diff restricted to the group's members."""
+    group = (
+        db.query(HotelGroup)
+        .filter(HotelGroup.id == group_id, HotelGroup.user_id == user.id)
+        .first()
+    )
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return diff_response(
+        db, start, end, format, f"group_{group_id}_diff", hotel_ids=_members(group_id)
+    )
+
+
+@router.get("/{group_id}/summary")
+def get_group_summary(
+    group_id: int,
+    bucket: Bucket = Query("week"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Portfolio score, channel coverage, best/worst members and the group's
+    score over time."""
+    group = (
+        db.query(HotelGroup)
+        .filter(HotelGroup.id == group_id, HotelGroup.user_id == user.id)
+        .first()
+    )
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return group_summary(db, group, bucket)
+
+
 @router.put("/{group_id}", response_model=GroupOut)
 def update_group(
     group_id: int,
@@ -110,14 +282,49 @@ def update_group(
     if req.name is not None:
         group.name = req.name
     if req.hotel_ids is not None:
-        db.query(HotelGroupMembership).filter(
-            HotelGroupMembership.group_id == group.id
-        ).delete()
-        for hid in req.hotel_ids:
-            db.add(HotelGroupMembership(group_id=group.id, hotel_id=hid))
+        wanted = set(req.hotel_ids)
+        _check_hotels_exist(db, wanted)
+        current = set(db.scalars(_members(group.id)))
+        _change_members(db, group, wanted - current, current - wanted)
     db.commit()
-    db.refresh(group)
-    return GroupOut(id=group.id, name=group.name, hotel_count=len(group.memberships))
+    return GroupOut(
+        id=group.id, name=group.name, hotel_count=_hotel_count(db, group.id)
+    )
+
+
+@router.patch("/{group_id}/members", response_model=MembersPatchOut)
+def patch_group_members(
+    group_id: int,
+    req: MembersPatch,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Add and/or remove members without resending the whole list. Adding a
+    current member or removing a non-member is a no-op."""
+    group = (
+        db.query(HotelGroup)
+        .filter(HotelGroup.id == group_id, HotelGroup.user_id == user.id)
+        .first()
+    )
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    add, remove = set(req.add), set(req.remove)
+    if add & remove:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Hotel ids in both add and remove: "
+            f"{', '.join(map(str, sorted(add & remove)))}",
+        )
+    _check_hotels_exist(db, add)
+    added, removed = _change_members(db, group, add, remove)
+    db.commit()
+    return MembersPatchOut(
+        id=group.id,
+        name=group.name,
+        hotel_count=_hotel_count(db, group.id),
+        added=added,
+        removed=removed,
+    )
 
 
 @router.delete("/{group_id}")
@@ -1,16 +1,50 @@
-from typing import Optional
+import hashlib
+import json
+from datetime import datetime
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
-from pydantic import BaseModel, ConfigDict
-from sqlalchemy.orm import Session, joinedload
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    TypeAdapter,
+    ValidationError,
+    model_validator,
+)
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
 
 from ..auth import get_current_user
 from ..database import get_db
-from ..models import Hotel, HotelGroupMembership, ReviewSnapshot, User
+from ..models import Hotel, HotelGroup, HotelGroupMembership, ReviewSnapshot, User
+from ..services import versions
 from ..services.csv_import import import_csv
+from ..services.diff import diff_response
+from ..services.hotel_export import refresh as refresh_exports
+from ..services.idempotency import run_idempotent
+from ..services.rankings import hotel_ranks
+from ..services.snapshots import history_page, latest_snapshots
+from ..services.strategies import STRATEGIES, get_strategy, strategy_scores
+from ..services.timeseries import MAX_SERIES_HOTELS, Bucket, series, series_list
+from .admin import _require_admin
 
 router = APIRouter()
 
+MAX_BULK_DELETE = 10_000
+MAX_BULK_HOTELS = 5_000
+
 
 def _escape_like(term: str) -> str:
     """Escape %, _, and \\ so they are treated as literals in LIKE/ILIKE."""
@@ -27,6 +61,30 @@ class HotelCreate(BaseModel):
     tripadvisor_name: Optional[str] = None
 
 
+class HotelUpsert(HotelCreate):
+    """One item of a bulk upsert. With ``id`` it updates that hotel; without,
+    it updates the hotel with exactly this name or creates one. Only fields
+    present in the item are written on update, so an update by id may leave
+    out ``name``."""
+
+    id: Optional[int] = None
+    name: Optional[str] = None
+    keys: Optional[int] = None
+    kind: Optional[str] = None
+    brand: Optional[str] = None
+    parent: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _check(self) -> "HotelUpsert":
+        if self.name is None and (self.id is None or "name" in self.model_fields_set):
+            raise ValueError("name is required unless updating by id")
+        return self
+
+
+_upsert_items = TypeAdapter(list[HotelUpsert])
+_UPSERT_FIELDS = [f for f in HotelUpsert.model_fields if f != "id"]
+
+
 class HotelOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -50,6 +108,7 @@ class SnapshotOut(BaseModel):
     id: int
     hotel_id: int
     collected_at: str
+    confirmed_at: Optional[str] = None
     source: str
     google_score: Optional[float] = None
     google_count: Optional[int] = None
@@ -71,6 +130,9 @@ class SnapshotOut(BaseModel):
             id=snapshot.id,
             hotel_id=snapshot.hotel_id,
             collected_at=snapshot.collected_at.isoformat(),
+            confirmed_at=snapshot.confirmed_at.isoformat()
+            if snapshot.confirmed_at
+            else None,
             source=snapshot.source,
             google_score=snapshot.google_score,
             google_count=snapshot.google_count,
@@ -90,6 +152,11 @@ class SnapshotOut(BaseModel):
 
 class HotelDetail(HotelOut):
     latest_snapshot: Optional[SnapshotOut] = None
+    # Present only when a ?strategy= was requested.
+    strategy: Optional[str] = None
+    strategy_score: Optional[float] = None
+    # Detail only: {metric: {"all"|"state"|"brand": {rank, percentile, ...}}}
+    ranks: Optional[dict] = None
 
 
 @router.post("", response_model=HotelDetail)
@@ -108,20 +175,231 @@ def create_hotel(
         tripadvisor_name=payload.tripadvisor_name,
     )
     db.add(hotel)
+    versions.bump(db)
     db.commit()
     db.refresh(hotel)
     return HotelDetail.model_validate(hotel)
 
 
+async def _raw_body(request: Request) -> bytes:
+    return await request.body()
+
+
+def _bulk_items(raw: bytes, content_type: str) -> tuple[list, dict[int, list]]:
+    """Decode a JSON array or NDJSON body into items, plus per-index errors
+    for NDJSON lines that aren't JSON."""
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8")
+    if content_type.startswith(("application/x-ndjson", "application/jsonl")):
+        items, errors = [], {}
+        for line in filter(str.strip, text.splitlines()):
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                errors[len(items)] = [f"Invalid JSON: {e}"]
+                items.append(None)
+        return items, errors
+    try:
+        items = json.loads(text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array")
+    return items, {}
+
+
+def _validate_bulk(items: list, errors: dict[int, list]) -> dict[int, HotelUpsert]:
+    """Validate all items in one pass; failures are added to ``errors``.
+    Only when some fail are the rest validated again, without them."""
+    candidates = [i for i in range(len(items)) if i not in errors]
+    try:
+        validated = _upsert_items.validate_python([items[i] for i in candidates])
+        return dict(zip(candidates, validated))
+    except ValidationError as e:
+        for err in e.errors(include_url=False):
+            position, *field = err["loc"]
+            where = ".".join(map(str, field))
+            errors.setdefault(candidates[position], []).append(
+                f"{where}: {err['msg']}" if where else err["msg"]
+            )
+    return _validate_bulk(items, errors)
+
+
+def _upsert_hotels(db: Session, items: dict[int, HotelUpsert]) -> dict[int, dict]:
+    """Match items to hotels with one query per key (id, name), then apply one
+    bulk UPDATE and one multi-row INSERT. Returns a result per item index."""
+    results: dict[int, dict] = {}
+    by_id = {item.id for item in items.values() if item.id is not None}
+    names = {item.name for item in items.values() if item.id is None}
+    known_ids = set(db.scalars(select(Hotel.id).where(Hotel.id.in_(by_id))))
+    id_by_name: dict[str, int] = {}
+    for hotel_id, name in db.execute(
+        select(Hotel.id, Hotel.name).where(Hotel.name.in_(names)).order_by(Hotel.id)
+    ):
+        id_by_name.setdefault(name, hotel_id)
+
+    updates: dict[int, dict] = {}
+    creates: dict[int, dict] = {}
+    seen: set = set()
+    for index, item in items.items():
+        key = ("id", item.id) if item.id is not None else ("name", item.name)
+        if key in seen:
+            results[index] = {"status": "error", "errors": [f"Duplicate {key[0]}"]}
+            continue
+        seen.add(key)
+        hotel_id = item.id if item.id is not None else id_by_name.get(item.name)
+        if item.id is not None and hotel_id not in known_ids:
+            results[index] = {"status": "error", "errors": ["Hotel not found"]}
+        elif hotel_id is not None:
+            fields = item.model_dump(include=item.model_fields_set - {"id"})
+            updates[index] = {"id": hotel_id, **fields}
+        else:
+            creates[index] = item.model_dump(include=set(_UPSERT_FIELDS))
+
+    if updates:
+        db.execute(update(Hotel), list(updates.values()))
+        for index, row in updates.items():
+            results[index] = {"status": "updated", "id": row["id"]}
+    if creates:
+        # Names being created are unique in the batch, so RETURNING can be
+        # matched up by name without asking for parameter order (which
+        # SQLite only honours one row per statement).
+        new_ids = dict(
+            db.execute(
+                insert(Hotel).returning(Hotel.name, Hotel.id), list(creates.values())
+            ).all()
+        )
+        for index, row in creates.items():
+            results[index] = {"status": "created", "id": new_ids[row["name"]]}
+    return results
+
+
+@router.post("/bulk")
+def bulk_upsert_hotels(
+    raw: bytes = Depends(_raw_body),
+    content_type: str = Header("application/json"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Create or update many hotels from a JSON array or NDJSON body
+    (``Content-Type: application/x-ndjson``) in one transaction.
+
+    Items that fail validation or matching are reported and skipped; the
+    rest are written. ``results`` holds one entry per item, in order.
+    """
+    items, errors = _bulk_items(raw, content_type)
+    if len(items) > MAX_BULK_HOTELS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BULK_HOTELS} hotels per request"
+        )
+    valid = _validate_bulk(items, errors)
+    results = _upsert_hotels(db, valid)
+    if results:
+        versions.bump(db)
+    db.commit()
+    for index, messages in errors.items():
+        results[index] = {"status": "error", "errors": messages}
+    ordered = [{"index": i, **results[i]} for i in range(len(items))]
+    counts = {
+        status: sum(r["status"] == status for r in ordered)
+        for status in ("created", "updated", "error")
+    }
+    return {**counts, "results": ordered}
+
+
 @router.post("/import-csv")
 def import_csv_endpoint(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    content = file.file.read().decode("utf-8")
-    count = import_csv(content, db)
-    return {"imported": count}
+    raw = file.file.read()
+    content = raw.decode("utf-8")
+    return run_idempotent(
+        db,
+        user,
+        idempotency_key,
+        "import-csv",
+        lambda: _import(content, db, background_tasks),
+        fingerprint=hashlib.sha256(raw).hexdigest(),
+    )
+
+
+def _import(content: str, db: Session, background_tasks: BackgroundTasks) -> dict:
+    imported = import_csv(content, db)
+    background_tasks.add_task(refresh_exports, db.get_bind())
+    return {"imported": imported}
+
+
+class BulkDelete(BaseModel):
+    ids: list[int] = Field(..., max_length=MAX_BULK_DELETE)
+
+
+@router.post("/bulk-delete")
+def bulk_delete_hotels(
+    req: BulkDelete,
+    confirm: bool = Query(False),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Delete many hotels and all their data. Unknown ids are ignored."""
+    _require_admin(user)
+    if not confirm:
+        raise HTTPException(status_code=400, detail="Pass ?confirm=true to delete")
+    deleted = _delete_hotels(db, list(set(req.ids))) if req.ids else 0
+    db.commit()
+    return {"deleted": deleted}
+
+
+@router.get("/strategies")
+def list_strategies(user: User = Depends(get_current_user)):
+    return [{"name": s.name, "description": s.description} for s in STRATEGIES.values()]
+
+
+@router.get("/history")
+def get_hotels_history(
+    ids: str = Query(..., description="Comma-separated hotel ids"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: Optional[Bucket] = Query(None),
+    max_points: Optional[int] = Query(None, ge=3, le=10000),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Series for several hotels at once, for comparison charts. Unknown ids
+    are left out; series come back in the order the ids were given."""
+    try:
+        hotel_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids must be comma-separated integers"
+        )
+    if len(hotel_ids) > MAX_SERIES_HOTELS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_SERIES_HOTELS} hotels per request"
+        )
+    found = {h.id: h for h in db.query(Hotel).filter(Hotel.id.in_(hotel_ids))}
+    hotels = [found[i] for i in hotel_ids if i in found]
+    return {
+        "bucket": bucket,
+        "series": series_list(db, hotels, start, end, bucket, max_points),
+    }
+
+
+@router.get("/diff")
+def get_hotels_diff(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    format: Literal["json", "csv"] = Query("json"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Each hotel's scores as of ``from`` and ``to`` and the change between."""
+    return diff_response(db, start, end, format, "hotels_diff")
 
 
 @router.get("")
@@ -131,10 +409,12 @@ def list_hotels(
     sort_dir: Optional[str] = Query("asc"),
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=500),
+    strategy: Optional[str] = Query(None),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    query = db.query(Hotel).options(joinedload(Hotel.snapshots))
+    scoring = get_strategy(strategy)
+    query = db.query(Hotel)
     if search:
         term = f"%{_escape_like(search)}%"
         query = query.filter(
@@ -155,33 +435,67 @@ def list_hotels(
 
     total = query.count()
     hotels = query.offset((page - 1) * page_size).limit(page_size).all()
+    latest_by_hotel = latest_snapshots(db, [h.id for h in hotels])
+    scores = (
+        strategy_scores(db, scoring, list(latest_by_hotel.values())) if scoring else {}
+    )
     results = []
     for hotel in hotels:
-        latest = hotel.snapshots[0] if hotel.snapshots else None
+        latest = latest_by_hotel.get(hotel.id)
         detail = HotelDetail.model_validate(hotel)
         if latest:
             detail.latest_snapshot = SnapshotOut.from_model(latest)
+        if scoring:
+            detail.strategy = scoring.name
+            detail.strategy_score = scores.get(latest.id) if latest else None
         results.append(detail)
     return {"items": results, "total": total, "page": page, "page_size": page_size}
 
 
 @router.get("/{hotel_id}", response_model=HotelDetail)
 def get_hotel(
-    hotel_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    hotel_id: int,
+    strategy: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
 ):
+    scoring = get_strategy(strategy)
     hotel = db.query(Hotel).filter(Hotel.id == hotel_id).first()
     if not hotel:
         raise HTTPException(status_code=404, detail="Hotel not found")
-    latest = hotel.snapshots[0] if hotel.snapshots else None
+    latest = latest_snapshots(db, [hotel_id]).get(hotel_id)
     detail = HotelDetail.model_validate(hotel)
     if latest:
         detail.latest_snapshot = SnapshotOut.from_model(latest)
+        detail.ranks = hotel_ranks(db, hotel_id)
+    if scoring:
+        detail.strategy = scoring.name
+        detail.strategy_score = (
+            strategy_scores(db, scoring, [latest])[latest.id] if latest else None
+        )
     return detail
 
 
-# TODO: Restrict deletion to admins (or hotel creator). The confirm param
-# prevents accidental calls but any authenticated user can still delete.
-# Deferring to cleanup phase in the interest of time.
+def _delete_hotels(db: Session, hotel_ids: list[int]) -> int:
+    """Delete hotels in a fixed number of statements whatever their history
+    size: bump the affected groups' membership_version and the hotels
+    counter, then DELETE the hotels and let ON DELETE CASCADE take their
+    snapshots, rollups, rankings, alerts and memberships."""
+    db.execute(
+        update(HotelGroup)
+        .where(
+            HotelGroup.id.in_(
+                select(HotelGroupMembership.group_id).where(
+                    HotelGroupMembership.hotel_id.in_(hotel_ids)
+                )
+            )
+        )
+        .values(membership_version=HotelGroup.membership_version + 1)
+    )
+    versions.bump(db)
+    return db.execute(delete(Hotel).where(Hotel.id.in_(hotel_ids))).rowcount
+
+
 @router.delete("/{hotel_id}")
 def delete_hotel(
     hotel_id: int,
@@ -189,24 +503,51 @@ def delete_hotel(
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
+    _require_admin(user)
     if not confirm:
         raise HTTPException(status_code=400, detail="Pass ?confirm=true to delete")
     hotel = db.query(Hotel).filter(Hotel.id == hotel_id).first()
     if not hotel:
         raise HTTPException(status_code=404, detail="Hotel not found")
-    db.query(HotelGroupMembership).filter(
-        HotelGroupMembership.hotel_id == hotel_id
-    ).delete()
-    db.delete(hotel)
+    _delete_hotels(db, [hotel_id])
     db.commit()
     return {"deleted": True}
 
 
 @router.get("/{hotel_id}/history", response_model=list[SnapshotOut])
 def get_hotel_history(
-    hotel_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    hotel_id: int,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
 ):
-    hotel = db.query(Hotel).filter(Hotel.id == hotel_id).first()
-    if not hotel:
+    """Newest-first snapshots. When more remain, pass the ``X-Next-Cursor``
+    response header back as ``?cursor=`` to get the next page."""
+    if not db.query(Hotel.id).filter(Hotel.id == hotel_id).first():
+        raise HTTPException(status_code=404, detail="Hotel not found")
+    try:
+        rows, next_cursor = history_page(db, hotel_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [SnapshotOut.from_model(s) for s in rows]
+
+
+@router.get("/{hotel_id}/history/series")
+def get_hotel_history_series(
+    hotel_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: Optional[Bucket] = Query(None),
+    max_points: Optional[int] = Query(None, ge=3, le=10000),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Chart-ready history as parallel arrays, oldest first."""
+    if not db.query(Hotel.id).filter(Hotel.id == hotel_id).first():
         raise HTTPException(status_code=404, detail="Hotel not found")
-    return [SnapshotOut.from_model(s) for s in hotel.snapshots]
+    data = series(db, [hotel_id], start, end, bucket, max_points)[hotel_id]
+    return {"hotel_id": hotel_id, "bucket": bucket, **data}
@@ -0,0 +1,32 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ..auth import get_current_user
+from ..database import get_db
+from ..models import User
+from ..services.rankings import METRICS, leaderboard
+
+router = APIRouter()
+
+
+@router.get("")
+def get_leaderboard(
+    metric: str = Query("weighted_average"),
+    scope: Literal["all", "state", "brand"] = Query("all"),
+    value: Optional[str] = Query(None, description="Only this state or brand"),
+    n: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Top and bottom ``n`` hotels by ``metric``, per state or brand if asked."""
+    if metric not in METRICS:
+        raise HTTPException(
+            status_code=400, detail=f"metric must be one of {', '.join(METRICS)}"
+        )
+    return {
+        "metric": metric,
+        "scope": scope,
+        "boards": leaderboard(db, metric, scope, n, value),
+    }
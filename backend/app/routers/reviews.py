@@ -1,54 +1,58 @@
-from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException
 from sqlalchemy.orm import Session
 
 from ..auth import get_current_user
 from ..database import get_db
-from ..models import Hotel, HotelGroup, ReviewSnapshot, User
-from ..services.collectors.booking import collect_booking_reviews
-from ..services.collectors.expedia import collect_expedia_reviews
-from ..services.collectors.google import collect_google_reviews
-from ..services.collectors.tripadvisor import collect_tripadvisor_reviews
-from ..services.scoring import compute_scores
+from ..models import Hotel, HotelGroup, User
+from ..services.collection import collect_hotel, collect_hotels
+from ..services.collectors import enabled_collectors
+from ..services.hotel_export import refresh as refresh_exports
+from ..services.idempotency import run_idempotent
+from ..services.snapshots import record_snapshot, record_snapshots
 
 router = APIRouter()
 
 
-def _collect_all(hotel):
-    """Run all 4 collectors in parallel."""
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        f_google = pool.submit(collect_google_reviews, hotel)
-        f_booking = pool.submit(collect_booking_reviews, hotel)
-        f_expedia = pool.submit(collect_expedia_reviews, hotel)
-        f_ta = pool.submit(collect_tripadvisor_reviews, hotel)
-    return f_google.result(), f_booking.result(), f_expedia.result(), f_ta.result()
+def _require_channels() -> None:
+    if not enabled_collectors():
+        raise HTTPException(
+            status_code=503,
+            detail="All review channels are disabled. Enable one under /api/admin/collectors.",
+        )
 
 
 @router.post("/hotels/{hotel_id}/collect")
 def collect_hotel_reviews(
-    hotel_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    hotel_id: int,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
 ):
     hotel = db.query(Hotel).filter(Hotel.id == hotel_id).first()
     if not hotel:
         raise HTTPException(status_code=404, detail="Hotel not found")
+    _require_channels()
+    return run_idempotent(
+        db,
+        user,
+        idempotency_key,
+        f"collect-hotel:{hotel_id}",
+        lambda: _collect_hotel(hotel, db, background_tasks),
+    )
 
-    (
-        (google_score, google_count),
-        (booking_score, booking_count),
-        (expedia_score, expedia_count),
-        (ta_score, ta_count),
-    ) = _collect_all(hotel)
-
-    # Track which channels returned live data
-    channels = {
-        "google": google_score is not None,
-        "booking": booking_score is not None,
-        "expedia": expedia_score is not None,
-        "tripadvisor": ta_score is not None,
-    }
-    succeeded = [ch for ch, ok in channels.items() if ok]
-    failed = [ch for ch, ok in channels.items() if not ok]
+
+def _collect_hotel(
+    hotel: Hotel, db: Session, background_tasks: BackgroundTasks
+) -> dict:
+    # Claiming the Idempotency-Key committed and expired the hotel; reload
+    # it here rather than from the collectors' worker threads.
+    db.refresh(hotel)
+    result = collect_hotel(hotel)
+    succeeded = result.succeeded
+    failed = result.failed
 
     if not succeeded:
         raise HTTPException(
@@ -56,26 +60,14 @@ def collect_hotel_reviews(
             detail=f"All channels failed to collect live data. Check API keys and service availability. Failed: {', '.join(failed)}",
         )
 
-    snapshot = ReviewSnapshot(
-        hotel_id=hotel.id,
-        source="live",
-        google_score=google_score,
-        google_count=google_count,
-        booking_score=booking_score,
-        booking_count=booking_count,
-        expedia_score=expedia_score,
-        expedia_count=expedia_count,
-        tripadvisor_score=ta_score,
-        tripadvisor_count=ta_count,
-    )
-
-    compute_scores(snapshot)
-    db.add(snapshot)
+    snapshot, created = record_snapshot(db, result.to_snapshot())
     db.commit()
+    background_tasks.add_task(refresh_exports, db.get_bind())
     db.refresh(snapshot)
     return {
         "snapshot_id": snapshot.id,
         "weighted_average": snapshot.weighted_average,
+        "unchanged": not created,
         "channels_succeeded": succeeded,
         "channels_failed": failed,
     }
@@ -83,7 +75,11 @@ def collect_hotel_reviews(
 
 @router.post("/groups/{group_id}/collect")
 def collect_group_reviews(
-    group_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+    group_id: int,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
 ):
     group = (
         db.query(HotelGroup)
@@ -92,26 +88,25 @@ def collect_group_reviews(
     )
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
+    _require_channels()
+    return run_idempotent(
+        db,
+        user,
+        idempotency_key,
+        f"collect-group:{group_id}",
+        lambda: _collect_group(group, db, background_tasks),
+    )
 
-    results = []
-    for m in group.memberships:
-        hotel = m.hotel
-
-        (
-            (google_score, google_count),
-            (booking_score, booking_count),
-            (expedia_score, expedia_count),
-            (ta_score, ta_count),
-        ) = _collect_all(hotel)
-
-        channels = {
-            "google": google_score is not None,
-            "booking": booking_score is not None,
-            "expedia": expedia_score is not None,
-            "tripadvisor": ta_score is not None,
-        }
-        succeeded = [ch for ch, ok in channels.items() if ok]
 
+def _collect_group(
+    group: HotelGroup, db: Session, background_tasks: BackgroundTasks
+) -> dict:
+    hotels = [m.hotel for m in group.memberships]
+    results = []
+    collected = []
+    for result in collect_hotels(hotels):
+        hotel = result.hotel
+        succeeded = result.succeeded
         if not succeeded:
             results.append(
                 {
@@ -119,37 +114,28 @@ def collect_group_reviews(
                     "hotel_name": hotel.name,
                     "status": "failed",
                     "channels_succeeded": [],
-                    "channels_failed": list(channels.keys()),
+                    "channels_failed": result.failed,
                 }
             )
             continue
 
-        snapshot = ReviewSnapshot(
-            hotel_id=hotel.id,
-            source="live",
-            google_score=google_score,
-            google_count=google_count,
-            booking_score=booking_score,
-            booking_count=booking_count,
-            expedia_score=expedia_score,
-            expedia_count=expedia_count,
-            tripadvisor_score=ta_score,
-            tripadvisor_count=ta_count,
-        )
-        compute_scores(snapshot)
-        db.add(snapshot)
-        failed = [ch for ch, ok in channels.items() if not ok]
+        collected.append(result.to_snapshot())
         results.append(
             {
                 "hotel_id": hotel.id,
                 "hotel_name": hotel.name,
                 "status": "ok",
                 "channels_succeeded": succeeded,
-                "channels_failed": failed,
+                "channels_failed": result.failed,
             }
         )
 
+    recorded = {s.hotel_id: created for s, created in record_snapshots(db, collected)}
     db.commit()
+    background_tasks.add_task(refresh_exports, db.get_bind())
+    for r in results:
+        if r["status"] == "ok":
+            r["unchanged"] = not recorded[r["hotel_id"]]
     return {
         "collected": sum(1 for r in results if r["status"] == "ok"),
         "hotels": results,
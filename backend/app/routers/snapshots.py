@@ -0,0 +1,167 @@
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+from sqlalchemy.orm import Session
+
+from ..auth import get_current_user
+from ..database import get_db
+from ..models import User
+from ..services.hotel_export import refresh as refresh_exports
+from ..services.ingest import INGEST_BATCH, ingest_batch
+from ..services.rollups import naive_utc
+from ..services.snapshots import changes_page
+from .hotels import SnapshotOut
+
+router = APIRouter()
+
+MAX_LINE_BYTES = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+
+
+class SnapshotIn(BaseModel):
+    """One NDJSON line of ``/ingest``: a hotel by id or exact name, when the
+    scores were observed, and raw per-channel scores and review counts."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    hotel_id: Optional[int] = None
+    hotel: Optional[str] = None
+    collected_at: datetime
+    google_score: Optional[float] = Field(None, ge=0, le=5)
+    google_count: Optional[int] = Field(None, ge=0)
+    booking_score: Optional[float] = Field(None, ge=0, le=10)
+    booking_count: Optional[int] = Field(None, ge=0)
+    expedia_score: Optional[float] = Field(None, ge=0, le=10)
+    expedia_count: Optional[int] = Field(None, ge=0)
+    tripadvisor_score: Optional[float] = Field(None, ge=0, le=5)
+    tripadvisor_count: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def _check(self) -> "SnapshotIn":
+        if (self.hotel_id is None) == (self.hotel is None):
+            raise ValueError("give exactly one of hotel_id and hotel")
+        if all(
+            getattr(self, f"{ch}_score") is None
+            for ch in ("google", "booking", "expedia", "tripadvisor")
+        ):
+            raise ValueError("at least one channel score is required")
+        self.collected_at = naive_utc(self.collected_at)
+        return self
+
+
+def _error_message(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, err['loc']))}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in e.errors(include_url=False)
+    )
+
+
+async def _lines(request: Request) -> AsyncIterator[tuple[int, bytes | None]]:
+    """Numbered body lines as the client sends them; None for a line longer
+    than ``MAX_LINE_BYTES``, which is dropped rather than buffered when it
+    spans chunks."""
+    buffer = b""
+    number = 0
+    oversized = False
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, None if oversized or len(line) > MAX_LINE_BYTES else line
+            oversized = False
+        if len(buffer) > MAX_LINE_BYTES:
+            oversized, buffer = True, b""
+    if oversized or buffer.strip():
+        yield number + 1, None if oversized else buffer
+
+
+def _ingest(db: Session, lines: list[tuple[int, bytes | None]]):
+    rows, errors = [], []
+    for number, line in lines:
+        if line is None:
+            errors.append(
+                {"line": number, "error": f"Line exceeds {MAX_LINE_BYTES} bytes"}
+            )
+            continue
+        try:
+            item = SnapshotIn.model_validate_json(line)
+        except ValidationError as e:
+            errors.append({"line": number, "error": _error_message(e)})
+            continue
+        rows.append((number, item.model_dump(exclude_none=True)))
+    inserted, skipped, failed = ingest_batch(db, rows) if rows else (0, 0, [])
+    return inserted, skipped, sorted(errors + failed, key=lambda e: e["line"])
+
+
+@router.post("/ingest")
+async def ingest_snapshots(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Ingest snapshots from an NDJSON body, one ``SnapshotIn`` per line.
+
+    The body is read as it arrives and written ``INGEST_BATCH`` lines at a
+    time, each batch scored and committed before more of the body is read,
+    so a slow database slows the upload instead of filling memory. Bad lines
+    are reported by line number and skipped; resent rows (same hotel and
+    collected_at) are skipped too.
+    """
+    totals = {"lines": 0, "inserted": 0, "skipped": 0, "rejected": 0}
+    errors: list[dict] = []
+
+    async def flush(batch) -> None:
+        inserted, skipped, failed = await run_in_threadpool(_ingest, db, batch)
+        totals["inserted"] += inserted
+        totals["skipped"] += skipped
+        totals["rejected"] += len(failed)
+        errors.extend(failed[: MAX_REPORTED_ERRORS - len(errors)])
+
+    batch = []
+    async for number, line in _lines(request):
+        totals["lines"] = number
+        if line is not None and not line.strip():
+            continue
+        batch.append((number, line))
+        if len(batch) >= INGEST_BATCH:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+    if totals["inserted"]:
+        background_tasks.add_task(refresh_exports, db.get_bind())
+    return {
+        **totals,
+        "errors": errors,
+        "errors_truncated": totals["rejected"] > len(errors),
+    }
+
+
+@router.get("/changes")
+def get_snapshot_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Snapshots written after ``since``, oldest first, for incremental sync.
+
+    Start from ``since=0`` and keep the returned ``next_cursor``; passing it
+    back returns only what was written since. ``has_more`` says another page
+    is already waiting. An empty page hands back the same cursor. Snapshots
+    appear ``CHANGES_LAG_SECONDS`` after they are written, so one committed
+    out of id order by a concurrent writer is not skipped.
+    """
+    rows, has_more = changes_page(db, since, limit)
+    return {
+        "snapshots": [SnapshotOut.from_model(s) for s in rows],
+        "next_cursor": rows[-1].id if rows else since,
+        "has_more": has_more,
+    }
@@ -0,0 +1,185 @@
+"""Portfolio-wide score anomaly detection.
+
+Recent daily rollups for every hotel are loaded once as a (days x metrics)
+array sorted by hotel; per-hotel reductions use ``np.*.reduceat`` over the
+hotel boundaries, so the whole portfolio is checked in a handful of array
+operations. Rollup days only exist where a snapshot was inserted, so a hotel
+whose latest snapshot has merely been confirmed since gets that snapshot's
+values as one more row, dated when it was last confirmed. Three detectors run
+over it:
+
+- drop: latest value vs the value at the start of the drop window
+- zscore: latest value vs the mean/std of the hotel's earlier lookback days
+- divergence: one channel vs the median of the hotel's channels
+
+Findings replace the contents of the ``alerts`` table.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from ..models import Alert, ReviewSnapshot, SnapshotDailyRollup
+from .rollups import ROLLUP_SOURCES
+from .snapshots import latest_ids
+
+METRICS = tuple(ROLLUP_SOURCES)  # channels, then "weighted_average"
+CHANNEL_COLUMNS = [i for i, m in enumerate(METRICS) if m != "weighted_average"]
+
+LOOKBACK_DAYS = 90
+DROP_WINDOW_DAYS = 30
+DROP_THRESHOLD = 0.5  # points on the 0-10 scale
+ZSCORE_THRESHOLD = 3.0
+MIN_HISTORY = 5  # earlier days needed before a z-score means anything
+MIN_STD = 0.1  # floor so flat histories don't turn tiny moves into huge z
+DIVERGENCE_THRESHOLD = 2.0
+
+
+def _load(db: Session, today: date):
+    window = today - timedelta(days=DROP_WINDOW_DAYS)
+    rows = db.execute(
+        select(
+            SnapshotDailyRollup.hotel_id,
+            SnapshotDailyRollup.day,
+            *(getattr(SnapshotDailyRollup, f"{m}_last") for m in METRICS),
+        )
+        .where(SnapshotDailyRollup.day >= today - timedelta(days=LOOKBACK_DAYS))
+        .order_by(SnapshotDailyRollup.hotel_id, SnapshotDailyRollup.day)
+    ).all()
+    last_day = {r[0]: r[1] for r in rows}
+    seen = func.coalesce(ReviewSnapshot.confirmed_at, ReviewSnapshot.collected_at)
+    confirmed = db.execute(
+        select(
+            ReviewSnapshot.hotel_id,
+            seen,
+            *(getattr(ReviewSnapshot, ROLLUP_SOURCES[m]) for m in METRICS),
+        ).where(
+            ReviewSnapshot.id.in_(latest_ids()),
+            seen >= datetime.combine(window, time()),
+        )
+    ).all()
+    stale = [
+        (r[0], r[1].date(), *r[2:])
+        for r in confirmed
+        if last_day.get(r[0], date.min) < window
+    ]
+    if stale:
+        rows = sorted([*rows, *stale], key=lambda r: (r[0], r[1]))
+    hotel_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    days = np.array([r[1] for r in rows], dtype="datetime64[D]")
+    values = np.array([r[2:] for r in rows], dtype=float).reshape(
+        len(rows), len(METRICS)
+    )
+    return hotel_ids, days, values
+
+
+def _first(mask: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Row index of the first True per hotel and metric, or len(mask) if none."""
+    idx = np.arange(len(mask))[:, None]
+    return np.minimum.reduceat(np.where(mask, idx, len(mask)), starts, axis=0)
+
+
+def _last(mask: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Row index of the last True per hotel and metric, or -1 if none."""
+    idx = np.arange(len(mask))[:, None]
+    return np.maximum.reduceat(np.where(mask, idx, -1), starts, axis=0)
+
+
+def _alerts(kind, hotels, metric_cols, values, baselines, scores) -> list[dict]:
+    return [
+        {
+            "hotel_id": int(h),
+            "kind": kind,
+            "metric": METRICS[c],
+            "value": round(float(v), 2),
+            "baseline": round(float(b), 2),
+            "score": round(float(s), 2),
+        }
+        for h, c, v, b, s in zip(hotels, metric_cols, values, baselines, scores)
+    ]
+
+
+def find_anomalies(
+    hotel_ids: np.ndarray,
+    days: np.ndarray,
+    values: np.ndarray,
+    today: date,
+    drop_threshold: float = DROP_THRESHOLD,
+    zscore_threshold: float = ZSCORE_THRESHOLD,
+    divergence_threshold: float = DIVERGENCE_THRESHOLD,
+) -> list[dict]:
+    """Run every detector over rows sorted by (hotel_id, day)."""
+    if not len(hotel_ids):
+        return []
+    hotels, starts = np.unique(hotel_ids, return_index=True)
+    cols = np.arange(values.shape[1])
+    valid = ~np.isnan(values)
+    recent = (days >= np.datetime64(today - timedelta(days=DROP_WINDOW_DAYS)))[:, None]
+
+    # Latest value per hotel and metric, if it falls inside the drop window.
+    latest = _last(valid & recent, starts)
+    has_latest = latest >= 0
+    latest_val = values[np.where(has_latest, latest, 0), cols]
+
+    found = []
+
+    # Drops: compare with the last value before the window, or failing that
+    # the first one inside it.
+    before = _last(valid & ~recent, starts)
+    first_in = _first(valid & recent, starts)
+    base = np.where(before >= 0, before, first_in)
+    has_base = has_latest & (base < len(values)) & (base != latest)
+    base_val = values[np.where(has_base, base, 0), cols]
+    delta = latest_val - base_val
+    hit = has_base & (delta <= -drop_threshold)
+    h, c = np.nonzero(hit)
+    found += _alerts("drop", hotels[h], c, latest_val[hit], base_val[hit], delta[hit])
+
+    # Rolling z-score of the latest value against the rest of the lookback.
+    filled = np.where(valid, values, 0.0)
+    n = np.add.reduceat(valid.astype(int), starts, axis=0) - has_latest
+    total = np.add.reduceat(filled, starts, axis=0) - np.where(
+        has_latest, latest_val, 0
+    )
+    squares = np.add.reduceat(filled**2, starts, axis=0) - np.where(
+        has_latest, latest_val**2, 0
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / n
+        std = np.sqrt(np.maximum(squares / n - mean**2, 0))
+        z = (latest_val - mean) / np.maximum(std, MIN_STD)
+    hit = has_latest & (n >= MIN_HISTORY) & (np.abs(z) >= zscore_threshold)
+    h, c = np.nonzero(hit)
+    found += _alerts("zscore", hotels[h], c, latest_val[hit], mean[hit], z[hit])
+
+    # Divergence: each channel's latest value vs the median of the hotel's
+    # channels. The median keeps one outlier from dragging the others along.
+    ch_vals = np.where(has_latest, latest_val, np.nan)[:, CHANNEL_COLUMNS]
+    ch_valid = ~np.isnan(ch_vals)
+    count = ch_valid.sum(axis=1, keepdims=True)
+    medians = np.full((len(ch_vals), 1), np.nan)
+    enough = count[:, 0] >= 3
+    medians[enough, 0] = np.nanmedian(ch_vals[enough], axis=1)
+    baseline = np.broadcast_to(medians, ch_vals.shape)
+    diff = ch_vals - baseline
+    hit = ch_valid & (count >= 3) & (np.abs(diff) >= divergence_threshold)
+    h, c = np.nonzero(hit)
+    metric_cols = np.array(CHANNEL_COLUMNS)[c]
+    found += _alerts(
+        "divergence", hotels[h], metric_cols, ch_vals[hit], baseline[hit], diff[hit]
+    )
+    return found
+
+
+def detect_anomalies(db: Session, today: date | None = None, **thresholds) -> int:
+    """Scan recent history, replace the alerts table and return the alert count."""
+    today = today or datetime.now(timezone.utc).date()
+    hotel_ids, days, values = _load(db, today)
+    found = find_anomalies(hotel_ids, days, values, today, **thresholds)
+    db.query(Alert).delete()
+    if found:
+        db.execute(insert(Alert), found)
+    db.commit()
+    return len(found)
@@ -0,0 +1,80 @@
+import logging
+from concurrent.futures import Future
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from ..models import Hotel, ReviewSnapshot
+from .collectors import enabled_collectors
+from .collectors.registry import lease_executor
+from .scoring import compute_scores
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CollectionResult:
+    """Live values gathered for one hotel, keyed by channel."""
+
+    hotel: Hotel
+    values: dict[str, tuple[float | None, int | None]] = field(default_factory=dict)
+
+    @property
+    def succeeded(self) -> list[str]:
+        return [ch for ch, (score, _) in self.values.items() if score is not None]
+
+    @property
+    def failed(self) -> list[str]:
+        return [ch for ch, (score, _) in self.values.items() if score is None]
+
+    def to_snapshot(self) -> ReviewSnapshot:
+        snapshot = ReviewSnapshot(hotel_id=self.hotel.id, source="live")
+        for channel, (score, count) in self.values.items():
+            setattr(snapshot, f"{channel}_score", score)
+            setattr(snapshot, f"{channel}_count", count)
+        compute_scores(snapshot)
+        return snapshot
+
+
+def _result_or_none(channel: str, future: Future, hotel: Hotel):
+    try:
+        return future.result()
+    except Exception:
+        logger.exception("%s collector crashed for hotel %s", channel, hotel.name)
+        return None, None
+
+
+def collect_hotels(hotels: list[Hotel]) -> list[CollectionResult]:
+    """Run every enabled collector for every hotel.
+
+    Each channel runs on its own pool sized by its concurrency limit, so a
+    slow or rate-limited channel can't starve the others. Disabled channels
+    are left out of the results entirely.
+
+    Hotels must arrive with their attributes loaded: collectors read them
+    from worker threads, where a lazy load would go through the
+    (thread-unsafe) session.
+    """
+    collectors = enabled_collectors()
+    pending = []
+    with ExitStack() as leases:
+        pools = {
+            c.channel: leases.enter_context(lease_executor(c.channel))
+            for c in collectors
+        }
+        for hotel in hotels:
+            result = CollectionResult(hotel=hotel)
+            futures = {
+                c.channel: pools[c.channel].submit(c.collect, hotel) for c in collectors
+            }
+            pending.append((result, futures))
+
+    results = []
+    for result, futures in pending:
+        for channel, future in futures.items():
+            result.values[channel] = _result_or_none(channel, future, result.hotel)
+        results.append(result)
+    return results
+
+
+def collect_hotel(hotel: Hotel) -> CollectionResult:
+    return collect_hotels([hotel])[0]
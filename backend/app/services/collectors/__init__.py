@@ -0,0 +1,5 @@
+# Importing the channel modules registers their collectors.
+from . import booking, expedia, google, tripadvisor  # noqa: F401
+from .registry import all_collectors, enabled_collectors, get_collector
+
+__all__ = ["all_collectors", "enabled_collectors", "get_collector"]
@@ -1,9 +1,42 @@
+import os
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields, replace
 
 from ...models import Hotel
 
 
+@dataclass(frozen=True)
+class ChannelSettings:
+    """Scheduling knobs for one review channel."""
+
+    timeout_secs: float
+    max_concurrency: int
+    enabled: bool = True
+
+
+def _parse_env(value: str, kind: type):
+    if kind is bool:
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return kind(value)
+
+
+def settings_from_env(channel: str, defaults: ChannelSettings) -> ChannelSettings:
+    """Apply COLLECTOR_<CHANNEL>_<FIELD> overrides, e.g. COLLECTOR_BOOKING_ENABLED=false."""
+    overrides = {}
+    for f in fields(ChannelSettings):
+        raw = os.getenv(f"COLLECTOR_{channel.upper()}_{f.name.upper()}")
+        if raw:
+            overrides[f.name] = _parse_env(raw, type(getattr(defaults, f.name)))
+    return replace(defaults, **overrides)
+
+
 class BaseCollector(ABC):
+    channel: str
+    default_settings: ChannelSettings
+
+    def __init__(self):
+        self.settings = settings_from_env(self.channel, self.default_settings)
+
     @abstractmethod
     def collect(self, hotel: Hotel) -> tuple[float | None, int | None]:
         """Returns (score, review_count) or (None, None) if unavailable."""
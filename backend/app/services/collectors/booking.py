@@ -4,10 +4,15 @@ import os
 from apify_client import ApifyClient
 
 from ...models import Hotel
+from .base import BaseCollector, ChannelSettings
+from .matching import MAX_CANDIDATES, NameMatcher
+from .registry import register
 
 logger = logging.getLogger(__name__)
 
 APIFY_TOKEN = os.getenv("APIFY_TOKEN", "")
+# Point at a stand-in server (e.g. bench/fake_providers.py); None means api.apify.com.
+APIFY_API_URL = os.getenv("APIFY_API_URL") or None
 ACTOR_ID = "voyager/booking-scraper"
 
 # Booking's autocomplete requires full state names, not abbreviations.
@@ -66,7 +71,9 @@ STATE_NAMES = {
 }
 
 
-def collect_booking_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
+def collect_booking_reviews(
+    hotel: Hotel, timeout: float = 120
+) -> tuple[float | None, int | None]:
     """Collect Booking.com reviews via Apify scraper. Returns (score, count)."""
     if not APIFY_TOKEN:
         logger.warning(
@@ -82,14 +89,16 @@ def collect_booking_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
     else:
         location_query = search_name
     try:
-        client = ApifyClient(APIFY_TOKEN)
+        client = ApifyClient(APIFY_TOKEN, api_url=APIFY_API_URL)
         run = client.actor(ACTOR_ID).call(
             run_input={
                 "search": location_query,
-                "maxItems": 5,
+                "maxItems": MAX_CANDIDATES,
                 "accommodationType": 204,  # hotels only (excludes vacation rentals)
             },
-            timeout_secs=120,
+            timeout_secs=int(timeout),
+            # Skip run log streaming: it adds a fixed ~6s wait after every run.
+            logger=None,
         )
 
         items = list(client.dataset(run["defaultDatasetId"]).iterate_items())
@@ -97,30 +106,22 @@ def collect_booking_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
             logger.warning("Booking: no results for %s", hotel.name)
             return None, None
 
-        # The search returns nearby properties — find the right one by name.
-        match_name = (hotel.booking_name or hotel.name).lower()
+        # The search returns nearby properties — rank them by name similarity.
+        matcher = NameMatcher(hotel.booking_name or hotel.name, city=hotel.city)
+        ranked = matcher.rank(items)
         logger.info(
             "Booking: got %d results for '%s', looking for '%s': %s",
             len(items),
             location_query,
-            match_name,
-            [i.get("name") for i in items],
+            matcher.name,
+            [(round(s, 2), i.get("name")) for s, i in ranked],
         )
-        # Match on first 2 words to handle name variations (e.g. "Hotel" vs "Inn")
-        match_words = match_name.split()[:2]
-        item = next(
-            (
-                i
-                for i in items
-                if all(w in i.get("name", "").lower() for w in match_words)
-            ),
-            None,
-        )
-        if item is None:
+        if not ranked:
             logger.warning(
-                "Booking: no name match for '%s' in results, giving up", match_name
+                "Booking: no name match for '%s' in results, giving up", matcher.name
             )
             return None, None
+        item = ranked[0][1]
         score = item.get("rating")
         count = item.get("reviews")
 
@@ -131,3 +132,12 @@ def collect_booking_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
         logger.exception("Failed to collect Booking reviews for hotel %s", hotel.name)
 
     return None, None
+
+
+@register
+class BookingCollector(BaseCollector):
+    channel = "booking"
+    default_settings = ChannelSettings(timeout_secs=120, max_concurrency=4)
+
+    def collect(self, hotel: Hotel) -> tuple[float | None, int | None]:
+        return collect_booking_reviews(hotel, timeout=self.settings.timeout_secs)
@@ -4,10 +4,15 @@ import os
 from apify_client import ApifyClient
 
 from ...models import Hotel
+from .base import BaseCollector, ChannelSettings
+from .matching import MAX_CANDIDATES, NameMatcher
+from .registry import register
 
 logger = logging.getLogger(__name__)
 
 APIFY_TOKEN = os.getenv("APIFY_TOKEN", "")
+# Point at a stand-in server (e.g. bench/fake_providers.py); None means api.apify.com.
+APIFY_API_URL = os.getenv("APIFY_API_URL") or None
 ACTOR_ID = "jupri/expedia-hotels"
 
 # The Expedia actor returns text labels instead of numeric scores.
@@ -22,7 +27,9 @@ LABEL_TO_SCORE = {
 }
 
 
-def collect_expedia_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
+def collect_expedia_reviews(
+    hotel: Hotel, timeout: float = 120
+) -> tuple[float | None, int | None]:
     """Collect Expedia reviews via Apify scraper. Returns (score, count)."""
     if not APIFY_TOKEN:
         logger.warning(
@@ -36,10 +43,12 @@ def collect_expedia_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
         f"{hotel.city}, {hotel.state}" if hotel.city and hotel.state else hotel.name
     )
     try:
-        client = ApifyClient(APIFY_TOKEN)
+        client = ApifyClient(APIFY_TOKEN, api_url=APIFY_API_URL)
         run = client.actor(ACTOR_ID).call(
-            run_input={"location": [location_query], "limit": 5},
-            timeout_secs=120,
+            run_input={"location": [location_query], "limit": MAX_CANDIDATES},
+            timeout_secs=int(timeout),
+            # Skip run log streaming: it adds a fixed ~6s wait after every run.
+            logger=None,
         )
 
         items = list(client.dataset(run["defaultDatasetId"]).iterate_items())
@@ -47,30 +56,22 @@ def collect_expedia_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
             logger.warning("Expedia: no results for %s", hotel.name)
             return None, None
 
-        # The search returns nearby properties — find the right one by name.
-        match_name = (hotel.expedia_name or hotel.name).lower()
+        # The search returns nearby properties — rank them by name similarity.
+        matcher = NameMatcher(hotel.expedia_name or hotel.name, city=hotel.city)
+        ranked = matcher.rank(items)
         logger.info(
             "Expedia: got %d results for '%s', looking for '%s': %s",
             len(items),
             location_query,
-            match_name,
-            [(i.get("name"), (i.get("reviews") or {}).get("label")) for i in items],
+            matcher.name,
+            [(round(s, 2), i.get("name")) for s, i in ranked],
         )
-        # Match on first 2 words to handle name variations (e.g. "Hotel" vs "Resort")
-        match_words = match_name.split()[:2]
-        item = next(
-            (
-                i
-                for i in items
-                if all(w in i.get("name", "").lower() for w in match_words)
-            ),
-            None,
-        )
-        if item is None:
+        if not ranked:
             logger.warning(
-                "Expedia: no name match for '%s' in results, giving up", match_name
+                "Expedia: no name match for '%s' in results, giving up", matcher.name
             )
             return None, None
+        item = ranked[0][1]
 
         reviews = item.get("reviews") or {}
         count = reviews.get("total")
@@ -88,3 +89,12 @@ def collect_expedia_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
         logger.exception("Failed to collect Expedia reviews for hotel %s", hotel.name)
 
     return None, None
+
+
+@register
+class ExpediaCollector(BaseCollector):
+    channel = "expedia"
+    default_settings = ChannelSettings(timeout_secs=120, max_concurrency=4)
+
+    def collect(self, hotel: Hotel) -> tuple[float | None, int | None]:
+        return collect_expedia_reviews(hotel, timeout=self.settings.timeout_secs)
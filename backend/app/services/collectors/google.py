@@ -4,13 +4,18 @@ import os
 import httpx
 
 from ...models import Hotel
+from .base import BaseCollector, ChannelSettings
+from .registry import register
 
 logger = logging.getLogger(__name__)
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY", "")
+SERPAPI_BASE_URL = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com")
 
 
-def collect_google_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
+def collect_google_reviews(
+    hotel: Hotel, timeout: float = 15
+) -> tuple[float | None, int | None]:
     """Collect Google reviews via SerpAPI. Returns (score, count)."""
     if not SERPAPI_KEY:
         logger.warning(
@@ -21,13 +26,13 @@ def collect_google_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
     query = f"{hotel.name} {hotel.city} {hotel.state} hotel"
     try:
         resp = httpx.get(
-            "https://serpapi.com/search.json",
+            f"{SERPAPI_BASE_URL}/search.json",
             params={
                 "q": query,
                 "engine": "google",
                 "api_key": SERPAPI_KEY,
             },
-            timeout=15,
+            timeout=timeout,
         )
         resp.raise_for_status()
         data = resp.json()
@@ -54,3 +59,12 @@ def collect_google_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
         logger.exception("Failed to collect Google reviews for hotel %s", hotel.name)
 
     return None, None
+
+
+@register
+class GoogleCollector(BaseCollector):
+    channel = "google"
+    default_settings = ChannelSettings(timeout_secs=15, max_concurrency=8)
+
+    def collect(self, hotel: Hotel) -> tuple[float | None, int | None]:
+        return collect_google_reviews(hotel, timeout=self.settings.timeout_secs)
@@ -0,0 +1,123 @@
+import re
+from collections.abc import Callable, Iterable
+from functools import lru_cache
+
+# Words that vary freely between channels ("Hotel" vs "Inn" vs "Resort") and
+# carry little identity on their own. They still count toward trigram
+# similarity, just not toward the token overlap.
+GENERIC_WORDS = frozenset(
+    {
+        "the",
+        "a",
+        "an",
+        "and",
+        "at",
+        "by",
+        "of",
+        "hotel",
+        "hotels",
+        "inn",
+        "resort",
+        "suites",
+        "suite",
+        "motel",
+        "lodge",
+        "collection",
+        "kasa",
+    }
+)
+
+DEFAULT_THRESHOLD = 0.6
+
+# Ranked matching resolves the right property from a wider result set in one
+# actor run, so ask for more candidates than the first-two-words match could use.
+MAX_CANDIDATES = 20
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+@lru_cache(maxsize=4096)
+def normalize(name: str) -> tuple[str, ...]:
+    """Lowercase, strip punctuation and split into tokens."""
+    return tuple(_NON_ALNUM.sub(" ", name.lower().replace("&", " and ")).split())
+
+
+def _trigrams(tokens: tuple[str, ...]) -> frozenset[str]:
+    text = f"  {' '.join(tokens)} "
+    return frozenset(text[i : i + 3] for i in range(len(text) - 2))
+
+
+def _key_tokens(tokens: tuple[str, ...]) -> frozenset[str]:
+    key = frozenset(t for t in tokens if t not in GENERIC_WORDS)
+    return key or frozenset(tokens)
+
+
+def _dice(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def _default_location(item: dict) -> str:
+    address = item.get("address")
+    if isinstance(address, dict):
+        address = address.get("full") or " ".join(str(v) for v in address.values() if v)
+    parts = [address, item.get("city"), item.get("location")]
+    return " ".join(str(p) for p in parts if p and isinstance(p, (str, int)))
+
+
+class NameMatcher:
+    """Ranks provider search results against one hotel's name.
+
+    Normalized tokens and trigrams for the hotel are computed once; each
+    candidate is scored by the mean of token-set and trigram Dice similarity.
+    Candidates whose location mentions the hotel's city win ties.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        city: str | None = None,
+        threshold: float = DEFAULT_THRESHOLD,
+    ):
+        self.name = name
+        self.threshold = threshold
+        tokens = normalize(name)
+        self._tokens = _key_tokens(tokens)
+        self._trigrams = _trigrams(tokens)
+        self._city = normalize(city) if city else ()
+
+    def score(self, candidate: str | None) -> float:
+        if not candidate:
+            return 0.0
+        tokens = normalize(candidate)
+        return (
+            _dice(self._tokens, _key_tokens(tokens))
+            + _dice(self._trigrams, _trigrams(tokens))
+        ) / 2
+
+    def _in_city(self, location: str) -> bool:
+        if not self._city or not location:
+            return False
+        loc = normalize(location)
+        n = len(self._city)
+        return any(loc[i : i + n] == self._city for i in range(len(loc) - n + 1))
+
+    def rank(
+        self,
+        items: Iterable[dict],
+        name_of: Callable[[dict], str | None] = lambda i: i.get("name"),
+        location_of: Callable[[dict], str] = _default_location,
+    ) -> list[tuple[float, dict]]:
+        """Return (score, item) pairs above the threshold, best first."""
+        scored = []
+        for item in items:
+            s = self.score(name_of(item))
+            if s >= self.threshold:
+                scored.append((round(s, 3), self._in_city(location_of(item)), item))
+        scored.sort(key=lambda t: (t[0], t[1]), reverse=True)
+        return [(s, item) for s, _, item in scored]
+
+    def best_match(self, items: Iterable[dict], **kwargs) -> dict | None:
+        ranked = self.rank(items, **kwargs)
+        return ranked[0][1] if ranked else None
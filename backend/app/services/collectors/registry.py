@@ -0,0 +1,80 @@
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
+
+from .base import BaseCollector, ChannelSettings
+
+_registry: dict[str, BaseCollector] = {}
+_executors: dict[str, ThreadPoolExecutor] = {}
+_leases: dict[ThreadPoolExecutor, int] = {}
+_retired: set[ThreadPoolExecutor] = set()
+_lock = threading.Lock()
+
+
+def register(cls: type[BaseCollector]) -> type[BaseCollector]:
+    """Class decorator that adds a collector to the registry."""
+    _registry[cls.channel] = cls()
+    return cls
+
+
+def get_collector(channel: str) -> BaseCollector:
+    return _registry[channel]
+
+
+def all_collectors() -> list[BaseCollector]:
+    return list(_registry.values())
+
+
+def enabled_collectors() -> list[BaseCollector]:
+    return [c for c in _registry.values() if c.settings.enabled]
+
+
+@contextmanager
+def lease_executor(channel: str) -> Iterator[ThreadPoolExecutor]:
+    """Process-wide pool for a channel, sized to its concurrency limit.
+
+    Submit work while the lease is held. A pool replaced by
+    ``update_settings`` meanwhile keeps accepting the holders' work and is
+    shut down when the last lease on it is released.
+    """
+    with _lock:
+        pool = _executors.get(channel)
+        if pool is None:
+            pool = ThreadPoolExecutor(
+                max_workers=_registry[channel].settings.max_concurrency,
+                thread_name_prefix=f"collect-{channel}",
+            )
+            _executors[channel] = pool
+        _leases[pool] = _leases.get(pool, 0) + 1
+    try:
+        yield pool
+    finally:
+        with _lock:
+            _leases[pool] -= 1
+            if not _leases[pool]:
+                del _leases[pool]
+                if pool in _retired:
+                    _retired.discard(pool)
+                    pool.shutdown(wait=False)
+
+
+def update_settings(channel: str, **changes) -> ChannelSettings:
+    """Change a channel's settings at runtime (this process only).
+
+    Durable configuration belongs in COLLECTOR_<CHANNEL>_* environment
+    variables; this is for tuning or disabling a misbehaving channel live.
+    """
+    collector = _registry[channel]
+    with _lock:
+        collector.settings = replace(collector.settings, **changes)
+        if "max_concurrency" in changes and channel in _executors:
+            # New work uses a pool of the new size. Work already submitted
+            # finishes on the old one, which shuts down once nobody holds it.
+            old = _executors.pop(channel)
+            if old in _leases:
+                _retired.add(old)
+            else:
+                old.shutdown(wait=False)
+    return collector.settings
@@ -4,14 +4,20 @@ import os
 import httpx
 
 from ...models import Hotel
+from .base import BaseCollector, ChannelSettings
+from .registry import register
 
 logger = logging.getLogger(__name__)
 
 TRIPADVISOR_KEY = os.getenv("TRIPADVISOR_KEY", "")
-BASE_URL = "https://api.content.tripadvisor.com/api/v1"
+BASE_URL = os.getenv(
+    "TRIPADVISOR_BASE_URL", "https://api.content.tripadvisor.com/api/v1"
+)
 
 
-def collect_tripadvisor_reviews(hotel: Hotel) -> tuple[float | None, int | None]:
+def collect_tripadvisor_reviews(
+    hotel: Hotel, timeout: float = 15
+) -> tuple[float | None, int | None]:
     """Collect TripAdvisor reviews via Content API. Returns (score, count)."""
     if not TRIPADVISOR_KEY:
         logger.warning(
@@ -31,7 +37,7 @@ def collect_tripadvisor_reviews(hotel: Hotel) -> tuple[float | None, int | None]
                 "category": "hotels",
                 "language": "en",
             },
-            timeout=15,
+            timeout=timeout,
         )
         resp.raise_for_status()
         data = resp.json()
@@ -46,7 +52,7 @@ def collect_tripadvisor_reviews(hotel: Hotel) -> tuple[float | None, int | None]
         resp = httpx.get(
             f"{BASE_URL}/location/{location_id}/details",
             params={"key": TRIPADVISOR_KEY, "language": "en"},
-            timeout=15,
+            timeout=timeout,
         )
         resp.raise_for_status()
         details = resp.json()
@@ -64,3 +70,12 @@ def collect_tripadvisor_reviews(hotel: Hotel) -> tuple[float | None, int | None]
         )
 
     return None, None
+
+
+@register
+class TripAdvisorCollector(BaseCollector):
+    channel = "tripadvisor"
+    default_settings = ChannelSettings(timeout_secs=15, max_concurrency=8)
+
+    def collect(self, hotel: Hotel) -> tuple[float | None, int | None]:
+        return collect_tripadvisor_reviews(hotel, timeout=self.settings.timeout_secs)
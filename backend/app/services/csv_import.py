@@ -4,6 +4,7 @@ import io
 from sqlalchemy.orm import Session
 
 from ..models import Hotel, ReviewSnapshot
+from .rollups import update_rollups
 from .scoring import compute_scores
 
 
@@ -34,7 +35,7 @@ def import_csv(content: str, db: Session) -> int:
     next(reader)
     next(reader)
 
-    count = 0
+    snapshots = []
     for row in reader:
         if len(row) < 40:
             continue
@@ -87,7 +88,9 @@ def import_csv(content: str, db: Session) -> int:
         )
         compute_scores(snapshot)
         db.add(snapshot)
-        count += 1
+        snapshots.append(snapshot)
 
+    db.flush()
+    update_rollups(db, snapshots)
     db.commit()
-    return count
+    return len(snapshots)
@@ -0,0 +1,155 @@
+"""Point-in-time portfolio diff: each hotel's scores as of two instants.
+
+The as-of snapshot at an instant is the hotel's newest snapshot collected at
+or before it, looked up per hotel down the (hotel_id, collected_at) index so
+both instants resolve for every hotel in one set-based query.
+"""
+
+import csv
+import io
+import json
+from collections.abc import Iterator
+from datetime import datetime
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from ..models import Hotel, ReviewSnapshot
+from .rollups import naive_utc
+from .scoring import CHANNELS
+from .snapshots import latest_snapshot_id
+
+METRICS = ("weighted_average",) + tuple(f"{ch}_normalized" for ch in CHANNELS)
+
+CSV_HEADERS = ["Hotel ID", "Name", "City", "State", "From Snapshot", "To Snapshot"]
+for _metric in METRICS:
+    _label = _metric.replace("_", " ").title().replace("Tripadvisor", "TripAdvisor")
+    CSV_HEADERS += [f"{_label} From", f"{_label} To", f"{_label} Change"]
+
+STREAM_BATCH = 500
+
+
+def _asof(instant: datetime, hotel_ids=None):
+    latest = (
+        select(latest_snapshot_id(ReviewSnapshot.collected_at <= naive_utc(instant)))
+        .select_from(Hotel)
+        .correlate(None)
+    )
+    if hotel_ids is not None:
+        latest = latest.where(Hotel.id.in_(hotel_ids))
+    return (
+        select(
+            ReviewSnapshot.hotel_id,
+            ReviewSnapshot.id,
+            *(getattr(ReviewSnapshot, m) for m in METRICS),
+        )
+        .where(ReviewSnapshot.id.in_(latest))
+        .subquery()
+    )
+
+
+def _delta(a: float | None, b: float | None) -> float | None:
+    return None if a is None or b is None else round(b - a, 2)
+
+
+def diff_rows(
+    db: Session, start: datetime, end: datetime, hotel_ids=None
+) -> Iterator[dict]:
+    """One dict per hotel with a snapshot at either instant, by name."""
+    a = _asof(start, hotel_ids)
+    b = _asof(end, hotel_ids)
+    query = (
+        select(
+            Hotel.id,
+            Hotel.name,
+            Hotel.city,
+            Hotel.state,
+            a.c.id.label("from_id"),
+            b.c.id.label("to_id"),
+            *(a.c[m].label(f"from_{m}") for m in METRICS),
+            *(b.c[m].label(f"to_{m}") for m in METRICS),
+        )
+        .outerjoin(a, a.c.hotel_id == Hotel.id)
+        .outerjoin(b, b.c.hotel_id == Hotel.id)
+        .where(or_(a.c.id.is_not(None), b.c.id.is_not(None)))
+        .order_by(Hotel.name, Hotel.id)
+    )
+    if hotel_ids is not None:
+        query = query.where(Hotel.id.in_(hotel_ids))
+    for row in db.execute(query.execution_options(yield_per=STREAM_BATCH)):
+        out = {
+            "hotel_id": row.id,
+            "name": row.name,
+            "city": row.city,
+            "state": row.state,
+            "from_snapshot_id": row.from_id,
+            "to_snapshot_id": row.to_id,
+        }
+        for m in METRICS:
+            before, after = row._mapping[f"from_{m}"], row._mapping[f"to_{m}"]
+            out[m] = {"from": before, "to": after, "change": _delta(before, after)}
+        yield out
+
+
+def _json_chunks(rows: Iterator[dict]) -> Iterator[str]:
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + json.dumps(row)
+    yield "]"
+
+
+def _csv_chunks(rows: Iterator[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADERS)
+    for i, row in enumerate(rows, 1):
+        line = [
+            row["hotel_id"],
+            row["name"],
+            row["city"],
+            row["state"],
+            row["from_snapshot_id"],
+            row["to_snapshot_id"],
+        ]
+        for m in METRICS:
+            line += [
+                "" if v is None else v
+                for v in (row[m]["from"], row[m]["to"], row[m]["change"])
+            ]
+        writer.writerow(line)
+        if i % STREAM_BATCH == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def diff_response(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    format: str,
+    filename: str,
+    hotel_ids=None,
+) -> StreamingResponse:
+    """Stream the diff as a JSON array or a CSV download."""
+    start, end = naive_utc(start), naive_utc(end)
+    if start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+
+    def chunks():
+        rows = diff_rows(db, start, end, hotel_ids)
+        try:
+            yield from _csv_chunks(rows) if format == "csv" else _json_chunks(rows)
+        finally:
+            db.close()
+
+    if format == "csv":
+        return StreamingResponse(
+            chunks(),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={filename}.csv"},
+        )
+    return StreamingResponse(chunks(), media_type="application/json")
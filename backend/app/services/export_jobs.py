@@ -0,0 +1,167 @@
+"""Export jobs: large exports generated outside the request cycle.
+
+A job row is created by the API and its id handed to a process pool, so
+generating a big history file uses neither an API worker thread nor its
+GIL. The worker streams the export to ``<id>.<ext>.part`` in
+``EXPORT_JOBS_DIR`` and renames it into place when complete, then marks the
+job done; the API serves the file from disk (with Range support). A job
+still queued or running ``EXPORT_JOB_TIMEOUT_MINUTES`` after creation is
+presumed to have lost its worker and is marked failed; a worker that was only
+slow sees that before publishing and discards its file. Jobs and their files
+are dropped ``EXPORT_JOB_TTL_HOURS`` after creation.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+from ..models import ExportJob
+from .history_export import FORMATS, export_history, history_query
+from .hotel_export import csv_chunks, scope_criteria
+from .strategies import STRATEGIES
+
+log = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv(
+    "EXPORT_JOBS_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "export_jobs"),
+)
+MAX_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", "2"))
+JOB_TTL = timedelta(hours=int(os.getenv("EXPORT_JOB_TTL_HOURS", "24")))
+JOB_TIMEOUT = timedelta(minutes=int(os.getenv("EXPORT_JOB_TIMEOUT_MINUTES", "60")))
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: a forked child would share the parent's
+            # pooled database connections.
+            _pool = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def job_path(job: ExportJob) -> str:
+    return os.path.join(JOBS_DIR, f"{job.id}.{FORMATS[job.format][1]}")
+
+
+def media_type(job: ExportJob) -> str:
+    return FORMATS[job.format][0]
+
+
+def _chunks(db: Session, job: ExportJob) -> Iterator[bytes]:
+    if job.kind == "hotels":
+        scoring = STRATEGIES[job.strategy] if job.strategy else None
+        return csv_chunks(db, scope_criteria(job.group_id), scoring)
+    query = history_query(job.start, job.end, tuple(scope_criteria(job.group_id)))
+    return export_history(db, job.format, query)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _finish(db: Session, job_id: int, **values) -> bool:
+    """Record a running job's outcome, unless ``expire_jobs`` has already
+    failed it; False if so. The caller commits."""
+    return bool(
+        db.query(ExportJob)
+        .filter(ExportJob.id == job_id, ExportJob.status == "running")
+        .update(
+            {**values, "finished_at": datetime.now(timezone.utc)},
+            synchronize_session=False,
+        )
+    )
+
+
+def run_job(db: Session, job_id: int) -> None:
+    """Generate a queued job's file and record the outcome."""
+    job = db.get(ExportJob, job_id)
+    if job is None or job.status != "queued":
+        return
+    job.status = "running"
+    db.commit()
+
+    path = job_path(job)
+    partial = path + ".part"
+    try:
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        # The export generators close their session, so give them their own.
+        with open(partial, "wb") as f:
+            for chunk in _chunks(Session(bind=db.get_bind()), job):
+                f.write(chunk)
+        if _finish(db, job_id, status="done", size=os.path.getsize(partial)):
+            os.replace(partial, path)
+        else:
+            # Timed out meanwhile: the job stays failed and publishes nothing.
+            _remove(partial)
+    except Exception as exc:
+        log.exception("Export job %s failed", job_id)
+        _remove(partial)
+        db.rollback()
+        _finish(db, job_id, status="failed", error=str(exc)[:500])
+    db.commit()
+
+
+def _work(job_id: int) -> None:
+    """Worker-process entry point."""
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        run_job(db, job_id)
+    finally:
+        db.close()
+
+
+def _log_crash(future: Future) -> None:
+    if (exc := future.exception()) is not None:
+        log.error("Export worker died: %r", exc)
+
+
+def submit(job_id: int) -> None:
+    """Hand a committed, queued job to the worker pool."""
+    _executor().submit(_work, job_id).add_done_callback(_log_crash)
+
+
+def expire_jobs(db: Session) -> int:
+    """Fail jobs whose worker never finished, then delete jobs older than the
+    TTL along with their files. Returns how many were deleted."""
+    now = datetime.now(timezone.utc)
+    db.query(ExportJob).filter(
+        ExportJob.status.in_(("queued", "running")),
+        ExportJob.created_at < (now - JOB_TIMEOUT).replace(tzinfo=None),
+    ).update(
+        {
+            "status": "failed",
+            "error": "Export worker did not finish",
+            "finished_at": now,
+        },
+        synchronize_session=False,
+    )
+    expired = (
+        db.query(ExportJob)
+        .filter(ExportJob.created_at < (now - JOB_TTL).replace(tzinfo=None))
+        .all()
+    )
+    for job in expired:
+        _remove(job_path(job))
+        _remove(job_path(job) + ".part")
+        db.delete(job)
+    db.commit()
+    return len(expired)
@@ -0,0 +1,223 @@
+"""Portfolio-level scores for a hotel group.
+
+Everything here is aggregated in SQL over each member's latest snapshot (or
+the last snapshot per member per bucket, for the time series). Results are
+cached in-process per group, keyed by the group's ``membership_version``, the
+newest snapshot id among its members and the hotels counter from
+``versions``, so a cached summary is reused until membership changes, a
+member gets a new snapshot, or hotels are edited, deleted or rescored.
+"""
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from ..models import Hotel, HotelGroup, HotelGroupMembership, ReviewSnapshot
+from . import versions
+from .scoring import CHANNELS
+from .snapshots import latest_ids
+from .timeseries import Bucket, bucket_expr
+
+CACHE_SIZE = 256
+
+_cache: OrderedDict[tuple, dict] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def clear_cache() -> None:
+    """Drop every cached summary. Never needed for correctness: the keys
+    move on by themselves."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _members(group_id: int):
+    return select(HotelGroupMembership.hotel_id).where(
+        HotelGroupMembership.group_id == group_id
+    )
+
+
+def _review_count():
+    """Reviews behind a snapshot's weighted average: counts of scored channels."""
+    return sum(
+        case(
+            (
+                getattr(ReviewSnapshot, f"{ch}_normalized").is_not(None),
+                func.coalesce(getattr(ReviewSnapshot, f"{ch}_count"), 0),
+            ),
+            else_=0,
+        )
+        for ch in CHANNELS
+    )
+
+
+def _weighted(value, weight):
+    """Count-weighted mean of ``value``, falling back to a plain mean when
+    none of the rows carry review counts."""
+    scored_weight = func.sum(case((value.is_not(None), weight), else_=0))
+    return func.coalesce(
+        func.sum(value * weight) / func.nullif(scored_weight, 0), func.avg(value)
+    )
+
+
+def cache_key(db: Session, group: HotelGroup, bucket: Bucket) -> tuple:
+    newest = (
+        select(func.max(ReviewSnapshot.id))
+        .where(ReviewSnapshot.hotel_id.in_(_members(group.id)))
+        .scalar_subquery()
+    )
+    newest, hotels = db.execute(select(newest, versions.current())).one()
+    return (group.id, group.membership_version, newest, hotels, bucket)
+
+
+def _latest(group_id: int):
+    return ReviewSnapshot.id.in_(latest_ids(Hotel.id.in_(_members(group_id))))
+
+
+def _aggregates(db: Session, group_id: int) -> dict:
+    reviews = _review_count()
+    member_count = (
+        select(func.count())
+        .select_from(HotelGroupMembership)
+        .where(HotelGroupMembership.group_id == group_id)
+        .scalar_subquery()
+    )
+    columns = [
+        member_count.label("hotel_count"),
+        func.count(ReviewSnapshot.weighted_average).label("scored_hotels"),
+        _weighted(ReviewSnapshot.weighted_average, reviews).label("score"),
+        func.coalesce(func.sum(reviews), 0).label("review_count"),
+    ]
+    for ch in CHANNELS:
+        norm = getattr(ReviewSnapshot, f"{ch}_normalized")
+        count = func.coalesce(getattr(ReviewSnapshot, f"{ch}_count"), 0)
+        columns += [
+            func.count(norm).label(f"{ch}_hotels"),
+            _weighted(norm, count).label(f"{ch}_score"),
+        ]
+    return db.execute(select(*columns).where(_latest(group_id))).one()._asdict()
+
+
+def _best_and_worst(db: Session, group_id: int) -> tuple[dict | None, dict | None]:
+    wa = ReviewSnapshot.weighted_average
+    ranked = (
+        select(
+            ReviewSnapshot.hotel_id,
+            Hotel.name,
+            wa,
+            func.row_number().over(order_by=(wa.desc(), Hotel.name)).label("best"),
+            func.row_number().over(order_by=(wa.asc(), Hotel.name)).label("worst"),
+        )
+        .join(Hotel, Hotel.id == ReviewSnapshot.hotel_id)
+        .where(_latest(group_id), wa.is_not(None))
+        .subquery()
+    )
+    best = worst = None
+    for row in db.execute(
+        select(ranked).where((ranked.c.best == 1) | (ranked.c.worst == 1))
+    ):
+        member = {
+            "hotel_id": row.hotel_id,
+            "name": row.name,
+            "weighted_average": row.weighted_average,
+        }
+        if row.best == 1:
+            best = member
+        if row.worst == 1:
+            worst = member
+    return best, worst
+
+
+def _series(db: Session, group_id: int, bucket: Bucket) -> dict:
+    """Count-weighted group score per bucket.
+
+    SQL picks each member's last snapshot in every bucket; members carry
+    their last known score forward through buckets where they weren't
+    collected, so the line doesn't jump as collection schedules differ.
+    """
+    at = bucket_expr(ReviewSnapshot.collected_at, bucket, db.get_bind().dialect.name)
+    per_bucket = (
+        select(
+            ReviewSnapshot.hotel_id,
+            at.label("at"),
+            ReviewSnapshot.weighted_average,
+            _review_count().label("reviews"),
+            func.row_number()
+            .over(
+                partition_by=(ReviewSnapshot.hotel_id, at),
+                order_by=(ReviewSnapshot.collected_at.desc(), ReviewSnapshot.id.desc()),
+            )
+            .label("rn"),
+        )
+        .where(
+            ReviewSnapshot.hotel_id.in_(_members(group_id)),
+            ReviewSnapshot.weighted_average.is_not(None),
+        )
+        .subquery()
+    )
+    rows = db.execute(
+        select(per_bucket).where(per_bucket.c.rn == 1).order_by(per_bucket.c.at)
+    ).all()
+
+    current: dict[int, tuple[float, int]] = {}
+    out = {"bucket": bucket, "t": [], "score": [], "hotels": []}
+    for i, row in enumerate(rows):
+        current[row.hotel_id] = (row.weighted_average, row.reviews or 0)
+        if i + 1 < len(rows) and rows[i + 1].at == row.at:
+            continue
+        weight = sum(w for _, w in current.values())
+        if weight:
+            score = sum(v * w for v, w in current.values()) / weight
+        else:
+            score = sum(v for v, _ in current.values()) / len(current)
+        out["t"].append(str(row.at))
+        out["score"].append(round(score, 2))
+        out["hotels"].append(len(current))
+    return out
+
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 2)
+
+
+def _compute(db: Session, group_id: int, bucket: Bucket) -> dict:
+    agg = _aggregates(db, group_id)
+    best, worst = _best_and_worst(db, group_id)
+    hotel_count = agg["hotel_count"]
+    return {
+        "group_id": group_id,
+        "hotel_count": hotel_count,
+        "scored_hotels": agg["scored_hotels"],
+        "score": _round(agg["score"]),
+        "review_count": agg["review_count"],
+        "channels": {
+            ch: {
+                "hotels": agg[f"{ch}_hotels"],
+                "coverage": round(agg[f"{ch}_hotels"] / hotel_count, 3)
+                if hotel_count
+                else None,
+                "score": _round(agg[f"{ch}_score"]),
+            }
+            for ch in CHANNELS
+        },
+        "best": best,
+        "worst": worst,
+        "series": _series(db, group_id, bucket),
+    }
+
+
+def group_summary(db: Session, group: HotelGroup, bucket: Bucket = "week") -> dict:
+    """Aggregate scores and score history for a group, cached until it changes."""
+    key = cache_key(db, group, bucket)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    summary = _compute(db, group.id, bucket)
+    with _cache_lock:
+        _cache[key] = summary
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return summary
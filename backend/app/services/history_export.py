@@ -0,0 +1,208 @@
+"""Full snapshot-history export in row and columnar formats.
+
+Rows are read from the database ``BATCH_ROWS`` at a time (a server-side
+cursor on Postgres) and encoded batch by batch, so every format streams with
+flat memory: CSV and NDJSON as text, gzip'd CSV through one running
+compressor, Parquet as one row group per batch and Arrow as an IPC stream.
+"""
+
+import csv
+import io
+import json
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import Hotel, ReviewSnapshot
+from .rollups import naive_utc
+from .scoring import CHANNELS
+
+BATCH_ROWS = 10_000
+
+SCHEMA = pa.schema(
+    [
+        ("snapshot_id", pa.int64()),
+        ("hotel_id", pa.int64()),
+        ("hotel_name", pa.string()),
+        ("collected_at", pa.timestamp("us")),
+        ("confirmed_at", pa.timestamp("us")),
+        ("source", pa.string()),
+        *(
+            field
+            for ch in CHANNELS
+            for field in (
+                (f"{ch}_score", pa.float64()),
+                (f"{ch}_count", pa.int64()),
+                (f"{ch}_normalized", pa.float64()),
+            )
+        ),
+        ("weighted_average", pa.float64()),
+    ]
+)
+COLUMNS = SCHEMA.names
+
+# format -> (media type, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+def history_query(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    hotel_criteria: tuple = (),
+):
+    query = (
+        select(
+            ReviewSnapshot.id.label("snapshot_id"),
+            ReviewSnapshot.hotel_id,
+            Hotel.name.label("hotel_name"),
+            *(getattr(ReviewSnapshot, c) for c in COLUMNS[3:]),
+        )
+        .join(Hotel, Hotel.id == ReviewSnapshot.hotel_id)
+        .where(*hotel_criteria)
+        .order_by(
+            ReviewSnapshot.hotel_id, ReviewSnapshot.collected_at, ReviewSnapshot.id
+        )
+    )
+    if start is not None:
+        query = query.where(ReviewSnapshot.collected_at >= naive_utc(start))
+    if end is not None:
+        query = query.where(ReviewSnapshot.collected_at < naive_utc(end))
+    return query
+
+
+def _batches(db: Session, query) -> Iterator[list]:
+    result = db.execute(query.execution_options(yield_per=BATCH_ROWS))
+    yield from result.partitions()
+
+
+class _Sink:
+    """Write-only file that hands bytes on instead of keeping them.
+
+    Parquet records column chunk offsets with ``tell()``, so the position
+    keeps counting even though written data is drained after every batch.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _csv(batches: Iterator[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        for row in batch:
+            writer.writerow(
+                [
+                    v.isoformat()
+                    if isinstance(v, datetime)
+                    else ("" if v is None else v)
+                    for v in row
+                ]
+            )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _csv_gz(batches: Iterator[list]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in _csv(batches):
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _ndjson(batches: Iterator[list]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, row)), default=_json_default) + "\n"
+            for row in batch
+        ).encode("utf-8")
+
+
+def _record_batch(batch: list) -> pa.RecordBatch:
+    columns = list(zip(*batch))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(col, type=f.type) for col, f in zip(columns, SCHEMA)],
+        schema=SCHEMA,
+    )
+
+
+def _parquet(batches: Iterator[list]) -> Iterator[bytes]:
+    sink = _Sink()
+    with pq.ParquetWriter(sink, SCHEMA, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_batch(_record_batch(batch))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _arrow(batches: Iterator[list]) -> Iterator[bytes]:
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, SCHEMA) as writer:
+        yield sink.drain()
+        for batch in batches:
+            writer.write_batch(_record_batch(batch))
+            yield sink.drain()
+    yield sink.drain()
+
+
+_ENCODERS = {
+    "csv": _csv,
+    "csv.gz": _csv_gz,
+    "ndjson": _ndjson,
+    "parquet": _parquet,
+    "arrow": _arrow,
+}
+
+
+def export_history(db: Session, format: str, query) -> Iterator[bytes]:
+    """Encoded chunks of ``query``'s rows; closes ``db`` when done."""
+    try:
+        for chunk in _ENCODERS[format](_batches(db, query)):
+            if chunk:
+                yield chunk
+    finally:
+        db.close()
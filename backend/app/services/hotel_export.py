@@ -0,0 +1,292 @@
+"""Latest-scores hotel CSV export, cached on disk per data version.
+
+A generated export is written through to ``EXPORT_CACHE_DIR`` as it streams
+out, under a name made of its scope (every hotel, or one group), the scoring
+strategy and the scope's data version: the newest snapshot id (of the
+group's members, for a group) plus the hotels counter from ``versions``, and
+the group's ``membership_version``. Repeat downloads of an unchanged scope are
+served from that file; a new snapshot, hotel change or membership change
+moves the version on, so stale files are simply never looked up again and
+are pruned when their replacement is built.
+"""
+
+import csv
+import glob
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from collections.abc import Iterator
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..models import (
+    Hotel,
+    HotelGroup,
+    HotelGroupMembership,
+    ReviewSnapshot,
+    StrategyScore,
+)
+from . import versions
+from .snapshots import hotels_with_latest, latest_ids
+from .strategies import DEFAULT_STRATEGY, STRATEGIES, Strategy, strategy_scores
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv(
+    "EXPORT_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "export_cache"),
+)
+
+# Rows fetched per round trip and written per response chunk.
+EXPORT_BATCH = 1000
+
+CSV_HEADERS = [
+    "Name",
+    "City",
+    "State",
+    "Keys",
+    "Kind",
+    "Brand",
+    "Parent",
+    "Google Score",
+    "Google Count",
+    "Google Normalized",
+    "Booking Score",
+    "Booking Count",
+    "Booking Normalized",
+    "Expedia Score",
+    "Expedia Count",
+    "Expedia Normalized",
+    "TripAdvisor Score",
+    "TripAdvisor Count",
+    "TripAdvisor Normalized",
+    "Weighted Average",
+]
+
+PLAIN = "plain"  # strategy part of the cache name when no strategy column
+
+
+def _hotel_to_row(hotel, latest):
+    return [
+        hotel.name,
+        hotel.city,
+        hotel.state,
+        hotel.keys,
+        hotel.kind,
+        hotel.brand,
+        hotel.parent,
+        latest.google_score if latest else "",
+        latest.google_count if latest else "",
+        latest.google_normalized if latest else "",
+        latest.booking_score if latest else "",
+        latest.booking_count if latest else "",
+        latest.booking_normalized if latest else "",
+        latest.expedia_score if latest else "",
+        latest.expedia_count if latest else "",
+        latest.expedia_normalized if latest else "",
+        latest.tripadvisor_score if latest else "",
+        latest.tripadvisor_count if latest else "",
+        latest.tripadvisor_normalized if latest else "",
+        latest.weighted_average if latest else "",
+    ]
+
+
+def _warm_scores(db: Session, hotel_criteria: list, scoring: Strategy) -> None:
+    """Compute and cache ``scoring`` for every latest snapshot in scope that
+    has no cached score yet, ``EXPORT_BATCH`` at a time.
+
+    Runs before the export opens its streaming cursor: SQLite can't commit
+    the cache write while that cursor holds the database, so the streaming
+    pass should only read the cache.
+    """
+    if scoring.name == DEFAULT_STRATEGY:
+        return
+    cached = (
+        select(StrategyScore.snapshot_id)
+        .where(
+            StrategyScore.strategy == scoring.name,
+            StrategyScore.snapshot_id == ReviewSnapshot.id,
+        )
+        .exists()
+    )
+    ids = db.scalars(
+        select(ReviewSnapshot.id).where(
+            ReviewSnapshot.id.in_(latest_ids(*hotel_criteria)), ~cached
+        )
+    ).all()
+    for start in range(0, len(ids), EXPORT_BATCH):
+        batch = ids[start : start + EXPORT_BATCH]
+        snapshots = db.scalars(
+            select(ReviewSnapshot).where(ReviewSnapshot.id.in_(batch))
+        ).all()
+        strategy_scores(db, scoring, snapshots)
+
+
+def csv_chunks(
+    db: Session, hotel_criteria: list, scoring: Optional[Strategy] = None
+) -> Iterator[bytes]:
+    """Encoded CSV, one chunk per batch of hotels.
+
+    Hotels and their latest snapshots come from a single joined query read
+    ``EXPORT_BATCH`` rows at a time (a server-side cursor on Postgres), so
+    memory stays flat and the header goes out before the first row is read.
+    Strategy scores are warmed before that query starts.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    try:
+        headers = CSV_HEADERS + ([f"Score ({scoring.name})"] if scoring else [])
+        writer.writerow(headers)
+        yield flush()
+        if scoring:
+            _warm_scores(db, hotel_criteria, scoring)
+        query = hotels_with_latest(*hotel_criteria).order_by(Hotel.name, Hotel.id)
+        result = db.execute(query.execution_options(yield_per=EXPORT_BATCH))
+        for batch in result.partitions():
+            scores = {}
+            if scoring:
+                latest = [snap for _, snap in batch if snap is not None]
+                scores = strategy_scores(db, scoring, latest)
+            for hotel, snap in batch:
+                row = _hotel_to_row(hotel, snap)
+                if scoring:
+                    score = scores.get(snap.id) if snap else None
+                    row.append("" if score is None else score)
+                writer.writerow(row)
+            yield flush()
+    finally:
+        db.close()
+
+
+def _members(group_id: int):
+    return select(HotelGroupMembership.hotel_id).where(
+        HotelGroupMembership.group_id == group_id
+    )
+
+
+def scope_criteria(group_id: int | None) -> list:
+    return [] if group_id is None else [Hotel.id.in_(_members(group_id))]
+
+
+def data_version(db: Session, group: HotelGroup | None) -> str:
+    newest = select(func.max(ReviewSnapshot.id))
+    if group is not None:
+        newest = newest.where(ReviewSnapshot.hotel_id.in_(_members(group.id)))
+    newest_id, hotels = db.execute(
+        select(newest.scalar_subquery(), versions.current())
+    ).one()
+    version = f"{newest_id or 0}-{hotels or 0}"
+    return version if group is None else f"{version}-{group.membership_version or 0}"
+
+
+class CachedExport:
+    """One export artifact: where it lives and the ETag it is served under."""
+
+    def __init__(self, group_id: int | None, scoring: Optional[Strategy], version):
+        self.scope = "all" if group_id is None else f"group-{group_id}"
+        self.strategy = scoring.name if scoring else PLAIN
+        self.name = f"{self.scope}__{self.strategy}__{version}"
+        self.path = os.path.join(CACHE_DIR, f"{self.name}.csv")
+        self.etag = '"' + hashlib.sha1(self.name.encode()).hexdigest()[:20] + '"'
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def write_through(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Yield ``chunks`` while copying them to a temp file, which replaces
+        the artifact only once the export has been generated in full."""
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=".", suffix=".tmp")
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp, self.path)
+            complete = True
+            self._prune()
+        finally:
+            if not complete and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def build(self, chunks: Iterator[bytes]) -> None:
+        for _ in self.write_through(chunks):
+            pass
+
+    def _prune(self) -> None:
+        """Remove older versions of this scope and strategy."""
+        for path in glob.glob(
+            os.path.join(glob.escape(CACHE_DIR), f"{self.scope}__{self.strategy}__*")
+        ):
+            if path != self.path:
+                _remove(path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clear() -> None:
+    """Drop every cached export, for rewrites that keep the data version
+    (such as a rescore)."""
+    for path in glob.glob(os.path.join(glob.escape(CACHE_DIR), "*.csv")):
+        _remove(path)
+
+
+def _cached_scopes() -> set[tuple[str, str]]:
+    scopes = set()
+    for path in glob.glob(os.path.join(glob.escape(CACHE_DIR), "*.csv")):
+        scope, _, rest = os.path.basename(path).partition("__")
+        strategy, _, _ = rest.partition("__")
+        scopes.add((scope, strategy))
+    return scopes
+
+
+def refresh(bind: Engine) -> int:
+    """Rebuild every previously cached export whose data version moved on.
+
+    Runs as a background task after snapshot writes, so the next download
+    of an export someone already uses is a cache hit. Returns the number
+    of artifacts rebuilt.
+    """
+    rebuilt = 0
+    for scope, strategy in sorted(_cached_scopes()):
+        db = Session(bind=bind)
+        try:
+            group = None
+            if scope != "all":
+                group = db.get(HotelGroup, int(scope.removeprefix("group-")))
+                if group is None:
+                    for path in glob.glob(
+                        os.path.join(glob.escape(CACHE_DIR), f"{scope}__*")
+                    ):
+                        _remove(path)
+                    continue
+            scoring = STRATEGIES.get(strategy)
+            group_id = group.id if group else None
+            artifact = CachedExport(group_id, scoring, data_version(db, group))
+            if artifact.exists():
+                continue
+            artifact.build(csv_chunks(db, scope_criteria(group_id), scoring))
+            rebuilt += 1
+        except Exception:
+            log.exception("Rebuilding cached export %s/%s failed", scope, strategy)
+        finally:
+            db.close()
+    return rebuilt
@@ -0,0 +1,112 @@
+import json
+import os
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import IdempotencyKey, User
+
+IDEMPOTENCY_WINDOW = timedelta(hours=int(os.getenv("IDEMPOTENCY_WINDOW_HOURS", "24")))
+# A claim still unfinished after this long belongs to a worker that died.
+CLAIM_TIMEOUT = timedelta(
+    minutes=int(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT_MINUTES", "15"))
+)
+
+
+def _as_utc(dt: datetime) -> datetime:
+    # SQLite hands back naive datetimes; everything we store is UTC.
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _claim(
+    db: Session, user: User, key: str, scope: str, fingerprint: str | None
+) -> IdempotencyKey | JSONResponse:
+    """Reserve the key for this request, or return the stored response to replay."""
+    record = (
+        db.query(IdempotencyKey)
+        .filter(IdempotencyKey.user_id == user.id, IdempotencyKey.key == key)
+        .first()
+    )
+    if record is not None:
+        age = datetime.now(timezone.utc) - _as_utc(record.created_at)
+        if age > IDEMPOTENCY_WINDOW or (
+            record.status_code is None and age > CLAIM_TIMEOUT
+        ):
+            db.delete(record)
+            db.commit()
+        elif record.scope != scope or record.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request",
+            )
+        elif record.status_code is None:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+            )
+        else:
+            return JSONResponse(
+                content=json.loads(record.response_body),
+                status_code=record.status_code,
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+    record = IdempotencyKey(
+        user_id=user.id, key=key, scope=scope, fingerprint=fingerprint
+    )
+    db.add(record)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker claimed the same key between our read and insert.
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+        )
+    return record
+
+
+def run_idempotent(
+    db: Session,
+    user: User,
+    key: str | None,
+    scope: str,
+    fn: Callable[[], dict],
+    fingerprint: str | None = None,
+):
+    """Run ``fn`` once per (user, Idempotency-Key) within the window.
+
+    Repeats return the stored response instead of redoing the work. Keys live
+    in the database so the guarantee holds across workers. If ``fn`` fails the
+    key is released so the client can retry.
+    """
+    if not key:
+        return fn()
+
+    claimed = _claim(db, user, key, scope, fingerprint)
+    if isinstance(claimed, JSONResponse):
+        return claimed
+    record_id = claimed.id
+
+    try:
+        result = fn()
+    except Exception:
+        db.rollback()
+        db.query(IdempotencyKey).filter(IdempotencyKey.id == record_id).delete()
+        db.commit()
+        raise
+
+    db.query(IdempotencyKey).filter(IdempotencyKey.id == record_id).update(
+        {
+            "status_code": 200,
+            "response_body": json.dumps(jsonable_encoder(result)),
+        }
+    )
+    db.commit()
+    return result
@@ -0,0 +1,129 @@
+"""Snapshot ingestion from external pipelines.
+
+Rows arrive already validated, a batch at a time. Each batch costs a fixed
+number of statements however large it is: hotels are resolved with one
+query per key kind (id, name), already-ingested (hotel, collected_at) pairs
+are found with one query, scores are computed columnar with
+``compute_scores_batch`` and the new rows go in as one multi-row INSERT
+whose RETURNING rows feed the daily rollups directly. Rows may be backdated,
+so history-dependent strategy scores cached for each hotel's later snapshots
+are dropped with one more statement.
+"""
+
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from ..models import Hotel, ReviewSnapshot
+from .rollups import ROLLUP_SOURCES, update_rollups
+from .scoring import CHANNELS, compute_scores_batch
+from .snapshots import RAW_FIELDS
+from .strategies import forget_later_scores
+
+INGEST_BATCH = 500
+SOURCE = "ingest"
+
+
+def _resolve_hotels(db: Session, rows: list[dict]) -> tuple[set[int], dict[str, int]]:
+    ids = {r["hotel_id"] for r in rows if r.get("hotel_id") is not None}
+    names = {r["hotel"] for r in rows if r.get("hotel_id") is None}
+    known = set(db.scalars(select(Hotel.id).where(Hotel.id.in_(ids)))) if ids else set()
+    by_name: dict[str, int] = {}
+    if names:
+        for hotel_id, name in db.execute(
+            select(Hotel.id, Hotel.name).where(Hotel.name.in_(names)).order_by(Hotel.id)
+        ):
+            by_name.setdefault(name, hotel_id)
+    return known, by_name
+
+
+def _existing(db: Session, keys: set[tuple[int, object]]) -> set[tuple]:
+    if not keys:
+        return set()
+    return set(
+        db.execute(
+            select(ReviewSnapshot.hotel_id, ReviewSnapshot.collected_at).where(
+                tuple_(ReviewSnapshot.hotel_id, ReviewSnapshot.collected_at).in_(keys)
+            )
+        ).tuples()
+    )
+
+
+def _value(x: float) -> float | None:
+    return None if np.isnan(x) else float(x)
+
+
+def ingest_batch(
+    db: Session, rows: list[tuple[int, dict]]
+) -> tuple[int, int, list[dict]]:
+    """Insert one batch of ``(line number, fields)`` rows and commit.
+
+    ``fields`` hold ``hotel_id`` or ``hotel`` (exact name), a naive-UTC
+    ``collected_at`` and any ``<channel>_score`` / ``<channel>_count``.
+    Rows repeating an existing (hotel, collected_at) are skipped, so a
+    pipeline can safely resend. Returns (inserted, skipped, errors).
+    """
+    known, by_name = _resolve_hotels(db, [fields for _, fields in rows])
+    errors = []
+    resolved = []
+    for line, fields in rows:
+        hotel_id = fields.get("hotel_id")
+        if hotel_id is None:
+            hotel_id = by_name.get(fields["hotel"])
+        elif hotel_id not in known:
+            hotel_id = None
+        if hotel_id is None:
+            errors.append({"line": line, "error": "Hotel not found"})
+            continue
+        resolved.append((hotel_id, fields))
+
+    existing = _existing(db, {(h, f["collected_at"]) for h, f in resolved})
+    new = []
+    for hotel_id, fields in resolved:
+        key = (hotel_id, fields["collected_at"])
+        if key not in existing:
+            existing.add(key)
+            new.append((hotel_id, fields))
+    skipped = len(resolved) - len(new)
+    if not new:
+        return 0, skipped, errors
+
+    derived = compute_scores_batch(
+        {
+            ch: np.array([f.get(f"{ch}_score") for _, f in new], dtype=float)
+            for ch in CHANNELS
+        },
+        {
+            ch: np.array([f.get(f"{ch}_count") for _, f in new], dtype=float)
+            for ch in CHANNELS
+        },
+    )
+    values = [
+        {
+            "hotel_id": hotel_id,
+            "collected_at": fields["collected_at"],
+            "source": SOURCE,
+            **{field: fields.get(field) for field in RAW_FIELDS},
+            **{k: _value(v[i]) for k, v in derived.items()},
+        }
+        for i, (hotel_id, fields) in enumerate(new)
+    ]
+    inserted = db.execute(
+        insert(ReviewSnapshot).returning(
+            ReviewSnapshot.id,
+            ReviewSnapshot.hotel_id,
+            ReviewSnapshot.collected_at,
+            *(getattr(ReviewSnapshot, attr) for attr in ROLLUP_SOURCES.values()),
+        ),
+        values,
+    ).all()
+    update_rollups(db, inserted)
+    starts: dict[int, datetime] = {}
+    for row in inserted:
+        if row.hotel_id not in starts or row.collected_at < starts[row.hotel_id]:
+            starts[row.hotel_id] = row.collected_at
+    forget_later_scores(db, starts)
+    db.commit()
+    return len(inserted), skipped, errors
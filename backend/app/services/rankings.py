@@ -0,0 +1,170 @@
+"""Portfolio rankings: rank and percentile of each hotel's latest scores.
+
+Rankings live in ``hotel_rankings`` and are rebuilt in bulk with RANK,
+ROW_NUMBER and PERCENT_RANK window functions whenever the data version
+(newest snapshot id and the hotels counter from ``versions``) has moved on
+since the last build, which ``rankings_builds`` records even when it
+produced no rows.
+Requests only read precomputed rows; the sort happens once per change.
+"""
+
+import threading
+
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import Hotel, HotelRanking, RankingsBuild, ReviewSnapshot
+from . import versions
+from .scoring import CHANNELS
+from .snapshots import latest_ids
+
+METRICS = ("weighted_average",) + tuple(f"{ch}_normalized" for ch in CHANNELS)
+SCOPES = {"all": None, "state": Hotel.state, "brand": Hotel.brand}
+
+_refresh_lock = threading.Lock()
+
+
+def data_version(db: Session) -> str:
+    newest = select(func.max(ReviewSnapshot.id)).scalar_subquery()
+    newest_id, hotels = db.execute(select(newest, versions.current())).one()
+    return f"{newest_id or 0}:{hotels or 0}"
+
+
+def _stored_version(db: Session) -> str | None:
+    return db.scalar(select(RankingsBuild.data_version))
+
+
+def _rebuild(db: Session, version: str) -> None:
+    db.query(RankingsBuild).delete()
+    db.add(RankingsBuild(id=1, data_version=version))
+    db.query(HotelRanking).delete()
+    columns = [
+        "metric",
+        "scope",
+        "scope_value",
+        "hotel_id",
+        "value",
+        "rank",
+        "position",
+        "percentile",
+        "total",
+        "data_version",
+    ]
+    for metric in METRICS:
+        value = getattr(ReviewSnapshot, metric)
+        for scope, column in SCOPES.items():
+            query = (
+                select(
+                    literal(metric),
+                    literal(scope),
+                    column if column is not None else literal(""),
+                    ReviewSnapshot.hotel_id,
+                    value,
+                    func.rank().over(partition_by=column, order_by=value.desc()),
+                    func.row_number().over(
+                        partition_by=column,
+                        order_by=(value.desc(), Hotel.name, Hotel.id),
+                    ),
+                    func.percent_rank().over(partition_by=column, order_by=value),
+                    func.count().over(partition_by=column),
+                    literal(version),
+                )
+                .join(Hotel, Hotel.id == ReviewSnapshot.hotel_id)
+                .where(ReviewSnapshot.id.in_(latest_ids()), value.is_not(None))
+            )
+            if column is not None:
+                query = query.where(column.is_not(None))
+            db.execute(insert(HotelRanking).from_select(columns, query))
+    db.commit()
+
+
+def ensure_rankings(db: Session) -> None:
+    """Rebuild rankings if snapshots or hotels changed since the last build."""
+    version = data_version(db)
+    if _stored_version(db) == version:
+        return
+    with _refresh_lock:
+        if _stored_version(db) == version:
+            return
+        try:
+            _rebuild(db, version)
+        except IntegrityError:
+            # Another process rebuilt concurrently; its rows are as good.
+            db.rollback()
+
+
+def invalidate_rankings(db: Session) -> None:
+    """Force a rebuild on next read, for rewrites that keep snapshot ids
+    (such as a rescore)."""
+    db.query(RankingsBuild).delete()
+    db.commit()
+
+
+def _percentile(value: float) -> float:
+    return round(value * 100, 1)
+
+
+def hotel_ranks(db: Session, hotel_id: int) -> dict[str, dict[str, dict]]:
+    """``{metric: {scope: {scope_value, rank, percentile, total}}}`` for a hotel."""
+    ensure_rankings(db)
+    out: dict[str, dict[str, dict]] = {}
+    for r in db.scalars(select(HotelRanking).where(HotelRanking.hotel_id == hotel_id)):
+        out.setdefault(r.metric, {})[r.scope] = {
+            "scope_value": r.scope_value or None,
+            "rank": r.rank,
+            "percentile": _percentile(r.percentile),
+            "total": r.total,
+        }
+    return out
+
+
+def leaderboard(
+    db: Session,
+    metric: str,
+    scope: str,
+    n: int,
+    scope_value: str | None = None,
+) -> list[dict]:
+    """Top and bottom ``n`` hotels in each scope partition, best first/worst first."""
+    ensure_rankings(db)
+    query = (
+        select(HotelRanking, Hotel)
+        .join(Hotel, Hotel.id == HotelRanking.hotel_id)
+        .where(
+            HotelRanking.metric == metric,
+            HotelRanking.scope == scope,
+            (HotelRanking.position <= n)
+            | (HotelRanking.position > HotelRanking.total - n),
+        )
+        .order_by(HotelRanking.scope_value, HotelRanking.position)
+    )
+    if scope_value is not None:
+        query = query.where(HotelRanking.scope_value == scope_value)
+
+    boards: dict[str, dict] = {}
+    for ranking, hotel in db.execute(query):
+        board = boards.setdefault(
+            ranking.scope_value,
+            {
+                "scope_value": ranking.scope_value or None,
+                "total": ranking.total,
+                "top": [],
+                "bottom": [],
+            },
+        )
+        entry = {
+            "hotel_id": hotel.id,
+            "name": hotel.name,
+            "city": hotel.city,
+            "state": hotel.state,
+            "brand": hotel.brand,
+            "value": ranking.value,
+            "rank": ranking.rank,
+            "percentile": _percentile(ranking.percentile),
+        }
+        if ranking.position <= n:
+            board["top"].append(entry)
+        if ranking.position > ranking.total - n:
+            board["bottom"].insert(0, entry)
+    return list(boards.values())
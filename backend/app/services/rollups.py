@@ -0,0 +1,122 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import ReviewSnapshot, SnapshotDailyRollup
+from .scoring import CHANNELS
+
+# Rollup column prefix -> snapshot attribute it aggregates.
+ROLLUP_SOURCES = {
+    **{ch: f"{ch}_normalized" for ch in CHANNELS},
+    "weighted_average": "weighted_average",
+}
+
+
+def naive_utc(value: datetime) -> datetime:
+    """``value`` as the naive UTC that ``collected_at`` is stored in; naive
+    input is taken to be UTC already."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _day(snapshot) -> date:
+    return naive_utc(snapshot.collected_at).date()
+
+
+def _fold(rollup: SnapshotDailyRollup, snapshot) -> None:
+    """Merge one snapshot (ORM row or result row) into its day's rollup."""
+    at = naive_utc(snapshot.collected_at)
+    is_last = rollup.last_collected_at is None or (at, snapshot.id) >= (
+        rollup.last_collected_at,
+        rollup.last_snapshot_id or 0,
+    )
+    rollup.snapshot_count = (rollup.snapshot_count or 0) + 1
+    for prefix, attr in ROLLUP_SOURCES.items():
+        value = getattr(snapshot, attr)
+        if is_last:
+            setattr(rollup, f"{prefix}_last", value)
+        if value is None:
+            continue
+        low = getattr(rollup, f"{prefix}_min")
+        high = getattr(rollup, f"{prefix}_max")
+        if low is None or value < low:
+            setattr(rollup, f"{prefix}_min", value)
+        if high is None or value > high:
+            setattr(rollup, f"{prefix}_max", value)
+    if is_last:
+        rollup.last_snapshot_id = snapshot.id
+        rollup.last_collected_at = at
+
+
+def _new_rollup(hotel_id: int, day: date) -> SnapshotDailyRollup:
+    return SnapshotDailyRollup(hotel_id=hotel_id, day=day, snapshot_count=0)
+
+
+def update_rollups(db: Session, snapshots: list[ReviewSnapshot]) -> None:
+    """Fold newly inserted snapshots into their daily rollups.
+
+    Snapshots must already be flushed so ids and ``collected_at`` are set.
+    Existing rollups for the affected days are loaded in one query. The
+    caller commits.
+    """
+    if not snapshots:
+        return
+    hotel_ids = {s.hotel_id for s in snapshots}
+    days = {_day(s) for s in snapshots}
+    rollups = {
+        (r.hotel_id, r.day): r
+        for r in db.scalars(
+            select(SnapshotDailyRollup).where(
+                SnapshotDailyRollup.hotel_id.in_(hotel_ids),
+                SnapshotDailyRollup.day.in_(days),
+            )
+        )
+    }
+    for snapshot in snapshots:
+        key = (snapshot.hotel_id, _day(snapshot))
+        if key not in rollups:
+            rollups[key] = _new_rollup(*key)
+            db.add(rollups[key])
+        _fold(rollups[key], snapshot)
+
+
+def rebuild_rollups(db: Session, hotels_per_batch: int = 100) -> int:
+    """Recompute every rollup from raw snapshots, a batch of hotels at a time.
+
+    Used to backfill the table and after bulk rewrites such as a rescore.
+    Commits after each batch. Returns the number of rollup rows written.
+    """
+    db.query(SnapshotDailyRollup).delete()
+    db.commit()
+    hotel_ids = db.scalars(
+        select(ReviewSnapshot.hotel_id).distinct().order_by(ReviewSnapshot.hotel_id)
+    ).all()
+    columns = [
+        ReviewSnapshot.id,
+        ReviewSnapshot.hotel_id,
+        ReviewSnapshot.collected_at,
+        *(getattr(ReviewSnapshot, attr) for attr in ROLLUP_SOURCES.values()),
+    ]
+    total = 0
+    for i in range(0, len(hotel_ids), hotels_per_batch):
+        batch = hotel_ids[i : i + hotels_per_batch]
+        rollups: dict[tuple[int, date], SnapshotDailyRollup] = {}
+        rows = db.execute(
+            select(*columns)
+            .where(
+                ReviewSnapshot.hotel_id.in_(batch),
+                ReviewSnapshot.collected_at.is_not(None),
+            )
+            .order_by(ReviewSnapshot.collected_at, ReviewSnapshot.id)
+        )
+        for row in rows:
+            key = (row.hotel_id, _day(row))
+            if key not in rollups:
+                rollups[key] = _new_rollup(*key)
+            _fold(rollups[key], row)
+        db.add_all(rollups.values())
+        db.commit()
+        total += len(rollups)
+    return total
@@ -1,4 +1,8 @@
-from ..models import ReviewSnapshot
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from ..models import ReviewSnapshot, StrategyScore
 
 
 def normalize_score(score: float | None, source: str) -> float | None:
@@ -45,3 +49,128 @@ def compute_scores(snapshot: ReviewSnapshot) -> None:
     snapshot.weighted_average = (
         round(weighted_sum / total_count, 2) if total_count > 0 else None
     )
+
+
+# ---- Batch (columnar) scoring ----
+
+CHANNELS = ("google", "booking", "expedia", "tripadvisor")
+FIVE_POINT_CHANNELS = ("google", "tripadvisor")
+
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """Vectorized ``round(x, 2)`` with Python's exact semantics.
+
+    ``np.round`` scales by 100 first, which can land on the wrong side of a
+    half-way point. Those few near-ties are redone with the builtin.
+    """
+    scaled = values * 100
+    out = np.rint(scaled) / 100
+    frac = np.abs(scaled - np.floor(scaled) - 0.5)
+    for i in np.flatnonzero(frac < 1e-6):
+        out[i] = round(float(values[i]), 2)
+    return out
+
+
+def effective_counts(counts: dict[str, np.ndarray], n: int) -> dict[str, np.ndarray]:
+    """Per-channel review counts with missing/zero counts imputed as the
+    rounded mean of the known ones (or 1), as in ``compute_scores``."""
+    known_sum = np.zeros(n)
+    known_n = np.zeros(n)
+    for ch in CHANNELS:
+        c = counts.get(ch, np.full(n, np.nan))
+        known = c > 0  # NaN compares False
+        known_sum += np.where(known, c, 0)
+        known_n += known
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_count = np.where(known_n > 0, np.rint(known_sum / known_n), 1.0)
+    effective = {}
+    for ch in CHANNELS:
+        c = counts.get(ch, np.full(n, np.nan))
+        effective[ch] = np.where(c > 0, c, avg_count)
+    return effective
+
+
+def compute_scores_batch(
+    scores: dict[str, np.ndarray], counts: dict[str, np.ndarray]
+) -> dict[str, np.ndarray]:
+    """Columnar version of ``compute_scores`` for a whole chunk of snapshots.
+
+    ``scores`` and ``counts`` map each channel to a float array with NaN for
+    missing values. Returns ``<channel>_normalized`` and ``weighted_average``
+    arrays (NaN where the scalar version gives None). Results match
+    ``compute_scores`` exactly: the same operations run in the same order.
+    """
+    n = len(next(iter(scores.values())))
+    normalized = {}
+    for ch in CHANNELS:
+        raw = scores.get(ch, np.full(n, np.nan))
+        normalized[ch] = _round2(raw * 2 if ch in FIVE_POINT_CHANNELS else raw)
+
+    effective = effective_counts(counts, n)
+
+    weighted_sum = np.zeros(n)
+    total_count = np.zeros(n)
+    for ch in CHANNELS:
+        present = ~np.isnan(normalized[ch])
+        weighted_sum = np.where(
+            present, weighted_sum + normalized[ch] * effective[ch], weighted_sum
+        )
+        total_count = np.where(present, total_count + effective[ch], total_count)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weighted = np.where(total_count > 0, weighted_sum / total_count, np.nan)
+    result = {f"{ch}_normalized": normalized[ch] for ch in CHANNELS}
+    result["weighted_average"] = _round2(weighted)
+    return result
+
+
+def _column(rows, attr: str) -> np.ndarray:
+    return np.array([getattr(r, attr) for r in rows], dtype=float)
+
+
+def _or_none(value: float) -> float | None:
+    return None if np.isnan(value) else float(value)
+
+
+def rescore_snapshots(db: Session, chunk_size: int = 5000) -> int:
+    """Recompute derived columns for every snapshot, streaming in id order.
+
+    Each chunk is scored with ``compute_scores_batch`` and written back with a
+    single bulk UPDATE, then committed. Cached strategy scores are derived
+    from these columns, so they are dropped first; daily rollups are too, and
+    callers should ``rebuild_rollups`` afterwards. Returns the number of rows
+    rescored.
+    """
+    db.query(StrategyScore).delete()
+    db.commit()
+    raw_columns = [
+        getattr(ReviewSnapshot, f"{ch}_{kind}")
+        for ch in CHANNELS
+        for kind in ("score", "count")
+    ]
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.execute(
+            select(ReviewSnapshot.id, *raw_columns)
+            .where(ReviewSnapshot.id > last_id)
+            .order_by(ReviewSnapshot.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        derived = compute_scores_batch(
+            {ch: _column(rows, f"{ch}_score") for ch in CHANNELS},
+            {ch: _column(rows, f"{ch}_count") for ch in CHANNELS},
+        )
+        db.execute(
+            update(ReviewSnapshot),
+            [
+                {"id": row.id, **{k: _or_none(v[i]) for k, v in derived.items()}}
+                for i, row in enumerate(rows)
+            ],
+        )
+        db.commit()
+        last_id = rows[-1].id
+        total += len(rows)
+    return total
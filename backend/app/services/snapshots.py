@@ -0,0 +1,180 @@
+import base64
+import binascii
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from ..models import Hotel, ReviewSnapshot
+from .rollups import naive_utc, update_rollups
+
+CHANNELS = ("google", "booking", "expedia", "tripadvisor")
+RAW_FIELDS = tuple(f"{ch}_{kind}" for ch in CHANNELS for kind in ("score", "count"))
+CHANGES_LAG = timedelta(seconds=float(os.getenv("CHANGES_LAG_SECONDS", "10")))
+
+
+def latest_snapshot_id(*criteria):
+    """Correlated scalar subquery: the id of the enclosing query's hotel's
+    newest snapshot among those matching ``criteria`` (NULL if none).
+
+    ``ORDER BY collected_at DESC, id DESC LIMIT 1`` per hotel reads one entry
+    off ``ix_review_snapshots_hotel_collected`` rather than numbering every
+    snapshot in the hotel's history to keep the first.
+    """
+    return (
+        select(ReviewSnapshot.id)
+        .where(ReviewSnapshot.hotel_id == Hotel.id, *criteria)
+        .order_by(ReviewSnapshot.collected_at.desc(), ReviewSnapshot.id.desc())
+        .limit(1)
+        .correlate(Hotel)
+        .scalar_subquery()
+    )
+
+
+def latest_ids(*hotel_criteria):
+    """``select`` of the latest snapshot id of each hotel matching
+    ``hotel_criteria``, for use with ``ReviewSnapshot.id.in_``."""
+    return (
+        select(latest_snapshot_id())
+        .select_from(Hotel)
+        .where(*hotel_criteria)
+        .correlate(None)
+    )
+
+
+def latest_snapshots(db: Session, hotel_ids: list[int]) -> dict[int, ReviewSnapshot]:
+    """Latest snapshot per hotel for the given ids, in one query."""
+    if not hotel_ids:
+        return {}
+    rows = db.scalars(
+        select(ReviewSnapshot).where(
+            ReviewSnapshot.id.in_(latest_ids(Hotel.id.in_(hotel_ids)))
+        )
+    )
+    return {s.hotel_id: s for s in rows}
+
+
+def encode_cursor(snapshot: ReviewSnapshot) -> str:
+    raw = f"{snapshot.collected_at.isoformat()}|{snapshot.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of ``encode_cursor``; raises ValueError on anything malformed."""
+    try:
+        at, _, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        return datetime.fromisoformat(at), int(id_)
+    except (UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def history_page(
+    db: Session, hotel_id: int, limit: int, cursor: str | None = None
+) -> tuple[list[ReviewSnapshot], str | None]:
+    """One newest-first page of a hotel's snapshots and the cursor for the next.
+
+    Keyset pagination on (collected_at, id) walks the
+    ``ix_review_snapshots_hotel_collected`` index, so each page costs the same
+    however deep into the history it is.
+    """
+    query = select(ReviewSnapshot).where(ReviewSnapshot.hotel_id == hotel_id)
+    if cursor is not None:
+        at, id_ = decode_cursor(cursor)
+        query = query.where(
+            or_(
+                ReviewSnapshot.collected_at < at,
+                and_(ReviewSnapshot.collected_at == at, ReviewSnapshot.id < id_),
+            )
+        )
+    rows = db.scalars(
+        query.order_by(
+            ReviewSnapshot.collected_at.desc(), ReviewSnapshot.id.desc()
+        ).limit(limit + 1)
+    ).all()
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def changes_page(
+    db: Session, since: int, limit: int
+) -> tuple[list[ReviewSnapshot], bool]:
+    """Snapshots with id above ``since`` in id order, at most ``limit`` of
+    them, and whether more are ready.
+
+    A range scan on the primary key, so a poll costs what was written since
+    the last one however large the table is. Ids are the insert order: rows
+    updated in place (a repeat observation moving ``confirmed_at``, a
+    rescore) keep their id and don't reappear.
+
+    With concurrent writers a lower id can commit after a higher one, and a
+    cursor already past it would never see it. So the page stops at the
+    first row inserted less than ``CHANGES_LAG`` ago: by the time a row is
+    that old, any transaction holding a lower id has committed, as long as
+    writes commit within ``CHANGES_LAG`` of inserting.
+    """
+    rows = db.scalars(
+        select(ReviewSnapshot)
+        .where(ReviewSnapshot.id > since)
+        .order_by(ReviewSnapshot.id)
+        .limit(limit + 1)
+    ).all()
+    cutoff = (datetime.now(timezone.utc) - CHANGES_LAG).replace(tzinfo=None)
+    for i, row in enumerate(rows):
+        if row.inserted_at is not None and naive_utc(row.inserted_at) > cutoff:
+            return rows[: min(i, limit)], False
+    return rows[:limit], len(rows) > limit
+
+
+def hotels_with_latest(*hotel_criteria):
+    """``select(Hotel, ReviewSnapshot)`` pairing each hotel matching
+    ``hotel_criteria`` with its newest snapshot (None if it has none), as one
+    joined query."""
+    return (
+        select(Hotel, ReviewSnapshot)
+        .outerjoin(ReviewSnapshot, ReviewSnapshot.id == latest_snapshot_id())
+        .where(*hotel_criteria)
+    )
+
+
+def same_values(a: ReviewSnapshot, b: ReviewSnapshot) -> bool:
+    return all(getattr(a, f) == getattr(b, f) for f in RAW_FIELDS)
+
+
+def record_snapshots(
+    db: Session, snapshots: list[ReviewSnapshot]
+) -> list[tuple[ReviewSnapshot, bool]]:
+    """Add new snapshots, collapsing repeats of each hotel's latest values.
+
+    When a snapshot has the same source and raw scores/counts as the hotel's
+    latest one, the latest row's ``confirmed_at`` is bumped instead of
+    inserting a duplicate, so history grows with score changes rather than
+    with collection frequency. New rows are flushed and folded into the daily
+    rollups. Returns (row, created) pairs in input order. The caller commits.
+    """
+    previous = latest_snapshots(db, [s.hotel_id for s in snapshots])
+    now = datetime.now(timezone.utc)
+    out = []
+    for snapshot in snapshots:
+        latest = previous.get(snapshot.hotel_id)
+        if (
+            latest is not None
+            and latest.source == snapshot.source
+            and same_values(latest, snapshot)
+        ):
+            latest.confirmed_at = now
+            out.append((latest, False))
+        else:
+            db.add(snapshot)
+            previous[snapshot.hotel_id] = snapshot
+            out.append((snapshot, True))
+    db.flush()
+    update_rollups(db, [s for s, created in out if created])
+    return out
+
+
+def record_snapshot(
+    db: Session, snapshot: ReviewSnapshot
+) -> tuple[ReviewSnapshot, bool]:
+    return record_snapshots(db, [snapshot])[0]
@@ -0,0 +1,242 @@
+"""Alternative aggregate scores, computed in batch and cached per snapshot.
+
+Each strategy turns a list of snapshots into an array of scores (NaN for
+"no score"). Results are cached in ``strategy_scores`` keyed by
+(strategy, snapshot id), so switching strategy only computes snapshots that
+have never been scored under it. Snapshot values never change after insert
+(``rescore_snapshots`` clears the cache when the formula does). Strategies
+that read a hotel's history also depend on earlier snapshots, so inserting
+one behind a hotel's later history drops their scores for those later
+snapshots (``forget_later_scores``).
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from ..models import ReviewSnapshot, StrategyScore
+from .scoring import CHANNELS, effective_counts
+
+DEFAULT_STRATEGY = "weighted"
+
+# Bayesian shrinkage: behave as if every hotel had PRIOR_WEIGHT extra reviews
+# at PRIOR_MEAN, so a handful of glowing reviews can't top the leaderboard.
+PRIOR_MEAN = 7.5
+PRIOR_WEIGHT = 50
+
+# Channel caps: no single channel contributes more than this many reviews.
+CHANNEL_COUNT_CAP = 500
+
+# Recency weighting: a snapshot's weight halves every RECENCY_HALF_LIFE.
+RECENCY_HALF_LIFE = timedelta(days=90)
+
+
+@dataclass(frozen=True)
+class Strategy:
+    name: str
+    description: str
+    compute: Callable[[Session, list[ReviewSnapshot]], np.ndarray]
+    # Reads the hotel's earlier snapshots, not just the one being scored.
+    uses_history: bool = False
+
+
+def _columns(snapshots: list[ReviewSnapshot]):
+    normalized = {
+        ch: np.array([getattr(s, f"{ch}_normalized") for s in snapshots], dtype=float)
+        for ch in CHANNELS
+    }
+    counts = {
+        ch: np.array([getattr(s, f"{ch}_count") for s in snapshots], dtype=float)
+        for ch in CHANNELS
+    }
+    return normalized, effective_counts(counts, len(snapshots))
+
+
+def _weighted_parts(normalized, effective, cap: float | None = None):
+    n = len(next(iter(normalized.values())))
+    weighted_sum = np.zeros(n)
+    total = np.zeros(n)
+    for ch in CHANNELS:
+        present = ~np.isnan(normalized[ch])
+        weight = np.minimum(effective[ch], cap) if cap else effective[ch]
+        weighted_sum += np.where(present, normalized[ch] * weight, 0)
+        total += np.where(present, weight, 0)
+    return weighted_sum, total
+
+
+def _weighted(db: Session, snapshots: list[ReviewSnapshot]) -> np.ndarray:
+    return np.array([s.weighted_average for s in snapshots], dtype=float)
+
+
+def _bayesian(db: Session, snapshots: list[ReviewSnapshot]) -> np.ndarray:
+    weighted_sum, total = _weighted_parts(*_columns(snapshots))
+    shrunk = (weighted_sum + PRIOR_MEAN * PRIOR_WEIGHT) / (total + PRIOR_WEIGHT)
+    return np.where(total > 0, np.round(shrunk, 2), np.nan)
+
+
+def _capped(db: Session, snapshots: list[ReviewSnapshot]) -> np.ndarray:
+    weighted_sum, total = _weighted_parts(*_columns(snapshots), cap=CHANNEL_COUNT_CAP)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, np.round(weighted_sum / total, 2), np.nan)
+
+
+def _recency(db: Session, snapshots: list[ReviewSnapshot]) -> np.ndarray:
+    """Exponentially decayed mean of each hotel's weighted averages up to
+    and including the snapshot. Fixed per snapshot id unless an earlier
+    snapshot is inserted later, which ``forget_later_scores`` handles."""
+    hotel_ids = {s.hotel_id for s in snapshots}
+    rows = db.execute(
+        select(
+            ReviewSnapshot.hotel_id,
+            ReviewSnapshot.collected_at,
+            ReviewSnapshot.weighted_average,
+        )
+        .where(
+            ReviewSnapshot.hotel_id.in_(hotel_ids),
+            ReviewSnapshot.weighted_average.is_not(None),
+        )
+        .order_by(ReviewSnapshot.hotel_id, ReviewSnapshot.collected_at)
+    ).all()
+    history: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+    if rows:
+        hotel_col = np.array([r.hotel_id for r in rows])
+        times = np.array([r.collected_at.timestamp() for r in rows])
+        values = np.array([r.weighted_average for r in rows], dtype=float)
+        bounds = np.flatnonzero(np.diff(hotel_col)) + 1
+        for ids, t, v in zip(
+            np.split(hotel_col, bounds),
+            np.split(times, bounds),
+            np.split(values, bounds),
+        ):
+            history[int(ids[0])] = (t, v)
+
+    half_life = RECENCY_HALF_LIFE.total_seconds()
+    out = np.full(len(snapshots), np.nan)
+    for i, snap in enumerate(snapshots):
+        if snap.hotel_id not in history or snap.weighted_average is None:
+            continue
+        t, v = history[snap.hotel_id]
+        as_of = snap.collected_at.timestamp()
+        upto = t <= as_of
+        weights = 0.5 ** ((as_of - t[upto]) / half_life)
+        out[i] = round(float(np.dot(weights, v[upto]) / weights.sum()), 2)
+    return out
+
+
+STRATEGIES: dict[str, Strategy] = {
+    s.name: s
+    for s in (
+        Strategy(
+            "weighted",
+            "Review-count-weighted average with mean-count imputation",
+            _weighted,
+        ),
+        Strategy(
+            "bayesian",
+            f"Weighted average shrunk toward {PRIOR_MEAN} by {PRIOR_WEIGHT} prior reviews",
+            _bayesian,
+        ),
+        Strategy(
+            "recency",
+            f"Weighted averages over history, half-life {RECENCY_HALF_LIFE.days} days",
+            _recency,
+            uses_history=True,
+        ),
+        Strategy(
+            "capped",
+            f"Weighted average with each channel capped at {CHANNEL_COUNT_CAP} reviews",
+            _capped,
+        ),
+    )
+}
+
+
+def get_strategy(name: str | None) -> Strategy | None:
+    """Resolve a ``strategy=`` query value; None means the caller didn't ask."""
+    if name is None:
+        return None
+    if name not in STRATEGIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown strategy '{name}'. Available: {', '.join(STRATEGIES)}",
+        )
+    return STRATEGIES[name]
+
+
+def forget_later_scores(db: Session, starts: dict[int, datetime]) -> None:
+    """Drop history-dependent cached scores of each hotel's snapshots
+    collected at or after ``starts[hotel_id]``, after inserting snapshots
+    that may predate them. One DELETE; the caller commits."""
+    names = [s.name for s in STRATEGIES.values() if s.uses_history]
+    if not starts or not names:
+        return
+    later = select(ReviewSnapshot.id).where(
+        or_(
+            *(
+                and_(
+                    ReviewSnapshot.hotel_id == hotel_id,
+                    ReviewSnapshot.collected_at >= at,
+                )
+                for hotel_id, at in starts.items()
+            )
+        )
+    )
+    db.execute(
+        delete(StrategyScore).where(
+            StrategyScore.strategy.in_(names), StrategyScore.snapshot_id.in_(later)
+        )
+    )
+
+
+def strategy_scores(
+    db: Session, strategy: Strategy, snapshots: list[ReviewSnapshot]
+) -> dict[int, float | None]:
+    """Scores for the given snapshots, computing and caching only the misses."""
+    if strategy.name == DEFAULT_STRATEGY:
+        # Already stored on the snapshot itself.
+        return {s.id: s.weighted_average for s in snapshots}
+    ids = [s.id for s in snapshots]
+    if not ids:
+        return {}
+    cached = dict(
+        db.execute(
+            select(StrategyScore.snapshot_id, StrategyScore.score).where(
+                StrategyScore.strategy == strategy.name,
+                StrategyScore.snapshot_id.in_(ids),
+            )
+        ).all()
+    )
+    missing = [s for s in snapshots if s.id not in cached]
+    if missing:
+        values = strategy.compute(db, missing)
+        fresh = {
+            s.id: None if np.isnan(v) else float(v) for s, v in zip(missing, values)
+        }
+        # Write through a separate session so committing the cache doesn't
+        # expire the caller's loaded objects mid-request.
+        with Session(bind=db.get_bind()) as cache_db:
+            try:
+                cache_db.execute(
+                    insert(StrategyScore),
+                    [
+                        {"strategy": strategy.name, "snapshot_id": sid, "score": score}
+                        for sid, score in fresh.items()
+                    ],
+                )
+                cache_db.commit()
+            except IntegrityError:
+                # A concurrent request cached the same rows first; values match.
+                cache_db.rollback()
+            except OperationalError:
+                # The database is locked, e.g. SQLite while the caller still
+                # has a cursor open on it. The scores are right either way;
+                # they just go uncached until the next read.
+                cache_db.rollback()
+        cached.update(fresh)
+    return cached
@@ -0,0 +1,178 @@
+"""Score history as compact columnar series for charts.
+
+Bucketed series are aggregated in SQL over ``snapshot_daily_rollups`` (one
+row per hotel per day) using ``date_trunc`` on Postgres and
+``date``/``strftime`` on SQLite; whatever is still above ``max_points`` is
+thinned with Largest-Triangle-Three-Buckets on the weighted average, which
+keeps the visual shape of the line with far fewer points.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Literal
+
+import numpy as np
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.orm import Session
+
+from ..models import Hotel, ReviewSnapshot, SnapshotDailyRollup
+from .rollups import ROLLUP_SOURCES, naive_utc
+
+Bucket = Literal["day", "week", "month"]
+
+# Upper bound on hotels per multi-series request.
+MAX_SERIES_HOTELS = 200
+
+# Series field -> the daily rollup column it is bucketed from.
+SERIES_FIELDS = {attr: f"{prefix}_last" for prefix, attr in ROLLUP_SOURCES.items()}
+
+
+def bucket_expr(col, bucket: Bucket, dialect: str):
+    """SQL expression truncating a date column to the start of its bucket."""
+    if dialect == "postgresql":
+        return cast(func.date_trunc(bucket, col), Date)
+    if bucket == "day":
+        return func.date(col)
+    if bucket == "week":
+        # Monday on or before the timestamp, matching date_trunc('week').
+        return func.date(col, "-6 days", "weekday 1")
+    return func.strftime("%Y-%m-01", col)
+
+
+def _iso(value) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _epoch(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points Largest-Triangle-Three-Buckets keeps."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    keep = np.empty(threshold, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        nxt_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:nxt_end].mean() if nxt_end > end else x[-1]
+        avg_y = y[end:nxt_end].mean() if nxt_end > end else y[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _raw(start: datetime | None, end: datetime | None):
+    at = ReviewSnapshot.collected_at.label("at")
+    query = (
+        select(
+            ReviewSnapshot.hotel_id,
+            at,
+            *(getattr(ReviewSnapshot, f) for f in SERIES_FIELDS),
+        )
+        .where(ReviewSnapshot.weighted_average.is_not(None))
+        .order_by(ReviewSnapshot.hotel_id, at)
+    )
+    if start is not None:
+        query = query.where(ReviewSnapshot.collected_at >= start)
+    if end is not None:
+        query = query.where(ReviewSnapshot.collected_at < end)
+    return query
+
+
+def _last_day_before(end: datetime) -> date:
+    return (end - timedelta(microseconds=1)).date()
+
+
+def _bucketed(
+    db: Session, bucket: Bucket, start: datetime | None, end: datetime | None
+):
+    day = SnapshotDailyRollup.day
+    at = bucket_expr(day, bucket, db.get_bind().dialect.name).label("at")
+    query = (
+        select(
+            SnapshotDailyRollup.hotel_id,
+            at,
+            func.sum(SnapshotDailyRollup.snapshot_count).label("n"),
+            *(
+                func.avg(getattr(SnapshotDailyRollup, col)).label(field)
+                for field, col in SERIES_FIELDS.items()
+            ),
+        )
+        .where(SnapshotDailyRollup.weighted_average_last.is_not(None))
+        .group_by(SnapshotDailyRollup.hotel_id, at)
+        .order_by(SnapshotDailyRollup.hotel_id, at)
+    )
+    if start is not None:
+        query = query.where(day >= start.date())
+    if end is not None:
+        query = query.where(day <= _last_day_before(end))
+    return query
+
+
+def series(
+    db: Session,
+    hotel_ids: list[int],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    bucket: Bucket | None = None,
+    max_points: int | None = None,
+) -> dict[int, dict[str, list]]:
+    """Columnar history per hotel: ``{"t": [...], "<field>": [...], "n": [...]}``.
+
+    Without ``bucket`` every snapshot is a point. With it, each point is the
+    average of the bucket's end-of-day values and ``n`` counts the snapshots
+    behind it; ``from``/``to`` then select whole days. Points with no channel
+    scores carry nothing to plot and are skipped.
+    """
+    start = naive_utc(start) if start is not None else None
+    end = naive_utc(end) if end is not None else None
+    if bucket:
+        query = _bucketed(db, bucket, start, end)
+    else:
+        query = _raw(start, end)
+    query = query.where(query.selected_columns.hotel_id.in_(hotel_ids))
+
+    rows_by_hotel: dict[int, list] = {hid: [] for hid in hotel_ids}
+    for row in db.execute(query):
+        rows_by_hotel[row.hotel_id].append(row)
+
+    out = {}
+    for hotel_id, rows in rows_by_hotel.items():
+        if max_points and len(rows) > max_points:
+            x = np.array([_epoch(r.at) for r in rows])
+            y = np.array([r.weighted_average for r in rows], dtype=float)
+            rows = [rows[i] for i in lttb_indices(x, y, max_points)]
+        cols = {"t": [_iso(r.at) for r in rows]}
+        for f in SERIES_FIELDS:
+            cols[f] = [
+                None if getattr(r, f) is None else round(getattr(r, f), 2) for r in rows
+            ]
+        cols["n"] = [r.n if bucket else 1 for r in rows]
+        out[hotel_id] = cols
+    return out
+
+
+def series_list(
+    db: Session,
+    hotels: list[Hotel],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    bucket: Bucket | None = None,
+    max_points: int | None = None,
+) -> list[dict]:
+    """``series`` for several hotels in one query, as a list in input order."""
+    by_hotel = series(db, [h.id for h in hotels], start, end, bucket, max_points)
+    return [{"hotel_id": h.id, "name": h.name, **by_hotel[h.id]} for h in hotels]
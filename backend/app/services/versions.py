@@ -0,0 +1,37 @@
+"""Counters behind cache versions, for changes snapshot ids can't see.
+
+Caches keyed on the newest snapshot id alone would miss a hotel being
+created, renamed or deleted, or scores being recomputed in place; and a
+hotel count can come back to an earlier value. Those writes call ``bump``
+in their own transaction, and cache versions include ``current()``.
+"""
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import DataVersion
+
+HOTELS = "hotels"
+
+
+def bump(db: Session, name: str = HOTELS) -> None:
+    """Increment a counter; committed with the caller's transaction."""
+    bumped = db.execute(
+        update(DataVersion)
+        .where(DataVersion.name == name)
+        .values(version=DataVersion.version + 1)
+    ).rowcount
+    if bumped:
+        return
+    try:
+        with db.begin_nested():
+            db.add(DataVersion(name=name, version=1))
+    except IntegrityError:
+        # Created concurrently; count this bump on the row that won.
+        bump(db, name)
+
+
+def current(name: str = HOTELS):
+    """Scalar subquery for a counter's value, NULL until first bumped."""
+    return select(DataVersion.version).where(DataVersion.name == name).scalar_subquery()
@@ -0,0 +1,290 @@
+"""Local stand-in for the review providers, for offline collector benchmarks.
+
+Replays the recorded SerpAPI, TripAdvisor Content API and Apify responses in
+``bench/recordings`` with configurable latency, error rate and rate limits.
+Point the collectors at it with the base-URL settings:
+
+    SERPAPI_BASE_URL=http://127.0.0.1:8765/serpapi
+    TRIPADVISOR_BASE_URL=http://127.0.0.1:8765/tripadvisor/api/v1
+    APIFY_API_URL=http://127.0.0.1:8765/apify
+
+Run standalone with ``python -m bench.fake_providers --port 8765``.
+"""
+
+import argparse
+import asyncio
+import copy
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
+
+PROVIDERS = ("serpapi", "tripadvisor", "apify")
+
+
+@dataclass
+class ProviderConfig:
+    """Behaviour of a single fake provider."""
+
+    latency_ms: float = 50.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_per_sec: float | None = None
+
+
+@dataclass
+class FakeConfig:
+    providers: dict[str, ProviderConfig] = field(
+        default_factory=lambda: {p: ProviderConfig() for p in PROVIDERS}
+    )
+    # Maps a provider search string (Booking search, Expedia location) to the
+    # hotel name the replayed result should carry, so name matching succeeds.
+    directory: dict[str, str] = field(default_factory=dict)
+    seed: int | None = None
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def _load(name: str):
+    with open(os.path.join(RECORDINGS_DIR, name)) as f:
+        return json.load(f)
+
+
+def _fill(template, **values):
+    """Substitute ``{placeholder}`` strings anywhere in a recorded payload."""
+    if isinstance(template, dict):
+        return {k: _fill(v, **values) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_fill(v, **values) for v in template]
+    if (
+        isinstance(template, str)
+        and template.startswith("{")
+        and template.endswith("}")
+    ):
+        return values.get(template[1:-1], template)
+    return template
+
+
+def create_app(config: FakeConfig | None = None) -> FastAPI:
+    config = config or FakeConfig()
+    rng = random.Random(config.seed)
+    buckets = {
+        name: _TokenBucket(p.rate_limit_per_sec)
+        for name, p in config.providers.items()
+        if p.rate_limit_per_sec
+    }
+    recordings = {
+        "serpapi": _load("serpapi.json"),
+        "tripadvisor_search": _load("tripadvisor_search.json"),
+        "tripadvisor_details": _load("tripadvisor_details.json"),
+        "voyager~booking-scraper": _load("apify_booking.json"),
+        "jupri~expedia-hotels": _load("apify_expedia.json"),
+    }
+    # Apify runs finish immediately; the dataset holds the replayed items.
+    datasets: dict[str, list] = {}
+    runs: dict[str, dict] = {}
+    stats = {p: {"requests": 0, "errors": 0, "throttled": 0} for p in PROVIDERS}
+
+    app = FastAPI(title="Fake review providers")
+    app.state.stats = stats
+
+    async def _gate(provider: str) -> JSONResponse | None:
+        """Apply rate limit, latency and injected errors for one request."""
+        cfg = config.providers[provider]
+        stats[provider]["requests"] += 1
+        bucket = buckets.get(provider)
+        if bucket is not None and not bucket.take():
+            stats[provider]["throttled"] += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429)
+        delay = cfg.latency_ms + rng.uniform(-cfg.jitter_ms, cfg.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if rng.random() < cfg.error_rate:
+            stats[provider]["errors"] += 1
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+        return None
+
+    @app.get("/serpapi/search.json")
+    async def serpapi_search(q: str = ""):
+        if (resp := await _gate("serpapi")) is not None:
+            return resp
+        return _fill(recordings["serpapi"], query=q)
+
+    @app.get("/tripadvisor/api/v1/location/search")
+    async def tripadvisor_search(searchQuery: str = ""):
+        if (resp := await _gate("tripadvisor")) is not None:
+            return resp
+        location_id = str(zlib.crc32(searchQuery.encode()) % 10_000_000)
+        return _fill(
+            recordings["tripadvisor_search"], query=searchQuery, location_id=location_id
+        )
+
+    @app.get("/tripadvisor/api/v1/location/{location_id}/details")
+    async def tripadvisor_details(location_id: str):
+        if (resp := await _gate("tripadvisor")) is not None:
+            return resp
+        return _fill(recordings["tripadvisor_details"], location_id=location_id)
+
+    @app.post("/apify/v2/acts/{actor_id}/runs")
+    async def apify_start_run(actor_id: str, request: Request):
+        if (resp := await _gate("apify")) is not None:
+            return resp
+        body = await request.body()
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        run_input = json.loads(body)
+        query = run_input.get("search") or (run_input.get("location") or [""])[0]
+        name = config.directory.get(query, query)
+        items = copy.deepcopy(_fill(recordings.get(actor_id, []), query=name))
+        limit = run_input.get("maxItems") or run_input.get("limit")
+        run_id = uuid.uuid4().hex
+        dataset_id = uuid.uuid4().hex
+        datasets[dataset_id] = items[:limit] if limit else items
+        runs[run_id] = {
+            "id": run_id,
+            "actId": actor_id,
+            "status": "SUCCEEDED",
+            "defaultDatasetId": dataset_id,
+        }
+        return JSONResponse({"data": runs[run_id]}, status_code=201)
+
+    # ApifyClient.call() also looks up the actor and tails the run log.
+    @app.get("/apify/v2/acts/{actor_id}")
+    async def apify_get_actor(actor_id: str):
+        return {"data": {"id": actor_id, "name": actor_id.split("~")[-1]}}
+
+    @app.get("/apify/v2/actor-runs/{run_id}/log")
+    @app.get("/apify/v2/logs/{run_id}")
+    async def apify_run_log(run_id: str):
+        return PlainTextResponse("")
+
+    @app.get("/apify/v2/actor-runs/{run_id}")
+    async def apify_get_run(run_id: str):
+        if run_id not in runs:
+            return JSONResponse(
+                {"error": {"type": "record-not-found"}}, status_code=404
+            )
+        return {"data": runs[run_id]}
+
+    @app.get("/apify/v2/datasets/{dataset_id}/items")
+    async def apify_dataset_items(dataset_id: str, offset: int = 0, limit: int = 1000):
+        items = datasets.get(dataset_id, [])
+        page = items[offset : offset + limit]
+        return JSONResponse(
+            page,
+            headers={
+                "x-apify-pagination-total": str(len(items)),
+                "x-apify-pagination-offset": str(offset),
+                "x-apify-pagination-count": str(len(page)),
+                "x-apify-pagination-limit": str(limit),
+                "x-apify-pagination-desc": "false",
+            },
+        )
+
+    @app.get("/_stats")
+    def get_stats():
+        return stats
+
+    return app
+
+
+class FakeProviderServer:
+    """Runs the fake providers on a background thread for in-process benchmarks."""
+
+    def __init__(self, config: FakeConfig | None = None, port: int = 8765):
+        self.app = create_app(config)
+        self.port = port
+        self._server = uvicorn.Server(
+            uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def env(self) -> dict[str, str]:
+        """Environment variables that route every collector at this server."""
+        return {
+            "SERPAPI_KEY": "fake",
+            "SERPAPI_BASE_URL": f"{self.base_url}/serpapi",
+            "TRIPADVISOR_KEY": "fake",
+            "TRIPADVISOR_BASE_URL": f"{self.base_url}/tripadvisor/api/v1",
+            "APIFY_TOKEN": "fake",
+            "APIFY_API_URL": f"{self.base_url}/apify",
+        }
+
+    @property
+    def stats(self) -> dict:
+        return self.app.state.stats
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    provider = ProviderConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_per_sec=args.rate_limit,
+    )
+    return FakeConfig(
+        providers={p: copy.copy(provider) for p in PROVIDERS}, seed=args.seed
+    )
+
+
+def add_provider_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rate-limit", type=float, default=None, help="requests/sec per provider"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    add_provider_args(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
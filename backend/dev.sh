@@ -42,6 +42,10 @@ case "${1:-help}" in
     source "$VENV/bin/activate"
     pytest "${@:2}"
     ;;
+  bench)
+    source "$VENV/bin/activate"
+    python -m bench.bench_collect "${@:2}"
+    ;;
   help)
     echo "Usage: ./dev.sh <command>"
     echo ""
@@ -52,6 +56,7 @@ case "${1:-help}" in
     echo "  check            Verify the app imports cleanly"
     echo "  run [port]       Run the dev server (default port 8000)"
     echo "  test [args]      Run pytest with optional args"
+    echo "  bench [args]     Collection benchmark against fake providers"
     ;;
   *)
     echo "Unknown command: $1"
@@ -4,6 +4,7 @@ from contextlib import contextmanager
 import pytest
 from app.database import Base, get_db
 from app.main import app
+from app.services import export_jobs, group_scores, hotel_export
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
@@ -29,10 +30,13 @@ app.dependency_overrides[get_db] = override_get_db
 
 
 @pytest.fixture(autouse=True)
-def setup_db():
+def setup_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(hotel_export, "CACHE_DIR", str(tmp_path / "export_cache"))
+    monkeypatch.setattr(export_jobs, "JOBS_DIR", str(tmp_path / "export_jobs"))
     Base.metadata.create_all(bind=test_engine)
     yield
     Base.metadata.drop_all(bind=test_engine)
+    group_scores.clear_cache()
 
 
 @pytest.fixture
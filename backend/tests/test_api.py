@@ -1,8 +1,39 @@
+import argparse
+import gzip
+import io
+import json
 import os
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
-from app.models import User
+from app.cli import _rescore
+from app.database import Base
+from app.models import (
+    Alert,
+    ExportJob,
+    Hotel,
+    HotelGroup,
+    HotelGroupMembership,
+    HotelRanking,
+    IdempotencyKey,
+    ReviewSnapshot,
+    SnapshotDailyRollup,
+    StrategyScore,
+    User,
+)
+from app.services import export_jobs, hotel_export
+from app.services.collectors import all_collectors
+from app.services.collectors.registry import update_settings
+from app.services.hotel_export import csv_chunks
+from app.services.rollups import rebuild_rollups, update_rollups
+from app.services.scoring import compute_scores
+from app.services.strategies import STRATEGIES
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
 
 from tests.conftest import CSV_PATH, TestSession, count_queries
 
@@ -293,6 +324,59 @@ def test_update_group(client, auth_token):
     assert resp.json()["hotel_count"] == 5
 
 
+def test_patch_group_members_applies_delta(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    db = TestSession()
+    db.add_all(Hotel(name=f"Portfolio {i}") for i in range(50))
+    db.commit()
+    hotel_ids = sorted(db.scalars(select(Hotel.id)))
+    db.close()
+
+    resp = client.post(
+        "/api/groups",
+        json={"name": "Portfolio", "hotel_ids": hotel_ids[:40]},
+        headers=headers,
+    )
+    group_id = resp.json()["id"]
+    assert resp.json()["hotel_count"] == 40
+
+    url = f"/api/groups/{group_id}/members"
+    with count_queries() as queries:
+        resp = client.patch(
+            url,
+            json={
+                "add": hotel_ids[40:45] + [hotel_ids[0]],
+                "remove": [hotel_ids[1], hotel_ids[2], hotel_ids[49]],
+            },
+            headers=headers,
+        )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["added"], body["removed"], body["hotel_count"]) == (5, 2, 43)
+    writes = [q.split()[0] for q in queries if q.split()[0] in ("INSERT", "DELETE")]
+    assert writes == ["INSERT", "DELETE"]
+
+    db = TestSession()
+    assert db.get(HotelGroup, group_id).membership_version == 1
+    db.close()
+
+    resp = client.patch(url, json={"add": [hotel_ids[3], 999999]}, headers=headers)
+    assert resp.status_code == 400
+    assert "999999" in resp.json()["detail"]
+    resp = client.patch(
+        url, json={"add": [hotel_ids[3]], "remove": [hotel_ids[3]]}, headers=headers
+    )
+    assert resp.status_code == 400
+    resp = client.patch(url, json={"add": [hotel_ids[0]]}, headers=headers)
+    assert (resp.json()["added"], resp.json()["hotel_count"]) == (0, 43)
+
+    resp = client.post(
+        "/api/groups", json={"name": "Bad", "hotel_ids": [999999]}, headers=headers
+    )
+    assert resp.status_code == 400
+    assert len(client.get("/api/groups", headers=headers).json()) == 1
+
+
 def test_delete_group(client, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
 
@@ -384,9 +468,13 @@ def test_collect_hotel_mocked(client, auth_token):
     hotel_id = hotel_ids[0]
 
     with (
-        patch("app.routers.reviews.collect_google_reviews", return_value=(4.5, 200)),
         patch(
-            "app.routers.reviews.collect_tripadvisor_reviews", return_value=(4.0, 150)
+            "app.services.collectors.google.collect_google_reviews",
+            return_value=(4.5, 200),
+        ),
+        patch(
+            "app.services.collectors.tripadvisor.collect_tripadvisor_reviews",
+            return_value=(4.0, 150),
         ),
     ):
         resp = client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=headers)
@@ -419,9 +507,13 @@ def test_collect_group_mocked(client, auth_token):
     group_id = resp.json()["id"]
 
     with (
-        patch("app.routers.reviews.collect_google_reviews", return_value=(4.2, 100)),
         patch(
-            "app.routers.reviews.collect_tripadvisor_reviews", return_value=(3.8, 80)
+            "app.services.collectors.google.collect_google_reviews",
+            return_value=(4.2, 100),
+        ),
+        patch(
+            "app.services.collectors.tripadvisor.collect_tripadvisor_reviews",
+            return_value=(3.8, 80),
         ),
     ):
         resp = client.post(f"/api/reviews/groups/{group_id}/collect", headers=headers)
@@ -467,10 +559,82 @@ def test_admin_reset(client, auth_token):
     assert new_count == data["imported"]
 
 
+def test_bulk_upsert_hotels(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    existing = client.post(
+        "/api/hotels", json={"name": "Harbor Inn", "city": "Boston"}, headers=headers
+    ).json()["id"]
+    by_id = client.post(
+        "/api/hotels", json={"name": "Old Name"}, headers=headers
+    ).json()["id"]
+
+    items = [
+        {"name": "Harbor Inn", "state": "MA"},
+        {"id": by_id, "name": "New Name", "brand": "Kasa"},
+        *({"name": f"Contract {i}", "keys": 10 + i} for i in range(20)),
+        {"city": "No Name"},
+        {"id": 999999, "name": "Ghost"},
+        {"name": "Contract 0"},
+        {"name": "Typed", "keys": "many"},
+    ]
+    with count_queries() as queries:
+        resp = client.post("/api/hotels/bulk", json=items, headers=headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["created"], body["updated"], body["error"]) == (20, 2, 4)
+    results = body["results"]
+    assert [r["index"] for r in results] == list(range(len(items)))
+    assert results[0] == {"index": 0, "status": "updated", "id": existing}
+    assert results[1]["id"] == by_id
+    assert results[2]["status"] == "created"
+    assert results[22]["errors"] == [
+        "Value error, name is required unless updating by id"
+    ]
+    assert results[23]["errors"] == ["Hotel not found"]
+    assert results[24]["errors"] == ["Duplicate name"]
+    assert results[25]["errors"][0].startswith("keys:")
+    # One multi-row INSERT for all new hotels; updates are one executemany
+    # per distinct set of written fields.
+    statements = [q.split()[0] for q in queries if "data_versions" not in q]
+    assert statements.count("INSERT") == 1
+    assert statements.count("UPDATE") <= 2  # one executemany per field set
+
+    harbor = client.get(f"/api/hotels/{existing}", headers=headers).json()
+    assert (harbor["city"], harbor["state"]) == ("Boston", "MA")
+    renamed = client.get(f"/api/hotels/{by_id}", headers=headers).json()
+    assert (renamed["name"], renamed["brand"]) == ("New Name", "Kasa")
+    contract = client.get(f"/api/hotels/{results[5]['id']}", headers=headers).json()
+    assert (contract["name"], contract["keys"]) == ("Contract 3", 13)
+
+    # By id, an item may carry only the fields it changes, but not a null name.
+    items = [{"id": by_id, "city": "Q"}, {"id": existing, "name": None}]
+    results = client.post("/api/hotels/bulk", json=items, headers=headers).json()[
+        "results"
+    ]
+    assert results[0] == {"index": 0, "status": "updated", "id": by_id}
+    assert results[1]["status"] == "error"
+    renamed = client.get(f"/api/hotels/{by_id}", headers=headers).json()
+    assert (renamed["name"], renamed["city"]) == ("New Name", "Q")
+
+    ndjson = b'{"name": "Line One"}\nnot json\n\n{"name": "Line Three"}\n'
+    resp = client.post(
+        "/api/hotels/bulk",
+        content=ndjson,
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    body = resp.json()
+    assert [r["status"] for r in body["results"]] == ["created", "error", "created"]
+    assert body["results"][1]["errors"][0].startswith("Invalid JSON")
+
+    resp = client.post("/api/hotels/bulk", json={"name": "x"}, headers=headers)
+    assert resp.status_code == 400
+
+
 def test_delete_hotel(client, auth_token):
     """Delete a hotel and verify it's gone but others remain."""
     hotel_ids = _import_csv(client, auth_token)
     headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
     target_id = hotel_ids[0]
 
     resp = client.delete(f"/api/hotels/{target_id}?confirm=true", headers=headers)
@@ -492,6 +656,7 @@ def test_delete_hotel_cleans_up_group_membership(client, auth_token):
     """Deleting a hotel removes it from groups but group still exists."""
     hotel_ids = _import_csv(client, auth_token)
     headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
 
     # Create group with 3 hotels
     resp = client.post(
@@ -510,15 +675,178 @@ def test_delete_hotel_cleans_up_group_membership(client, auth_token):
     assert len(resp.json()["hotels"]) == 2
 
 
+def test_bulk_delete_hotels_cascades_in_the_database(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
+    ids = [
+        client.post("/api/hotels", json={"name": f"Gone {i}"}, headers=headers).json()[
+            "id"
+        ]
+        for i in range(3)
+    ]
+    for hotel_id in ids:
+        _seed_daily_history(hotel_id, days=30)
+    group_id = client.post(
+        "/api/groups", json={"name": "Mixed", "hotel_ids": ids}, headers=headers
+    ).json()["id"]
+    client.get(
+        f"/api/groups/{group_id}", params={"strategy": "recency"}, headers=headers
+    )
+    client.get(f"/api/hotels/{ids[2]}", headers=headers)  # builds rankings
+
+    resp = client.post(
+        "/api/hotels/bulk-delete", json={"ids": ids[:2] + [999999]}, headers=headers
+    )
+    assert resp.status_code == 400
+    with count_queries() as queries:
+        resp = client.post(
+            "/api/hotels/bulk-delete?confirm=true",
+            json={"ids": ids[:2] + [999999]},
+            headers=headers,
+        )
+    assert resp.json() == {"deleted": 2}
+    # auth, bump group and hotels versions, one DELETE; the rest is
+    # ON DELETE CASCADE
+    assert len(queries) == 4
+
+    db = TestSession()
+    for model in (
+        ReviewSnapshot,
+        SnapshotDailyRollup,
+        HotelRanking,
+        HotelGroupMembership,
+    ):
+        remaining = set(db.scalars(select(model.hotel_id)))
+        assert remaining == {ids[2]}, model.__tablename__
+    snapshot_ids = set(db.scalars(select(ReviewSnapshot.id)))
+    scored = set(db.scalars(select(StrategyScore.snapshot_id)))
+    assert scored and scored <= snapshot_ids
+    assert db.get(HotelGroup, group_id).membership_version == 1
+    db.close()
+    resp = client.get(f"/api/groups/{group_id}", headers=headers)
+    assert [h["id"] for h in resp.json()["hotels"]] == [ids[2]]
+
+
+BASELINE_SCHEMA = """
+CREATE TABLE users (id INTEGER NOT NULL, email VARCHAR NOT NULL,
+    hashed_password VARCHAR NOT NULL, is_admin BOOLEAN NOT NULL, PRIMARY KEY (id));
+CREATE TABLE hotels (id INTEGER NOT NULL, name VARCHAR NOT NULL, city VARCHAR,
+    state VARCHAR, keys INTEGER, kind VARCHAR, brand VARCHAR, parent VARCHAR,
+    website VARCHAR, booking_name VARCHAR, expedia_name VARCHAR,
+    tripadvisor_name VARCHAR, PRIMARY KEY (id));
+CREATE INDEX ix_hotels_id ON hotels (id);
+CREATE TABLE review_snapshots (id INTEGER NOT NULL, hotel_id INTEGER NOT NULL,
+    collected_at DATETIME, source VARCHAR NOT NULL, google_score FLOAT,
+    google_count INTEGER, booking_score FLOAT, booking_count INTEGER,
+    expedia_score FLOAT, expedia_count INTEGER, tripadvisor_score FLOAT,
+    tripadvisor_count INTEGER, google_normalized FLOAT, booking_normalized FLOAT,
+    expedia_normalized FLOAT, tripadvisor_normalized FLOAT, weighted_average FLOAT,
+    PRIMARY KEY (id), FOREIGN KEY(hotel_id) REFERENCES hotels (id));
+CREATE INDEX ix_review_snapshots_id ON review_snapshots (id);
+CREATE TABLE hotel_groups (id INTEGER NOT NULL, name VARCHAR NOT NULL,
+    user_id INTEGER NOT NULL, created_at DATETIME, PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES users (id));
+CREATE TABLE hotel_group_memberships (group_id INTEGER NOT NULL,
+    hotel_id INTEGER NOT NULL, PRIMARY KEY (group_id, hotel_id),
+    UNIQUE (group_id, hotel_id), FOREIGN KEY(group_id) REFERENCES hotel_groups (id),
+    FOREIGN KEY(hotel_id) REFERENCES hotels (id));
+INSERT INTO hotels (id, name) VALUES (1, 'Old Inn');
+INSERT INTO review_snapshots (id, hotel_id, collected_at, source, google_score,
+    google_normalized, weighted_average)
+    VALUES (1, 1, '2024-01-01 00:00:00', 'csv_import', 4.5, 9.0, 9.0);
+"""
+
+
+# What the first cascade migration left behind: it renamed review_snapshots
+# aside, so SQLite repointed this foreign key at the copy it then dropped.
+DANGLING_STRATEGY_SCORES = """
+CREATE TABLE strategy_scores (strategy VARCHAR NOT NULL,
+    snapshot_id INTEGER NOT NULL, score FLOAT, PRIMARY KEY (strategy, snapshot_id),
+    FOREIGN KEY(snapshot_id) REFERENCES "_old_review_snapshots" (id) ON DELETE CASCADE);
+"""
+
+
+@pytest.mark.parametrize("damaged", [False, True])
+def test_startup_migrates_a_baseline_database(tmp_path, monkeypatch, damaged):
+    from app.database import get_db
+    from app.main import app, init_db
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.connect() as conn:
+        conn.connection.executescript(
+            BASELINE_SCHEMA + (DANGLING_STRATEGY_SCORES if damaged else "")
+        )
+    init_db(engine)
+    init_db(engine)  # a second startup finds nothing left to migrate
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA foreign_key_check").all() == []
+        tables = conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+        ).all()
+    assert not [name for name, _ in tables if name.startswith(("_old_", "_new_"))]
+    assert not [name for name, sql in tables if "_old_" in sql or "_new_" in sql]
+
+    Session = sessionmaker(bind=engine)
+
+    def get_baseline_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, get_baseline_db)
+    client = TestClient(app)
+    token = client.post(
+        "/api/auth/register", json={"email": "old@example.com", "password": "pw"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    with Session() as db:
+        db.query(User).update({"is_admin": True})
+        db.commit()
+    resp = client.get("/api/hotels?strategy=bayesian", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["items"][0]["strategy_score"] is not None
+
+    resp = client.delete("/api/hotels/1?confirm=true", headers=headers)
+    assert resp.status_code == 200
+    with engine.connect() as conn:
+        for table in ("review_snapshots", "strategy_scores"):
+            count = conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+            assert count == 0, table
+
+
 def test_delete_hotel_not_found(client, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
     resp = client.delete("/api/hotels/99999?confirm=true", headers=headers)
     assert resp.status_code == 404
 
 
+def test_delete_hotel_requires_admin(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Kept Inn"}, headers=headers
+    ).json()["id"]
+    resp = client.delete(f"/api/hotels/{hotel_id}?confirm=true", headers=headers)
+    assert resp.status_code == 403
+    resp = client.post(
+        "/api/hotels/bulk-delete?confirm=true",
+        json={"ids": [hotel_id]},
+        headers=headers,
+    )
+    assert resp.status_code == 403
+    assert client.get(f"/api/hotels/{hotel_id}", headers=headers).status_code == 200
+
+
 def test_delete_hotel_requires_confirmation(client, auth_token):
     """DELETE without ?confirm=true should be rejected."""
     headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
     client.post("/api/hotels", json={"name": "Don't Delete Me"}, headers=headers)
     resp = client.get("/api/hotels", headers=headers)
     hotel_id = resp.json()["items"][0]["id"]
@@ -647,6 +975,45 @@ def test_hotel_list_query_count(client, auth_token):
     assert len(queries) <= 5, f"Expected ≤5 queries, got {len(queries)}"
 
 
+def test_group_read_query_counts(client, auth_token):
+    """Group listing, detail and export stay constant-query as groups grow."""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_ids = []
+    for i in range(12):
+        hotel_id = client.post(
+            "/api/hotels", json={"name": f"Member {i:02d}"}, headers=headers
+        ).json()["id"]
+        hotel_ids.append(hotel_id)
+        _add_snapshot(hotel_id, datetime(2024, 1, 1), google_score=4.0)
+        _add_snapshot(hotel_id, datetime(2024, 2, 1), google_score=4.5)
+    for size in (12, 6, 0):
+        group_id = client.post(
+            "/api/groups",
+            json={"name": f"Size {size}", "hotel_ids": hotel_ids[:size]},
+            headers=headers,
+        ).json()["id"]
+    big_group = group_id - 2
+
+    with count_queries() as queries:
+        resp = client.get("/api/groups", headers=headers)
+    assert [g["hotel_count"] for g in resp.json()] == [12, 6, 0]
+    assert len(queries) <= 2, f"Expected ≤2 queries, got {len(queries)}"
+
+    with count_queries() as queries:
+        resp = client.get(f"/api/groups/{big_group}", headers=headers)
+    hotels = resp.json()["hotels"]
+    assert [h["name"] for h in hotels] == [f"Member {i:02d}" for i in range(12)]
+    assert all(h["google_normalized"] == 9.0 for h in hotels)
+    # auth + group + one members-with-latest join
+    assert len(queries) <= 3, f"Expected ≤3 queries, got {len(queries)}"
+
+    with count_queries() as queries:
+        resp = client.get(f"/api/export/groups/{big_group}", headers=headers)
+    assert len(resp.text.splitlines()) == 13
+    # auth + group + data version + one streaming export query
+    assert len(queries) <= 4, f"Expected ≤4 queries, got {len(queries)}"
+
+
 def test_collect_hotel_all_four_channels(client, auth_token):
     """Collect live reviews with all 4 channels mocked."""
     hotel_ids = _import_csv(client, auth_token)
@@ -654,11 +1021,21 @@ def test_collect_hotel_all_four_channels(client, auth_token):
     hotel_id = hotel_ids[0]
 
     with (
-        patch("app.routers.reviews.collect_google_reviews", return_value=(4.5, 200)),
-        patch("app.routers.reviews.collect_booking_reviews", return_value=(8.1, 300)),
-        patch("app.routers.reviews.collect_expedia_reviews", return_value=(7.9, 250)),
         patch(
-            "app.routers.reviews.collect_tripadvisor_reviews", return_value=(4.0, 150)
+            "app.services.collectors.google.collect_google_reviews",
+            return_value=(4.5, 200),
+        ),
+        patch(
+            "app.services.collectors.booking.collect_booking_reviews",
+            return_value=(8.1, 300),
+        ),
+        patch(
+            "app.services.collectors.expedia.collect_expedia_reviews",
+            return_value=(7.9, 250),
+        ),
+        patch(
+            "app.services.collectors.tripadvisor.collect_tripadvisor_reviews",
+            return_value=(4.0, 150),
         ),
     ):
         resp = client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=headers)
@@ -685,3 +1062,1158 @@ def test_admin_reset_requires_admin(client, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
     resp = client.post("/api/admin/reset", headers=headers)
     assert resp.status_code == 403
+
+
+def test_admin_can_disable_collector(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    resp = client.patch(
+        "/api/admin/collectors/booking", json={"enabled": False}, headers=headers
+    )
+    assert resp.status_code == 403
+
+    _promote_to_admin("test@example.com")
+    try:
+        resp = client.patch(
+            "/api/admin/collectors/booking",
+            json={"enabled": False, "max_concurrency": 2},
+            headers=headers,
+        )
+        assert resp.status_code == 200
+        assert resp.json()["enabled"] is False
+        assert resp.json()["max_concurrency"] == 2
+
+        resp = client.get("/api/admin/collectors", headers=headers)
+        booking = next(c for c in resp.json() if c["channel"] == "booking")
+        assert booking["enabled"] is False
+    finally:
+        client.patch(
+            "/api/admin/collectors/booking",
+            json={"enabled": True, "max_concurrency": 4},
+            headers=headers,
+        )
+
+    resp = client.patch(
+        "/api/admin/collectors/myspace", json={"enabled": False}, headers=headers
+    )
+    assert resp.status_code == 404
+
+
+def test_collect_with_every_channel_disabled(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Quiet Inn"}, headers=headers
+    ).json()["id"]
+    originals = {c.channel: c.settings for c in all_collectors()}
+    try:
+        for channel in originals:
+            update_settings(channel, enabled=False)
+        resp = client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=headers)
+    finally:
+        for channel, settings in originals.items():
+            update_settings(channel, **asdict(settings))
+    assert resp.status_code == 503
+    assert "disabled" in resp.json()["detail"]
+
+
+# ---- Idempotency keys ----
+
+
+def test_collect_with_idempotency_key_runs_once(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Retry Inn"}, headers=headers
+    ).json()["id"]
+    keyed = {**headers, "Idempotency-Key": "abc-123"}
+
+    with (
+        patch(
+            "app.services.collectors.google.collect_google_reviews",
+            return_value=(4.5, 200),
+        ) as google,
+        patch("app.routers.reviews.refresh_exports") as refresh,
+    ):
+        first = client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=keyed)
+        second = client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=keyed)
+        third = client.post(
+            f"/api/reviews/hotels/{hotel_id}/collect",
+            headers={**headers, "Idempotency-Key": "other"},
+        )
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    # A fresh key re-collects (same values, so it only confirms the snapshot).
+    assert third.json()["unchanged"] is True
+    assert google.call_count == 2
+    # Exports are refreshed after each run that collected, not after replays.
+    assert refresh.call_count == 2
+
+
+def test_idempotency_key_released_on_failure(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}", "Idempotency-Key": "k1"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Flaky Inn"}, headers=headers
+    ).json()["id"]
+
+    # No channels succeed -> 502, and the key must not pin that failure.
+    with patch("app.routers.reviews.refresh_exports") as refresh:
+        resp = client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=headers)
+    assert resp.status_code == 502
+    refresh.assert_not_called()
+
+    with patch(
+        "app.services.collectors.google.collect_google_reviews",
+        return_value=(4.0, 10),
+    ):
+        resp = client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=headers)
+    assert resp.status_code == 200
+
+
+def test_abandoned_idempotency_claim_is_taken_over(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}", "Idempotency-Key": "k2"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Crashed Inn"}, headers=headers
+    ).json()["id"]
+    db = TestSession()
+    user = db.scalars(select(User)).one()
+    claim = IdempotencyKey(
+        user_id=user.id, key="k2", scope=f"collect-hotel:{hotel_id}", fingerprint=None
+    )
+    db.add(claim)
+    db.commit()
+
+    url = f"/api/reviews/hotels/{hotel_id}/collect"
+    with patch(
+        "app.services.collectors.google.collect_google_reviews",
+        return_value=(4.0, 10),
+    ):
+        assert client.post(url, headers=headers).status_code == 409
+        # The worker holding the claim died; once it is old enough, retry.
+        claim.created_at = datetime.now(timezone.utc) - timedelta(minutes=16)
+        db.commit()
+        db.close()
+        resp = client.post(url, headers=headers)
+    assert resp.status_code == 200
+    assert client.post(url, headers=headers).headers["Idempotent-Replayed"] == "true"
+
+
+def test_idempotency_key_reused_for_different_request(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}", "Idempotency-Key": "imp-1"}
+    header_rows = "a\nb\n"
+    resp = client.post(
+        "/api/hotels/import-csv",
+        files={"file": ("a.csv", header_rows.encode(), "text/csv")},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+
+    resp = client.post(
+        "/api/hotels/import-csv",
+        files={"file": ("b.csv", (header_rows + "\n").encode(), "text/csv")},
+        headers=headers,
+    )
+    assert resp.status_code == 422
+
+
+# ---- Duplicate snapshot suppression ----
+
+
+def test_repeat_collection_confirms_instead_of_duplicating(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Steady Inn"}, headers=headers
+    ).json()["id"]
+    url = f"/api/reviews/hotels/{hotel_id}/collect"
+
+    with patch(
+        "app.services.collectors.google.collect_google_reviews",
+        return_value=(4.5, 200),
+    ):
+        first = client.post(url, headers=headers).json()
+        second = client.post(url, headers=headers).json()
+    assert first["unchanged"] is False
+    assert second["unchanged"] is True
+    assert second["snapshot_id"] == first["snapshot_id"]
+
+    history = client.get(f"/api/hotels/{hotel_id}/history", headers=headers).json()
+    assert len(history) == 1
+    assert history[0]["confirmed_at"] is not None
+
+    with patch(
+        "app.services.collectors.google.collect_google_reviews",
+        return_value=(4.6, 201),
+    ):
+        third = client.post(url, headers=headers).json()
+    assert third["unchanged"] is False
+    history = client.get(f"/api/hotels/{hotel_id}/history", headers=headers).json()
+    assert len(history) == 2
+
+
+# ---- Scoring strategies ----
+
+
+def test_strategy_param_on_hotel_endpoints(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Strategy Inn"}, headers=headers
+    ).json()["id"]
+    with patch(
+        "app.services.collectors.google.collect_google_reviews",
+        return_value=(5.0, 3),
+    ):
+        client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=headers)
+
+    resp = client.get(f"/api/hotels/{hotel_id}", headers=headers)
+    assert resp.json()["strategy_score"] is None
+
+    resp = client.get(
+        f"/api/hotels/{hotel_id}", params={"strategy": "bayesian"}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert resp.json()["strategy"] == "bayesian"
+    assert (
+        resp.json()["strategy_score"]
+        < resp.json()["latest_snapshot"]["weighted_average"]
+    )
+
+    resp = client.get("/api/hotels", params={"strategy": "capped"}, headers=headers)
+    assert resp.json()["items"][0]["strategy_score"] == 10.0
+
+    group_id = client.post(
+        "/api/groups", json={"name": "S", "hotel_ids": [hotel_id]}, headers=headers
+    ).json()["id"]
+    resp = client.get(
+        f"/api/groups/{group_id}", params={"strategy": "recency"}, headers=headers
+    )
+    assert resp.json()["hotels"][0]["strategy_score"] == 10.0
+
+    resp = client.get(
+        "/api/export/hotels", params={"strategy": "bayesian"}, headers=headers
+    )
+    assert "Score (bayesian)" in resp.text.splitlines()[0]
+
+    resp = client.get("/api/hotels", params={"strategy": "vibes"}, headers=headers)
+    assert resp.status_code == 400
+
+
+def _seed_daily_history(hotel_id: int, days: int, start=datetime(2024, 1, 1)):
+    db = TestSession()
+    snapshots = []
+    for i in range(days):
+        snapshot = ReviewSnapshot(
+            hotel_id=hotel_id,
+            source="live",
+            collected_at=start + timedelta(days=i, hours=12),
+            google_score=3.0 + (i % 5) * 0.5,
+            google_count=100,
+        )
+        compute_scores(snapshot)
+        snapshots.append(snapshot)
+    db.add_all(snapshots)
+    db.flush()
+    update_rollups(db, snapshots)
+    db.commit()
+    db.close()
+
+
+def test_history_series_buckets_and_downsamples(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Series Inn"}, headers=headers
+    ).json()["id"]
+    _seed_daily_history(hotel_id, 60)
+    url = f"/api/hotels/{hotel_id}/history/series"
+
+    raw = client.get(url, headers=headers).json()
+    assert len(raw["t"]) == 60
+    assert len(raw["weighted_average"]) == len(raw["google_normalized"]) == 60
+    assert raw["booking_normalized"] == [None] * 60
+
+    weekly = client.get(url, params={"bucket": "week"}, headers=headers).json()
+    assert weekly["t"][0] == "2024-01-01"  # a Monday
+    assert sum(weekly["n"]) == 60
+    assert len(weekly["t"]) == 9
+
+    monthly = client.get(
+        url,
+        params={"bucket": "month", "from": "2024-02-01", "to": "2024-03-01"},
+        headers=headers,
+    ).json()
+    assert monthly["t"] == ["2024-02-01"]
+    assert monthly["n"] == [29]
+
+    thinned = client.get(url, params={"max_points": 10}, headers=headers).json()
+    assert len(thinned["t"]) == 10
+    assert thinned["t"][0] == raw["t"][0]
+    assert thinned["t"][-1] == raw["t"][-1]
+
+    assert (
+        client.get(url, params={"bucket": "hour"}, headers=headers).status_code == 422
+    )
+    resp = client.get("/api/hotels/99999/history/series", headers=headers)
+    assert resp.status_code == 404
+
+
+def test_history_is_cursor_paginated(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Paged Inn"}, headers=headers
+    ).json()["id"]
+    _seed_daily_history(hotel_id, 25)
+    url = f"/api/hotels/{hotel_id}/history"
+
+    seen = []
+    cursor = None
+    with count_queries() as queries:
+        while True:
+            params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+            resp = client.get(url, params=params, headers=headers)
+            assert resp.status_code == 200
+            seen += [s["id"] for s in resp.json()]
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    assert len(seen) == 25 == len(set(seen))
+    dates = [s["collected_at"] for s in client.get(url, headers=headers).json()]
+    assert dates == sorted(dates, reverse=True)
+    assert len(queries) <= 3 * 3  # user, hotel check, page per request
+
+    resp = client.get(url, params={"cursor": "not-a-cursor"}, headers=headers)
+    assert resp.status_code == 400
+
+
+def test_multi_hotel_and_group_history(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    ids = [
+        client.post("/api/hotels", json={"name": name}, headers=headers).json()["id"]
+        for name in ("Alpha Inn", "Beta Inn", "Gamma Inn")
+    ]
+    for hotel_id in ids:
+        _seed_daily_history(hotel_id, 30)
+
+    with count_queries() as queries:
+        resp = client.get(
+            "/api/hotels/history",
+            params={"ids": f"{ids[2]},{ids[0]},99999", "bucket": "week"},
+            headers=headers,
+        )
+    assert resp.status_code == 200
+    series = resp.json()["series"]
+    assert [s["hotel_id"] for s in series] == [ids[2], ids[0]]
+    assert all(sum(s["n"]) == 30 for s in series)
+    assert len(queries) <= 3  # user, hotels, one series query
+
+    resp = client.get("/api/hotels/history", params={"ids": "1,two"}, headers=headers)
+    assert resp.status_code == 400
+
+    group_id = client.post(
+        "/api/groups", json={"name": "Compare", "hotel_ids": ids}, headers=headers
+    ).json()["id"]
+    resp = client.get(
+        f"/api/groups/{group_id}/history",
+        params={"max_points": 5},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    series = resp.json()["series"]
+    assert [s["name"] for s in series] == ["Alpha Inn", "Beta Inn", "Gamma Inn"]
+    assert all(len(s["t"]) == 5 for s in series)
+    assert client.get("/api/groups/99999/history", headers=headers).status_code == 404
+
+
+def _add_snapshot(hotel_id: int, collected_at: datetime, **values):
+    db = TestSession()
+    snapshot = ReviewSnapshot(
+        hotel_id=hotel_id, source="live", collected_at=collected_at, **values
+    )
+    compute_scores(snapshot)
+    db.add(snapshot)
+    db.commit()
+    db.close()
+
+
+def test_group_summary_aggregates_and_caches(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    a, b, c = (
+        client.post("/api/hotels", json={"name": name}, headers=headers).json()["id"]
+        for name in ("Low Inn", "High Inn", "Unscored Inn")
+    )
+    _add_snapshot(a, datetime(2024, 1, 1, 9), google_score=4.0, google_count=100)
+    _add_snapshot(b, datetime(2024, 1, 10, 9), booking_score=9.0, booking_count=300)
+    group_id = client.post(
+        "/api/groups",
+        json={"name": "Portfolio", "hotel_ids": [a, b, c]},
+        headers=headers,
+    ).json()["id"]
+    url = f"/api/groups/{group_id}/summary"
+
+    summary = client.get(url, headers=headers).json()
+    assert summary["hotel_count"] == 3
+    assert summary["scored_hotels"] == 2
+    assert summary["score"] == 8.75  # (8.0 * 100 + 9.0 * 300) / 400
+    assert summary["review_count"] == 400
+    assert summary["channels"]["google"] == {
+        "hotels": 1,
+        "coverage": 0.333,
+        "score": 8.0,
+    }
+    assert summary["channels"]["expedia"]["hotels"] == 0
+    assert summary["best"]["hotel_id"] == b
+    assert summary["worst"]["hotel_id"] == a
+    # Low Inn carries its week-1 score into week 2.
+    assert summary["series"]["t"] == ["2024-01-01", "2024-01-08"]
+    assert summary["series"]["score"] == [8.0, 8.75]
+    assert summary["series"]["hotels"] == [1, 2]
+
+    with count_queries() as queries:
+        assert client.get(url, headers=headers).json() == summary
+    assert len(queries) <= 3  # user, group, cache key
+
+    _add_snapshot(a, datetime(2024, 1, 15, 9), google_score=5.0, google_count=100)
+    assert client.get(url, headers=headers).json()["score"] == 9.25
+
+    # Renames and rescores keep snapshot ids but move the hotels counter, even
+    # from another process such as the CLI, so the summary is rebuilt.
+    items = [{"id": a, "name": "Top Inn"}]
+    client.post("/api/hotels/bulk", json=items, headers=headers)
+    assert client.get(url, headers=headers).json()["best"]["name"] == "Top Inn"
+    db = TestSession()
+    db.query(ReviewSnapshot).filter(ReviewSnapshot.hotel_id == b).update(
+        {"booking_count": 100}
+    )
+    db.commit()
+    db.close()
+    with patch("app.database.SessionLocal", TestSession):
+        _rescore(argparse.Namespace(chunk_size=1000))
+    assert client.get(url, headers=headers).json()["review_count"] == 200
+
+    client.put(f"/api/groups/{group_id}", json={"hotel_ids": [a]}, headers=headers)
+    summary = client.get(url, headers=headers).json()
+    assert summary["hotel_count"] == 1
+    assert summary["best"] == summary["worst"]
+
+
+def test_ranks_and_leaderboard(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
+    hotels = {}
+    for name, state, brand, google in [
+        ("Austin A", "TX", "Kasa", 4.8),
+        ("Austin B", "TX", "Other", 4.2),
+        ("Dallas C", "TX", "Kasa", 3.6),
+        ("LA D", "CA", "Kasa", 4.5),
+    ]:
+        hotel_id = client.post(
+            "/api/hotels", json={"name": name, "state": state}, headers=headers
+        ).json()["id"]
+        db = TestSession()
+        db.get(Hotel, hotel_id).brand = brand
+        db.commit()
+        db.close()
+        _add_snapshot(
+            hotel_id, datetime(2024, 5, 1), google_score=google, google_count=50
+        )
+        hotels[name] = hotel_id
+
+    detail = client.get(f"/api/hotels/{hotels['Austin B']}", headers=headers).json()
+    ranks = detail["ranks"]["weighted_average"]
+    assert ranks["all"] == {
+        "scope_value": None,
+        "rank": 3,
+        "percentile": 33.3,
+        "total": 4,
+    }
+    assert ranks["state"]["scope_value"] == "TX"
+    assert ranks["state"]["rank"] == 2
+    assert ranks["brand"]["total"] == 1
+
+    resp = client.get(
+        "/api/leaderboard", params={"scope": "state", "n": 1}, headers=headers
+    )
+    boards = {b["scope_value"]: b for b in resp.json()["boards"]}
+    assert boards["TX"]["top"][0]["name"] == "Austin A"
+    assert boards["TX"]["bottom"][0]["name"] == "Dallas C"
+    assert boards["CA"]["top"] == boards["CA"]["bottom"]
+
+    with count_queries() as queries:
+        resp = client.get(
+            "/api/leaderboard",
+            params={"scope": "brand", "value": "Kasa", "n": 2},
+            headers=headers,
+        )
+    assert not any(q.lstrip().upper().startswith("INSERT") for q in queries)
+    (kasa,) = resp.json()["boards"]
+    assert [h["name"] for h in kasa["top"]] == ["Austin A", "LA D"]
+    assert [h["name"] for h in kasa["bottom"]] == ["Dallas C", "LA D"]
+
+    # A new snapshot moves the data version on and triggers a rebuild.
+    _add_snapshot(
+        hotels["Dallas C"], datetime(2024, 6, 1), google_score=5.0, google_count=50
+    )
+    resp = client.get("/api/leaderboard", params={"n": 1}, headers=headers)
+    assert resp.json()["boards"][0]["top"][0]["name"] == "Dallas C"
+
+    # So does replacing a hotel, which keeps the snapshot id and hotel count.
+    client.delete(f"/api/hotels/{hotels['Austin B']}?confirm=true", headers=headers)
+    client.post("/api/hotels", json={"name": "Houston E"}, headers=headers)
+    detail = client.get(f"/api/hotels/{hotels['LA D']}", headers=headers).json()
+    assert detail["ranks"]["weighted_average"]["all"]["total"] == 3
+
+    resp = client.get("/api/leaderboard", params={"metric": "vibes"}, headers=headers)
+    assert resp.status_code == 400
+
+
+def test_empty_rankings_are_not_rebuilt_on_every_read(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post("/api/hotels", json={"name": "Unscored Inn"}, headers=headers)
+    resp = client.get("/api/leaderboard", headers=headers)
+    assert resp.json()["boards"] == []
+    with count_queries() as queries:
+        client.get("/api/leaderboard", headers=headers)
+    writes = ("INSERT", "DELETE")
+    assert not any(q.lstrip().upper().startswith(writes) for q in queries)
+
+
+def test_detect_anomalies_and_list_alerts(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Falling Inn"}, headers=headers
+    ).json()["id"]
+    today = datetime.now()
+    _add_snapshot(
+        hotel_id, today - timedelta(days=40), google_score=4.8, google_count=9
+    )
+    _add_snapshot(hotel_id, today, google_score=4.0, google_count=12)
+    db = TestSession()
+    rebuild_rollups(db)
+    db.close()
+
+    resp = client.post("/api/admin/detect-anomalies", headers=headers)
+    assert resp.status_code == 403
+    _promote_to_admin("test@example.com")
+    resp = client.post("/api/admin/detect-anomalies", headers=headers)
+    assert resp.json() == {"alerts": 2}  # google and weighted average
+
+    alerts = client.get("/api/alerts", params={"kind": "drop"}, headers=headers).json()
+    assert {a["metric"] for a in alerts} == {"google", "weighted_average"}
+    assert alerts[0]["hotel_name"] == "Falling Inn"
+    assert alerts[0]["score"] == -1.6
+    assert (
+        client.get("/api/alerts", params={"kind": "zscore"}, headers=headers).json()
+        == []
+    )
+
+    db = TestSession()
+    for score in (2.5, -4.0, 3.1):
+        db.add(
+            Alert(
+                hotel_id=hotel_id,
+                kind="zscore",
+                metric="google",
+                value=0,
+                baseline=0,
+                score=score,
+            )
+        )
+    db.commit()
+    db.close()
+    alerts = client.get("/api/alerts", params={"kind": "zscore"}, headers=headers)
+    assert [a["score"] for a in alerts.json()] == [-4.0, 3.1, 2.5]
+
+
+def test_anomalies_cover_hotels_only_confirmed_lately(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Steady Inn"}, headers=headers
+    ).json()["id"]
+    # Collected 45 days ago and confirmed unchanged today: its only rollup day
+    # is outside the window, but Booking still diverges from the others.
+    now = datetime.now()
+    _add_snapshot(
+        hotel_id,
+        now - timedelta(days=45),
+        confirmed_at=now,
+        google_score=4.0,
+        booking_score=4.0,
+        tripadvisor_score=4.0,
+    )
+    db = TestSession()
+    rebuild_rollups(db)
+    db.close()
+
+    resp = client.post("/api/admin/detect-anomalies", headers=headers)
+    assert resp.json() == {"alerts": 1}
+    (alert,) = client.get("/api/alerts", headers=headers).json()
+    assert (alert["kind"], alert["metric"], alert["score"]) == (
+        "divergence",
+        "booking",
+        -4.0,
+    )
+
+    url = "/api/admin/detect-anomalies?divergence_threshold=5"
+    assert client.post(url, headers=headers).json() == {"alerts": 0}
+    url = "/api/admin/detect-anomalies?divergence_threshold=0"
+    assert client.post(url, headers=headers).status_code == 422
+
+
+def test_portfolio_diff_json_and_csv(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    up, new, old = (
+        client.post("/api/hotels", json={"name": name}, headers=headers).json()["id"]
+        for name in ("Up Inn", "New Inn", "Old Inn")
+    )
+    client.post("/api/hotels", json={"name": "Empty Inn"}, headers=headers)
+    _add_snapshot(up, datetime(2024, 4, 20), google_score=4.0, google_count=10)
+    _add_snapshot(up, datetime(2024, 5, 20), google_score=4.5, google_count=12)
+    _add_snapshot(up, datetime(2024, 6, 20), google_score=3.0, google_count=20)
+    _add_snapshot(new, datetime(2024, 5, 10), booking_score=8.0, booking_count=5)
+    _add_snapshot(old, datetime(2024, 3, 1), expedia_score=6.0, expedia_count=5)
+    params = {"from": "2024-05-01T00:00:00Z", "to": "2024-06-01T00:00:00Z"}
+
+    resp = client.get("/api/hotels/diff", params=params, headers=headers)
+    assert resp.status_code == 200
+    rows = {r["name"]: r for r in resp.json()}
+    assert set(rows) == {"Up Inn", "New Inn", "Old Inn"}
+    assert rows["Up Inn"]["weighted_average"] == {
+        "from": 8.0,
+        "to": 9.0,
+        "change": 1.0,
+    }
+    assert rows["New Inn"]["from_snapshot_id"] is None
+    assert rows["New Inn"]["booking_normalized"]["change"] is None
+    assert rows["Old Inn"]["expedia_normalized"]["change"] == 0.0
+
+    resp = client.get(
+        "/api/hotels/diff", params={**params, "format": "csv"}, headers=headers
+    )
+    lines = resp.text.splitlines()
+    assert "attachment" in resp.headers["content-disposition"]
+    assert lines[0].startswith("Hotel ID,Name,City,State,From Snapshot,To Snapshot")
+    assert "Weighted Average Change" in lines[0]
+    assert len(lines) == 4
+
+    group_id = client.post(
+        "/api/groups", json={"name": "Diff", "hotel_ids": [up]}, headers=headers
+    ).json()["id"]
+    resp = client.get(f"/api/groups/{group_id}/diff", params=params, headers=headers)
+    assert [r["name"] for r in resp.json()] == ["Up Inn"]
+
+    resp = client.get(
+        "/api/hotels/diff",
+        params={"from": params["to"], "to": params["from"]},
+        headers=headers,
+    )
+    assert resp.status_code == 400
+
+
+def test_export_streams_in_batches_with_constant_queries(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for i in range(7):
+        hotel_id = client.post(
+            "/api/hotels", json={"name": f"Export Inn {i}"}, headers=headers
+        ).json()["id"]
+        if i % 2:
+            _add_snapshot(hotel_id, datetime(2024, 1, 1), google_score=4.0)
+            _add_snapshot(hotel_id, datetime(2024, 2, 1), google_score=4.5)
+
+    with patch("app.services.hotel_export.EXPORT_BATCH", 2), count_queries() as queries:
+        with client.stream("GET", "/api/export/hotels", headers=headers) as resp:
+            chunks = list(resp.iter_bytes())
+    lines = b"".join(chunks).decode().splitlines()
+    assert len(lines) == 8
+    assert lines[2].startswith("Export Inn 1,")
+    assert ",4.5,,9.0," in lines[2]
+    assert lines[1].endswith(",,,,,,,,,,,,,")
+    assert len(queries) <= 3  # user, data version, one streaming export query
+
+    with patch("app.services.hotel_export.EXPORT_BATCH", 2):
+        chunks = list(csv_chunks(TestSession(), []))
+    assert len(chunks) == 5  # header, then one per batch of two hotels
+
+
+def test_strategy_export_caches_scores_on_a_file_database(tmp_path):
+    # SQLite can't commit the score cache while the export's cursor is open,
+    # so scores must be computed before streaming starts, not per batch.
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'export.db'}", connect_args={"timeout": 0.1}
+    )
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all(Hotel(id=i, name=f"File Inn {i}") for i in range(1, 6))
+        db.flush()
+        for i in range(1, 6):
+            snap = ReviewSnapshot(
+                hotel_id=i, source="test", google_score=4.0, google_count=10
+            )
+            compute_scores(snap)
+            db.add(snap)
+        db.commit()
+    with patch("app.services.hotel_export.EXPORT_BATCH", 2):
+        chunks = list(csv_chunks(Session(engine), [], STRATEGIES["bayesian"]))
+    lines = b"".join(chunks).decode().splitlines()
+    assert len(chunks) == 4 and len(lines) == 6
+    assert all(not line.endswith(",") for line in lines[1:])
+    with Session(engine) as db:
+        assert db.query(StrategyScore).count() == 5
+    engine.dispose()
+
+
+def test_export_cache_etag_and_background_refresh(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _promote_to_admin("test@example.com")
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Cached Inn"}, headers=headers
+    ).json()["id"]
+    _add_snapshot(hotel_id, datetime(2024, 1, 1), google_score=4.0)
+
+    first = client.get("/api/export/hotels", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert len(os.listdir(hotel_export.CACHE_DIR)) == 1
+
+    with count_queries() as queries:
+        second = client.get("/api/export/hotels", headers=headers)
+    assert second.content == first.content
+    assert second.headers["etag"] == etag
+    assert int(second.headers["content-length"]) == len(first.content)
+    assert len(queries) == 2  # user + data version; the body comes from disk
+
+    resp = client.get("/api/export/hotels", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+    with patch(
+        "app.services.collectors.google.collect_google_reviews",
+        return_value=(4.5, 200),
+    ):
+        client.post(f"/api/reviews/hotels/{hotel_id}/collect", headers=headers)
+
+    # The collect request's background task already rebuilt the export.
+    cached = os.listdir(hotel_export.CACHE_DIR)
+    assert len(cached) == 1
+    resp = client.get("/api/export/hotels", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert "content-length" in resp.headers
+    assert ",4.5,200,9.0," in resp.text
+
+    # Deleting a hotel and creating another leaves the newest snapshot id and
+    # the hotel count where they were; the export must still move on.
+    etag = resp.headers["etag"]
+    gone = client.post("/api/hotels", json={"name": "Gone Inn"}, headers=headers)
+    assert "Gone Inn" in client.get("/api/export/hotels", headers=headers).text
+    client.delete(f"/api/hotels/{gone.json()['id']}?confirm=true", headers=headers)
+    client.post("/api/hotels", json={"name": "New Inn"}, headers=headers)
+    resp = client.get("/api/export/hotels", headers=headers)
+    assert "New Inn" in resp.text and "Gone Inn" not in resp.text
+    assert resp.headers["etag"] != etag
+
+
+# 20:00-23:00 at -05:00 is 01:00-04:00 UTC on January 1st.
+OFFSET_WINDOW = {
+    "from": "2024-12-31T20:00:00-05:00",
+    "to": "2024-12-31T23:00:00-05:00",
+}
+
+
+def _offset_hotel(client, headers) -> int:
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Offset Inn"}, headers=headers
+    ).json()["id"]
+    _add_snapshot(hotel_id, datetime(2025, 1, 1, 3), google_score=4.0)
+    return hotel_id
+
+
+def test_history_export_resolves_utc_offsets(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _offset_hotel(client, headers)
+
+    resp = client.get("/api/export/history", params=OFFSET_WINDOW, headers=headers)
+    assert len(resp.text.splitlines()) == 2
+    resp = client.get("/api/hotels/diff", params=OFFSET_WINDOW, headers=headers)
+    assert resp.json()[0]["weighted_average"]["to"] is not None
+
+    with patch("app.services.export_jobs.submit"):
+        job = client.post(
+            "/api/export/jobs",
+            json={"kind": "history", **OFFSET_WINDOW},
+            headers=headers,
+        ).json()
+    db = TestSession()
+    export_jobs.run_job(db, job["id"])
+    db.close()
+    resp = client.get(f"/api/export/jobs/{job['id']}/download", headers=headers)
+    assert len(resp.text.splitlines()) == 2
+
+
+def test_history_series_resolves_utc_offsets(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = _offset_hotel(client, headers)
+    db = TestSession()
+    rebuild_rollups(db)
+    db.close()
+
+    for bucket in (None, "day"):
+        params = {**OFFSET_WINDOW, **({"bucket": bucket} if bucket else {})}
+        resp = client.get(
+            f"/api/hotels/{hotel_id}/history/series", params=params, headers=headers
+        )
+        assert len(resp.json()["t"]) == 1, bucket
+
+
+def test_history_export_formats(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "History Inn"}, headers=headers
+    ).json()["id"]
+    _seed_daily_history(hotel_id, 12)
+    params = {"from": "2024-01-03", "to": "2024-01-10"}
+
+    def fetch(fmt, path="/api/export/history"):
+        resp = client.get(path, params={**params, "format": fmt}, headers=headers)
+        assert resp.status_code == 200
+        return resp
+
+    csv_lines = fetch("csv").text.splitlines()
+    assert csv_lines[0].startswith("snapshot_id,hotel_id,hotel_name,collected_at")
+    assert len(csv_lines) == 8
+    assert csv_lines[1].split(",")[3] == "2024-01-03T12:00:00"
+
+    gz = fetch("csv.gz")
+    assert gz.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(gz.content).decode().splitlines() == csv_lines
+
+    records = [json.loads(line) for line in fetch("ndjson").text.splitlines()]
+    assert len(records) == 7
+    assert records[0]["hotel_name"] == "History Inn"
+    assert records[0]["google_normalized"] == 8.0
+
+    with patch("app.services.history_export.BATCH_ROWS", 3):
+        table = pq.read_table(io.BytesIO(fetch("parquet").content))
+        assert pq.ParquetFile(io.BytesIO(fetch("parquet").content)).num_row_groups == 3
+    assert table.num_rows == 7
+    assert table.column("weighted_average").to_pylist()[0] == 8.0
+
+    arrow = pa.ipc.open_stream(fetch("arrow").content).read_all()
+    assert arrow.equals(table)
+
+    group_id = client.post(
+        "/api/groups", json={"name": "H", "hotel_ids": [hotel_id]}, headers=headers
+    ).json()["id"]
+    rows = fetch("csv", f"/api/export/groups/{group_id}/history").text.splitlines()
+    assert rows == csv_lines
+
+
+def test_export_job_lifecycle(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Job Inn"}, headers=headers
+    ).json()["id"]
+    for day in range(1, 4):
+        _add_snapshot(hotel_id, datetime(2024, 1, day), google_score=4.0)
+
+    with patch("app.services.export_jobs.submit"):
+        resp = client.post("/api/export/jobs", json={}, headers=headers)
+    assert resp.status_code == 202
+    queued = resp.json()
+    assert queued["status"] == "queued"
+    resp = client.get(f"/api/export/jobs/{queued['id']}/download", headers=headers)
+    assert resp.status_code == 409
+
+    def run_now(job_id):
+        export_jobs.run_job(TestSession(), job_id)
+
+    with patch("app.services.export_jobs.submit", run_now):
+        resp = client.post(
+            "/api/export/jobs",
+            json={"format": "parquet", "from": "2024-01-02T00:00:00"},
+            headers=headers,
+        )
+    job = client.get(f"/api/export/jobs/{resp.json()['id']}", headers=headers).json()
+    assert job["status"] == "done"
+    assert job["size"] > 0
+
+    url = f"/api/export/jobs/{job['id']}/download"
+    resp = client.get(url, headers=headers)
+    assert resp.status_code == 200
+    assert len(resp.content) == job["size"]
+    assert pq.read_table(io.BytesIO(resp.content)).num_rows == 2
+    resp = client.get(url, headers={**headers, "Range": "bytes=0-3"})
+    assert resp.status_code == 206
+    assert resp.content == b"PAR1"
+
+    listed = client.get("/api/export/jobs", headers=headers).json()
+    assert [j["id"] for j in listed] == [job["id"], queued["id"]]
+
+    other = client.post(
+        "/api/auth/register",
+        json={"email": "jobs-other@example.com", "password": "testpass123"},
+    ).json()["access_token"]
+    resp = client.get(url, headers={"Authorization": f"Bearer {other}"})
+    assert resp.status_code == 404
+
+    resp = client.post(
+        "/api/export/jobs", json={"kind": "hotels", "format": "ndjson"}, headers=headers
+    )
+    assert resp.status_code == 400
+
+
+def test_export_jobs_expire_by_age_whatever_their_status(client, auth_token):
+    now = datetime.now(timezone.utc)
+    db = TestSession()
+    user = db.scalars(select(User)).one()
+    jobs = {
+        name: ExportJob(
+            user_id=user.id,
+            kind="history",
+            format="csv",
+            status=status,
+            created_at=now - age,
+        )
+        for name, status, age in [
+            ("fresh", "running", timedelta(minutes=5)),
+            ("stuck", "queued", timedelta(hours=2)),
+            ("dead", "running", timedelta(hours=25)),
+            ("old", "done", timedelta(hours=25)),
+        ]
+    }
+    db.add_all(jobs.values())
+    db.commit()
+    ids = {name: job.id for name, job in jobs.items()}
+
+    assert export_jobs.expire_jobs(db) == 2
+    db.expire_all()
+    assert db.get(ExportJob, ids["fresh"]).status == "running"
+    stuck = db.get(ExportJob, ids["stuck"])
+    assert (stuck.status, stuck.error) == ("failed", "Export worker did not finish")
+    assert db.get(ExportJob, ids["dead"]) is None
+    assert db.get(ExportJob, ids["old"]) is None
+    db.close()
+
+
+def test_timed_out_export_job_does_not_publish(client, auth_token):
+    db = TestSession()
+    user = db.scalars(select(User)).one()
+    job = ExportJob(user_id=user.id, kind="history", format="csv")
+    db.add(job)
+    db.commit()
+    job_id = job.id
+
+    def slow_export(session, job):
+        # The worker is still alive when the job is given up on.
+        with TestSession() as other:
+            other.get(ExportJob, job_id).created_at -= timedelta(hours=2)
+            other.commit()
+            export_jobs.expire_jobs(other)
+        yield b"too late\n"
+
+    with patch("app.services.export_jobs._chunks", slow_export):
+        export_jobs.run_job(db, job_id)
+    db.expire_all()
+    job = db.get(ExportJob, job_id)
+    assert (job.status, job.error) == ("failed", "Export worker did not finish")
+    assert not os.path.exists(export_jobs.job_path(job))
+    assert not os.path.exists(export_jobs.job_path(job) + ".part")
+    db.close()
+
+
+def test_export_job_runs_in_a_worker_process(tmp_path, monkeypatch):
+    # The spawned worker opens its own engine from DATABASE_URL, so this job
+    # lives in a file database rather than the in-memory test one.
+    url = f"sqlite:///{tmp_path / 'jobs.db'}"
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.setenv("EXPORT_JOBS_DIR", export_jobs.JOBS_DIR)
+    monkeypatch.setattr(export_jobs, "_pool", None)
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add(User(id=1, email="worker@example.com", hashed_password="x"))
+        db.add(Hotel(id=1, name="Worker Inn"))
+        db.add(ReviewSnapshot(hotel_id=1, source="live", google_score=4.0))
+        db.flush()
+        job = ExportJob(user_id=1, kind="history", format="csv")
+        db.add(job)
+        db.commit()
+
+        export_jobs.submit(job.id)
+        export_jobs._pool.shutdown(wait=True)
+        db.refresh(job)
+        assert (job.status, job.error) == ("done", None)
+        with open(export_jobs.job_path(job)) as f:
+            lines = f.read().splitlines()
+    assert len(lines) == 2 and ",Worker Inn," in lines[1]
+
+
+def test_ingest_snapshots_ndjson(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    harbor = client.post(
+        "/api/hotels", json={"name": "Harbor Inn"}, headers=headers
+    ).json()["id"]
+    client.post("/api/hotels", json={"name": "Ridge Lodge"}, headers=headers)
+
+    lines = [
+        {"hotel_id": harbor, "collected_at": "2024-03-01T10:00:00Z",
+         "google_score": 4.5, "google_count": 200, "booking_score": 8.0},
+        {"hotel": "Ridge Lodge", "collected_at": "2024-03-01T12:00:00+02:00",
+         "tripadvisor_score": 4.0, "tripadvisor_count": 50},
+        {"hotel": "Nowhere", "collected_at": "2024-03-01", "google_score": 4.0},
+        {"hotel_id": harbor, "collected_at": "2024-03-02"},
+        {"hotel_id": harbor, "collected_at": "2024-03-02", "google_score": 7.5},
+        {"hotel_id": harbor, "collected_at": "2024-03-01T10:00:00",
+         "google_score": 4.5},
+        {"hotel_id": harbor, "collected_at": "2024-03-03T09:00:00",
+         "expedia_score": 9.1, "expedia_count": 10},
+    ]  # fmt: skip
+    body = "\n".join(json.dumps(line) for line in lines[:3])
+    body += "\nnot json\n\n" + "\n".join(json.dumps(line) for line in lines[3:])
+    body += "\n" + "x" * 300  # oversized final line without a newline
+
+    ndjson = {**headers, "Content-Type": "application/x-ndjson"}
+    with (
+        patch("app.routers.snapshots.INGEST_BATCH", 2),
+        patch("app.routers.snapshots.MAX_LINE_BYTES", 200),
+    ):
+        resp = client.post("/api/snapshots/ingest", content=body, headers=ndjson)
+    assert resp.status_code == 200
+    result = resp.json()
+    assert {k: result[k] for k in ("lines", "inserted", "skipped", "rejected")} == {
+        "lines": 10,
+        "inserted": 3,
+        "skipped": 1,
+        "rejected": 5,
+    }
+    errors = {e["line"]: e["error"] for e in result["errors"]}
+    assert errors[3] == "Hotel not found"
+    assert errors[4].startswith("Invalid JSON")
+    assert "at least one channel score" in errors[6]
+    assert errors[7].startswith("google_score:")
+    assert "exceeds" in errors[10]
+
+    history = client.get(f"/api/hotels/{harbor}/history", headers=headers).json()
+    assert [s["collected_at"] for s in history] == [
+        "2024-03-03T09:00:00",
+        "2024-03-01T10:00:00",
+    ]
+    expected = ReviewSnapshot(google_score=4.5, google_count=200, booking_score=8.0)
+    compute_scores(expected)
+    first = history[1]
+    assert first["source"] == "ingest"
+    assert first["google_normalized"] == 9.0
+    assert first["weighted_average"] == expected.weighted_average
+
+    db = TestSession()
+    rollup_days = db.scalars(
+        select(SnapshotDailyRollup.day).where(SnapshotDailyRollup.hotel_id == harbor)
+    ).all()
+    ridge = db.scalars(
+        select(ReviewSnapshot.collected_at).where(ReviewSnapshot.hotel_id != harbor)
+    ).one()
+    db.close()
+    assert sorted(str(d) for d in rollup_days) == ["2024-03-01", "2024-03-03"]
+    assert ridge == datetime(2024, 3, 1, 10, 0)  # stored as naive UTC
+
+    resp = client.post(
+        "/api/snapshots/ingest",
+        content="\n".join(json.dumps(line) for line in lines[:2]),
+        headers=ndjson,
+    )
+    assert (resp.json()["inserted"], resp.json()["skipped"]) == (0, 2)
+
+    # A line over the limit is rejected even when it arrives whole in one chunk.
+    padded = json.dumps(
+        {"hotel_id": harbor, "collected_at": "2024-04-01", "google_score": 4.0}
+    ).replace(",", "," + " " * 100)
+    with patch("app.routers.snapshots.MAX_LINE_BYTES", 200):
+        resp = client.post(
+            "/api/snapshots/ingest", content=padded + "\n", headers=ndjson
+        )
+    assert resp.json()["rejected"] == 1
+    assert "exceeds" in resp.json()["errors"][0]["error"]
+
+
+def test_backdated_ingest_drops_later_recency_scores(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_id = client.post(
+        "/api/hotels", json={"name": "Backfill Inn"}, headers=headers
+    ).json()["id"]
+    _add_snapshot(hotel_id, datetime(2024, 1, 1), google_score=4.0)
+    _add_snapshot(hotel_id, datetime(2024, 3, 1), google_score=4.0)
+    url = f"/api/hotels/{hotel_id}?strategy=recency"
+    assert client.get(url, headers=headers).json()["strategy_score"] == 8.0
+
+    line = {"hotel_id": hotel_id, "collected_at": "2024-02-20", "google_score": 2.0}
+    resp = client.post(
+        "/api/snapshots/ingest",
+        content=json.dumps(line),
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert resp.json()["inserted"] == 1
+    assert client.get(url, headers=headers).json()["strategy_score"] < 8.0
+
+
+def test_snapshot_changes_feed(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    hotel_ids = [
+        client.post(
+            "/api/hotels", json={"name": f"Feed Inn {i}"}, headers=headers
+        ).json()["id"]
+        for i in range(3)
+    ]
+    for day in range(1, 3):
+        for hotel_id in hotel_ids:
+            _add_snapshot(hotel_id, datetime(2024, 1, day), google_score=4.0)
+
+    seen, cursor = [], 0
+    no_lag = patch("app.services.snapshots.CHANGES_LAG", timedelta(0))
+    with no_lag, count_queries() as queries:
+        while True:
+            page = client.get(
+                f"/api/snapshots/changes?since={cursor}&limit=4", headers=headers
+            ).json()
+            seen += [s["id"] for s in page["snapshots"]]
+            cursor = page["next_cursor"]
+            if not page["has_more"]:
+                break
+    assert len(seen) == 6 and seen == sorted(seen)
+    assert cursor == seen[-1]
+    assert len(queries) == 4  # user and one range scan per page
+
+    empty = client.get(f"/api/snapshots/changes?since={cursor}", headers=headers)
+    assert empty.json() == {"snapshots": [], "next_cursor": cursor, "has_more": False}
+
+    _add_snapshot(hotel_ids[1], datetime(2023, 6, 1), booking_score=8.0)
+    with no_lag:
+        page = client.get(
+            f"/api/snapshots/changes?since={cursor}", headers=headers
+        ).json()
+    assert [(s["hotel_id"], s["collected_at"]) for s in page["snapshots"]] == [
+        (hotel_ids[1], "2023-06-01T00:00:00")
+    ]
+    assert page["snapshots"][0]["booking_normalized"] == 8.0
+    cursor = page["next_cursor"]
+
+    # A fresh row holds back the page at its id, even ahead of older-looking
+    # rows with higher ids, until it is CHANGES_LAG old.
+    _add_snapshot(hotel_ids[0], datetime(2024, 2, 1), google_score=3.0)
+    _add_snapshot(hotel_ids[2], datetime(2024, 2, 1), google_score=3.0)
+    db = TestSession()
+    fresh, settled = db.scalars(
+        select(ReviewSnapshot).where(ReviewSnapshot.id > cursor)
+    ).all()
+    settled.inserted_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.commit()
+    url = f"/api/snapshots/changes?since={cursor}"
+    assert client.get(url, headers=headers).json() == {
+        "snapshots": [],
+        "next_cursor": cursor,
+        "has_more": False,
+    }
+    fresh.inserted_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.commit()
+    db.close()
+    page = client.get(url, headers=headers).json()
+    assert [s["hotel_id"] for s in page["snapshots"]] == [hotel_ids[0], hotel_ids[2]]
+
+    resp = client.get("/api/snapshots/changes?since=abc", headers=headers)
+    assert resp.status_code == 422
@@ -1,8 +1,20 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+from dataclasses import asdict
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
+from app.services.collection import collect_hotel
+from app.services.collectors import all_collectors, get_collector
+from app.services.collectors.base import settings_from_env
 from app.services.collectors.booking import collect_booking_reviews
 from app.services.collectors.expedia import collect_expedia_reviews
+from app.services.collectors.google import collect_google_reviews
+from app.services.collectors.matching import MAX_CANDIDATES, NameMatcher
+from app.services.collectors.registry import lease_executor, update_settings
 
 
 def _make_hotel(**kwargs):
@@ -245,7 +257,7 @@ class TestExpediaCollector:
             collect_expedia_reviews(hotel)
         call_args = mock_client.actor.return_value.call.call_args
         assert call_args.kwargs["run_input"]["location"] == ["Portland, OR"]
-        assert call_args.kwargs["run_input"]["limit"] == 5
+        assert call_args.kwargs["run_input"]["limit"] == MAX_CANDIDATES
 
     def test_name_matching_picks_correct_hotel(self):
         hotel = _make_hotel(name="Sea Crest Beach Resort")
@@ -270,3 +282,167 @@ class TestExpediaCollector:
             score, count = collect_expedia_reviews(hotel)
         assert score == 7.5
         assert count == 251
+
+
+# ---- Name matcher ----
+
+
+class TestNameMatcher:
+    def test_exact_name_scores_one(self):
+        assert (
+            NameMatcher("Sea Crest Beach Hotel").score("Sea Crest Beach Hotel") == 1.0
+        )
+
+    def test_generic_word_variation_still_matches(self):
+        matcher = NameMatcher("Sea Crest Beach Hotel")
+        assert matcher.score("Sea Crest Beach Resort") >= matcher.threshold
+        assert matcher.score("SeaCrest Beach Hotel") >= matcher.threshold
+
+    def test_unrelated_names_rejected(self):
+        matcher = NameMatcher("Sea Crest Beach Hotel")
+        assert matcher.best_match([{"name": "Ocean Mist Beach Hotel"}]) is None
+        assert matcher.best_match([{"name": "Backyard Chilling Cape Cod Home"}]) is None
+
+    def test_ranks_best_candidate_first(self):
+        matcher = NameMatcher("The Niche Hotel")
+        items = [
+            {"name": "Niche Apartments Downtown"},
+            {"name": "The Niche"},
+            {"name": "Hotel Zelos"},
+        ]
+        assert matcher.best_match(items)["name"] == "The Niche"
+
+    def test_city_breaks_ties(self):
+        matcher = NameMatcher("Harbor View Inn", city="Portland")
+        items = [
+            {"name": "Harbor View Inn", "address": {"full": "Seattle, Washington"}},
+            {"name": "Harbor View Inn", "address": {"full": "Portland, Oregon"}},
+        ]
+        assert matcher.best_match(items)["address"]["full"] == "Portland, Oregon"
+
+    def test_expedia_resolves_beyond_first_two_words(self):
+        """A leading-word difference used to miss and force a manual re-run."""
+        hotel = _make_hotel(name="Kasa Lakeside Lofts")
+        mock_client = MagicMock()
+        mock_client.actor.return_value.call.return_value = {"defaultDatasetId": "ds1"}
+        mock_client.dataset.return_value.iterate_items.return_value = [
+            {"name": "Lakeside Motor Lodge", "reviews": {"label": "Good", "total": 9}},
+            {"name": "Lakeside Lofts", "reviews": {"label": "Wonderful", "total": 88}},
+        ]
+        with (
+            patch("app.services.collectors.expedia.APIFY_TOKEN", "tok"),
+            patch(
+                "app.services.collectors.expedia.ApifyClient", return_value=mock_client
+            ),
+        ):
+            score, count = collect_expedia_reviews(hotel)
+        assert (score, count) == (9.0, 88)
+
+
+# ---- Provider base URLs ----
+
+
+def test_google_uses_configured_base_url():
+    resp = MagicMock()
+    resp.json.return_value = {"knowledge_graph": {"rating": 4.2, "reviews": 10}}
+    with (
+        patch("app.services.collectors.google.SERPAPI_KEY", "key"),
+        patch("app.services.collectors.google.SERPAPI_BASE_URL", "http://fake/serpapi"),
+        patch("app.services.collectors.google.httpx.get", return_value=resp) as get,
+    ):
+        result = collect_google_reviews(_make_hotel())
+    assert result == (4.2, 10)
+    assert get.call_args.args[0] == "http://fake/serpapi/search.json"
+
+
+def test_apify_collectors_use_configured_api_url():
+    mock_client = MagicMock()
+    mock_client.actor.return_value.call.return_value = {"defaultDatasetId": "ds1"}
+    mock_client.dataset.return_value.iterate_items.return_value = []
+    with (
+        patch("app.services.collectors.booking.APIFY_TOKEN", "tok"),
+        patch("app.services.collectors.booking.APIFY_API_URL", "http://fake/apify"),
+        patch(
+            "app.services.collectors.booking.ApifyClient", return_value=mock_client
+        ) as client_cls,
+    ):
+        collect_booking_reviews(_make_hotel())
+    assert client_cls.call_args.kwargs["api_url"] == "http://fake/apify"
+
+
+def test_collection_benchmark_runs():
+    # A subprocess: the benchmark configures collectors through the
+    # environment before importing the app.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.bench_collect", "--hotels", "2", "--json"]
+        + ["--port", str(port), "--latency-ms", "0"],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr
+    summary = json.loads(proc.stdout.splitlines()[-1])
+    assert (summary["hotels"], summary["collected"]) == (2, 2)
+
+
+# ---- Collector registry ----
+
+
+class TestRegistry:
+    def test_all_channels_registered(self):
+        channels = {c.channel for c in all_collectors()}
+        assert channels == {"google", "booking", "expedia", "tripadvisor"}
+
+    def test_env_overrides_settings(self, monkeypatch):
+        monkeypatch.setenv("COLLECTOR_BOOKING_ENABLED", "false")
+        monkeypatch.setenv("COLLECTOR_BOOKING_MAX_CONCURRENCY", "2")
+        settings = settings_from_env("booking", get_collector("booking").settings)
+        assert settings.enabled is False
+        assert settings.max_concurrency == 2
+
+    def test_disabled_channel_is_not_collected(self):
+        hotel = _make_hotel(id=1)
+        original = get_collector("expedia").settings
+        try:
+            update_settings("expedia", enabled=False)
+            with (
+                patch(
+                    "app.services.collectors.google.collect_google_reviews",
+                    return_value=(4.0, 10),
+                ),
+                patch(
+                    "app.services.collectors.expedia.collect_expedia_reviews"
+                ) as expedia,
+            ):
+                result = collect_hotel(hotel)
+        finally:
+            update_settings("expedia", **asdict(original))
+        expedia.assert_not_called()
+        assert "expedia" not in result.values
+        assert result.values["google"] == (4.0, 10)
+        assert result.to_snapshot().google_normalized == 8.0
+
+    def test_resized_pool_serves_its_holders_then_shuts_down(self):
+        original = get_collector("google").settings
+        try:
+            with lease_executor("google") as pool:
+                update_settings("google", max_concurrency=2)
+                assert pool.submit(lambda: 42).result() == 42
+                with lease_executor("google") as resized:
+                    assert resized is not pool
+                    assert resized._max_workers == 2
+            assert pool._shutdown
+        finally:
+            update_settings("google", **asdict(original))
+
+    def test_collector_crash_counts_as_failure(self):
+        with patch(
+            "app.services.collectors.google.collect_google_reviews",
+            side_effect=RuntimeError("boom"),
+        ):
+            result = collect_hotel(_make_hotel(id=1))
+        assert "google" in result.failed
@@ -1,5 +1,31 @@
-from app.models import ReviewSnapshot
-from app.services.scoring import compute_scores
+import random
+from datetime import date, datetime
+from unittest.mock import MagicMock
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models import Hotel, ReviewSnapshot, SnapshotDailyRollup, StrategyScore
+from app.services.anomalies import METRICS, find_anomalies
+from app.services.rollups import rebuild_rollups
+from app.services.scoring import (
+    CHANNELS,
+    compute_scores,
+    compute_scores_batch,
+    rescore_snapshots,
+)
+from app.services.snapshots import record_snapshots
+from app.services.strategies import (
+    CHANNEL_COUNT_CAP,
+    PRIOR_MEAN,
+    STRATEGIES,
+    Strategy,
+    strategy_scores,
+)
+from app.services.timeseries import lttb_indices
+from tests.conftest import TestSession
 
 
 def _make_snapshot(**kwargs):
@@ -93,3 +119,259 @@ def test_channels_with_none_score_excluded():
     compute_scores(snap)
     # Only Google: 8.0
     assert snap.weighted_average == 8.0
+
+
+# ---- Batch scoring ----
+
+
+def _random_snapshot(rng):
+    def maybe(value):
+        return None if rng.random() < 0.25 else value
+
+    return _make_snapshot(
+        google_score=maybe(rng.choice([1.0, 3.55, 4.005, 4.015, rng.uniform(1, 5)])),
+        google_count=maybe(rng.choice([0, 1, 7, rng.randint(0, 5000)])),
+        booking_score=maybe(rng.choice([7.3, 8.125, 9.995, rng.uniform(1, 10)])),
+        booking_count=maybe(rng.randint(0, 3000)),
+        expedia_score=maybe(rng.choice([7.8, 2.675, rng.uniform(1, 10)])),
+        expedia_count=maybe(rng.choice([0, rng.randint(0, 3000)])),
+        tripadvisor_score=maybe(rng.choice([3.55, 1.115, rng.uniform(1, 5)])),
+        tripadvisor_count=maybe(rng.randint(0, 3000)),
+    )
+
+
+def test_batch_matches_scalar_exactly():
+    rng = random.Random(42)
+    snaps = [_random_snapshot(rng) for _ in range(5000)]
+    snaps.append(_make_snapshot())  # all channels missing
+    result = compute_scores_batch(
+        {
+            ch: np.array([getattr(s, f"{ch}_score") for s in snaps], dtype=float)
+            for ch in CHANNELS
+        },
+        {
+            ch: np.array([getattr(s, f"{ch}_count") for s in snaps], dtype=float)
+            for ch in CHANNELS
+        },
+    )
+    for i, snap in enumerate(snaps):
+        compute_scores(snap)
+        for field in [f"{ch}_normalized" for ch in CHANNELS] + ["weighted_average"]:
+            batch_value = result[field][i]
+            expected = getattr(snap, field)
+            if expected is None:
+                assert np.isnan(batch_value), (i, field)
+            else:
+                assert batch_value == expected, (i, field, batch_value, expected)
+
+
+def test_rescore_snapshots_updates_derived_columns():
+    db = TestSession()
+    hotel = Hotel(name="Rescore Hotel")
+    db.add(hotel)
+    db.flush()
+    for i in range(7):
+        db.add(
+            ReviewSnapshot(
+                hotel_id=hotel.id,
+                source="test",
+                google_score=4.0,
+                google_count=100 + i,
+                booking_score=8.0,
+                weighted_average=0.0,  # stale value from an older formula
+            )
+        )
+    db.commit()
+
+    assert rescore_snapshots(db, chunk_size=3) == 7
+    rows = db.query(ReviewSnapshot).all()
+    assert all(r.google_normalized == 8.0 for r in rows)
+    assert all(r.weighted_average == 8.0 for r in rows)
+    db.close()
+
+
+# ---- Scoring strategies ----
+
+
+def _stored_snapshot(db, hotel, **kwargs):
+    snap = ReviewSnapshot(hotel_id=hotel.id, source="test", **kwargs)
+    compute_scores(snap)
+    db.add(snap)
+    db.flush()
+    return snap
+
+
+def test_bayesian_shrinks_small_samples_toward_prior():
+    db = TestSession()
+    hotel = Hotel(name="Tiny Hotel")
+    db.add(hotel)
+    db.flush()
+    few = _stored_snapshot(db, hotel, google_score=5.0, google_count=2)
+    many = _stored_snapshot(db, hotel, google_score=5.0, google_count=5000)
+    scores = strategy_scores(db, STRATEGIES["bayesian"], [few, many])
+    assert PRIOR_MEAN < scores[few.id] < scores[many.id] < 10.0
+    db.close()
+
+
+def test_capped_limits_dominant_channel():
+    db = TestSession()
+    hotel = Hotel(name="Lopsided Hotel")
+    db.add(hotel)
+    db.flush()
+    snap = _stored_snapshot(
+        db,
+        hotel,
+        google_score=5.0,
+        google_count=CHANNEL_COUNT_CAP,
+        booking_score=5.0,
+        booking_count=CHANNEL_COUNT_CAP * 9,
+    )
+    # Uncapped, Booking's 9x volume drags the average to 5.5; capped it's 7.5.
+    assert snap.weighted_average == 5.5
+    assert strategy_scores(db, STRATEGIES["capped"], [snap])[snap.id] == 7.5
+    db.close()
+
+
+def test_strategy_scores_are_cached_per_snapshot():
+    db = TestSession()
+    hotel = Hotel(name="Cached Hotel")
+    db.add(hotel)
+    db.flush()
+    snap = _stored_snapshot(db, hotel, google_score=4.0, google_count=10)
+    db.commit()
+    first = strategy_scores(db, STRATEGIES["recency"], [snap])
+    assert first[snap.id] == 8.0
+    assert db.query(StrategyScore).count() == 1
+    compute = MagicMock()
+    second = strategy_scores(db, Strategy("recency", "", compute), [snap])
+    compute.assert_not_called()
+    assert second == first
+    db.close()
+
+
+def test_strategy_scores_survive_a_locked_cache(tmp_path):
+    # SQLite locks the whole file while a cursor is open, so the cache write
+    # can't commit; the read must still return the scores.
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'locked.db'}", connect_args={"timeout": 0.1}
+    )
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all(Hotel(name=f"Locked {i}") for i in range(3))
+        db.flush()
+        for hotel in db.query(Hotel).all():
+            _stored_snapshot(db, hotel, google_score=4.0, google_count=10)
+        db.commit()
+        cursor = db.execute(select(ReviewSnapshot).execution_options(yield_per=1))
+        snap = next(cursor.scalars())
+        scores = strategy_scores(db, STRATEGIES["bayesian"], [snap])
+        assert scores[snap.id] is not None
+        cursor.close()
+        assert db.query(StrategyScore).count() == 0
+
+
+def test_lttb_keeps_endpoints_and_extremes():
+    x = np.arange(100, dtype=float)
+    y = np.zeros(100)
+    y[37] = 9.0
+    y[71] = -4.0
+    keep = lttb_indices(x, y, 12)
+    assert len(keep) == 12
+    assert keep[0] == 0 and keep[-1] == 99
+    assert list(keep) == sorted(set(keep))
+    assert 37 in keep and 71 in keep
+    assert list(lttb_indices(x[:5], y[:5], 12)) == [0, 1, 2, 3, 4]
+
+
+# ---- Daily rollups ----
+
+
+def _rollup_values(db):
+    return [
+        (
+            r.hotel_id,
+            r.day,
+            r.snapshot_count,
+            r.last_snapshot_id,
+            r.google_last,
+            r.google_min,
+            r.google_max,
+            r.weighted_average_last,
+        )
+        for r in db.query(SnapshotDailyRollup).order_by(
+            SnapshotDailyRollup.hotel_id, SnapshotDailyRollup.day
+        )
+    ]
+
+
+def test_rollups_track_inserts_and_match_rebuild():
+    db = TestSession()
+    hotel = Hotel(name="Rollup Hotel")
+    db.add(hotel)
+    db.flush()
+    times = [
+        datetime(2024, 3, 1, 9),
+        datetime(2024, 3, 1, 18),
+        datetime(2024, 3, 1, 12),  # arrives late, not the day's last
+        datetime(2024, 3, 2, 8),
+    ]
+    scores = [3.0, 4.5, 2.0, 4.0]
+    for at, score in zip(times, scores):
+        snap = ReviewSnapshot(
+            hotel_id=hotel.id,
+            source="csv_import",
+            collected_at=at,
+            google_score=score,
+            google_count=10,
+        )
+        compute_scores(snap)
+        record_snapshots(db, [snap])
+    db.commit()
+
+    incremental = _rollup_values(db)
+    first, second = db.query(SnapshotDailyRollup).order_by(SnapshotDailyRollup.day)
+    assert first.day == date(2024, 3, 1)
+    assert first.snapshot_count == 3
+    assert (first.google_min, first.google_max, first.google_last) == (4.0, 9.0, 9.0)
+    assert second.snapshot_count == 1
+
+    assert rebuild_rollups(db, hotels_per_batch=1) == 2
+    assert _rollup_values(db) == incremental
+    db.close()
+
+
+# ---- Anomaly detection ----
+
+
+def _history(hotel_id, start, rows):
+    """Rows of {metric: value} per consecutive day -> detector input arrays."""
+    days = np.arange(len(rows)) + np.datetime64(start, "D")
+    values = np.array(
+        [[row.get(m, np.nan) for m in METRICS] for row in rows], dtype=float
+    )
+    return np.full(len(rows), hotel_id), days, values
+
+
+def test_find_anomalies_flags_drops_zscores_and_divergence():
+    today = date(2024, 6, 30)
+    steady = [{"weighted_average": 8.0}] * 59 + [{"weighted_average": 6.5}]
+    noisy = [{"weighted_average": 8.0 + (i % 2)} for i in range(59)]
+    noisy.append({"weighted_average": 8.0})
+    split = [{"google": 9.0, "booking": 9.2, "expedia": 4.0, "weighted_average": 7.4}]
+    parts = [
+        _history(1, "2024-05-02", steady),
+        _history(2, "2024-05-02", noisy),
+        _history(3, "2024-06-30", split),
+    ]
+    hotel_ids, days, values = (np.concatenate(p) for p in zip(*parts))
+
+    found = find_anomalies(hotel_ids, days, values, today)
+    by_kind = {(a["kind"], a["hotel_id"], a["metric"]): a for a in found}
+    assert set(by_kind) == {
+        ("drop", 1, "weighted_average"),
+        ("zscore", 1, "weighted_average"),
+        ("divergence", 3, "expedia"),
+    }
+    assert by_kind[("drop", 1, "weighted_average")]["score"] == -1.5
+    assert by_kind[("zscore", 1, "weighted_average")]["score"] == -15.0
+    assert by_kind[("divergence", 3, "expedia")]["baseline"] == 9.0